@@ -16,12 +16,52 @@ class User(AbstractUser):
         verbose_name = "Utilisateur"
         verbose_name_plural = "Utilisateurs"
 
+class NotificationQuerySet(models.QuerySet):
+    def delete(self):
+        """Supprime les notifications et invalide les compteurs de non lues concernés."""
+        from .notifications import invalidate_unread_of
+        invalidate_unread_of(self)
+        return super().delete()
+
+
 class Notification(models.Model):
+    KIND_CHOICES = [
+        ('info', 'Information'),
+        ('task_assigned', 'Tâche assignée'),
+        ('task_status', 'Statut de tâche modifié'),
+        ('task_overdue', 'Tâche en retard'),
+    ]
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default='info', verbose_name="Type")
+    # Tâche concernée (événements de tâche)
+    task = models.ForeignKey(
+        'tasks.Task',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='notifications',
+        verbose_name="Tâche"
+    )
     message = models.TextField(verbose_name="Message")
     is_read = models.BooleanField(default=False, verbose_name="Lue")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Date de création")
 
+    objects = NotificationQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Boîte de réception et compteur de non lues d'un utilisateur
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_inbox_idx'),
+        ]
+
     def __str__(self):
         return f"Notification pour {self.user.username}"
 
+    def delete(self, *args, **kwargs):
+        if not self.is_read:
+            from .notifications import invalidate_unread
+            invalidate_unread(self.user_id)
+        return super().delete(*args, **kwargs)
+
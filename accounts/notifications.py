@@ -0,0 +1,122 @@
+"""
+Envoi des notifications et compteur de notifications non lues.
+
+`notify` crée les notifications de tous les destinataires en une insertion
+groupée (bulk_create), quel que soit leur nombre. Le nombre de non lues de
+chaque utilisateur est gardé en cache : calculé par une requête COUNT (index
+user, is_read, created_at) au premier accès, puis mis à jour par incréments
+après la validation de la transaction (nouvelles notifications, lecture).
+Un compteur absent ou évincé est simplement recalculé au prochain accès.
+
+Un incrément qui arrive entre le COUNT et la mise en cache du compteur est
+perdu (la clé n'existe pas encore) : le compteur est donc recompté juste
+après avoir été mis en cache, et supprimé si les deux valeurs diffèrent.
+Les compteurs expirent après NOTIFICATION_UNREAD_TIMEOUT secondes, ce qui
+borne tout écart restant. Les incréments supposent un cache partagé par tous
+les processus (Redis, Memcached) : avec un cache local, chaque worker garde
+son propre compteur.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from lon.cache import get_cache
+from .models import Notification
+
+UNREAD_KEY = 'notifications:unread:{}'
+DEFAULT_UNREAD_TIMEOUT = 3600
+
+
+def unread_count(user_id):
+    cache = get_cache()
+    key = UNREAD_KEY.format(user_id)
+    count = cache.get(key)
+    if count is None:
+        unread = Notification.objects.filter(user_id=user_id, is_read=False)
+        count = unread.count()
+        # add : un incrément concurrent déjà enregistré n'est pas écrasé
+        timeout = getattr(settings, 'NOTIFICATION_UNREAD_TIMEOUT', DEFAULT_UNREAD_TIMEOUT)
+        if cache.add(key, count, timeout=timeout):
+            # Les incréments validés entre le COUNT et add ont été perdus
+            recount = unread.count()
+            if recount != count:
+                cache.delete(key)
+                count = recount
+    return count
+
+
+def _adjust_unread(deltas):
+    """Applique {utilisateur: delta} aux compteurs en cache, après la validation."""
+    def apply():
+        cache = get_cache()
+        for user_id, delta in deltas.items():
+            if not delta:
+                continue
+            key = UNREAD_KEY.format(user_id)
+            try:
+                if cache.incr(key, delta) < 0:
+                    cache.delete(key)
+            except ValueError:
+                # Pas de compteur en cache : il sera calculé au prochain accès
+                pass
+    transaction.on_commit(apply)
+
+
+def notify(user_ids, message, kind='info', task=None, exclude=()):
+    """
+    Crée une notification pour chaque utilisateur de `user_ids` (sauf `exclude`)
+    en une insertion groupée ; retourne les notifications créées.
+    """
+    recipients = sorted(set(user_ids) - set(exclude) - {None})
+    return notify_many([(user_id, message, kind, task) for user_id in recipients])
+
+
+def notify_many(items):
+    """
+    Crée les notifications (utilisateur, message, type, tâche) de plusieurs
+    événements à la fois, en une insertion groupée.
+    """
+    notifications = Notification.objects.bulk_create([
+        Notification(user_id=user_id, message=message, kind=kind, task=task)
+        for user_id, message, kind, task in items
+    ])
+    deltas = {}
+    for notification in notifications:
+        deltas[notification.user_id] = deltas.get(notification.user_id, 0) + 1
+    _adjust_unread(deltas)
+    return notifications
+
+
+def mark_read(user_id, notification_ids):
+    """Marque comme lues des notifications de l'utilisateur ; retourne leur nombre."""
+    marked = Notification.objects.filter(user_id=user_id, pk__in=notification_ids, is_read=False).update(
+        is_read=True
+    )
+    _adjust_unread({user_id: -marked})
+    return marked
+
+
+def mark_all_read(user_id):
+    """Marque toutes les notifications de l'utilisateur comme lues, en un seul UPDATE."""
+    marked = Notification.objects.filter(user_id=user_id, is_read=False).update(is_read=True)
+    if marked:
+        # Supprimé plutôt que remis à zéro : une notification créée entre-temps
+        # sera comptée au prochain accès
+        invalidate_unread(user_id)
+    return marked
+
+
+def invalidate_unread(user_id):
+    key = UNREAD_KEY.format(user_id)
+    transaction.on_commit(lambda: get_cache().delete(key))
+
+
+def invalidate_unread_of(notifications):
+    """
+    Invalide, en une requête, les compteurs des destinataires de non lues parmi
+    `notifications` (queryset), avant leur suppression.
+    """
+    user_ids = notifications.filter(is_read=False).order_by().values_list('user_id', flat=True).distinct()
+    keys = [UNREAD_KEY.format(user_id) for user_id in user_ids]
+    if keys:
+        transaction.on_commit(lambda: get_cache().delete_many(keys))
+
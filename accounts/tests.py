@@ -1,3 +1,178 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient, APITestCase
+
+from clients.models import Client
+from lon.cache import get_cache
+from projects.models import Project
+from tasks.models import Task
+from tasks.notifications import notify_overdue
+from .models import Notification, User
+from .notifications import mark_read, notify, unread_count
+
+
+def create_project(manager, members=()):
+    today = timezone.now().date()
+    project = Project.objects.create(
+        name='Chantier',
+        client=Client.objects.create(name='Client'),
+        location='Abidjan',
+        start_date=today,
+        end_date=today + timedelta(days=30),
+        budget=1000,
+        manager=manager,
+    )
+    project.team_members.add(*members)
+    return project
+
+
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.manager = User.objects.create_user(username='chef')
+        self.members = User.objects.bulk_create([User(username=f'membre{index}') for index in range(100)])
+        self.project = create_project(self.manager, self.members)
+
+    def test_project_fan_out_is_one_insert(self):
+        task = Task.objects.create(title='Coffrage', project=self.project, end_date=timezone.now().date())
+        with CaptureQueriesContext(connection) as queries:
+            notifications = notify_overdue([task])
+        inserts = [query for query in queries if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(notifications), 101)
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(queries), 2)
+
+    def test_status_change_notifies_the_team(self):
+        task = Task.objects.create(title='Coffrage', project=self.project)
+        self.assertFalse(Notification.objects.exists())
+
+        task.status = 'in_progress'
+        task.save()
+        self.assertEqual(Notification.objects.filter(kind='task_status').count(), 101)
+
+        task.assigned_to = self.members[0]
+        task.save()
+        notification = Notification.objects.filter(kind='task_assigned', user=self.manager).get()
+        self.assertIn('membre0', notification.message)
+        self.assertEqual(notification.task, task)
+
+    def test_author_of_a_change_is_not_notified(self):
+        task = Task.objects.create(title='Coffrage', project=self.project)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+        response = self.client.post(f'/api/tasks/{task.pk}/change_status/', {'status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.patch(f'/api/tasks/{task.pk}/', {'assigned_to': self.members[0].pk}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Notification.objects.filter(user=self.manager).exists())
+        self.assertEqual(Notification.objects.filter(kind='task_status').count(), 100)
+        self.assertEqual(Notification.objects.filter(kind='task_assigned').count(), 100)
+
+    def test_bulk_status_changes_fan_out_in_batches(self):
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=self.project) for index in range(1000)])
+        changes = [{'id': pk, 'status': 'in_progress'} for pk in Task.objects.values_list('pk', flat=True)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/tasks/bulk/', {'status': changes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        # 1 000 changements × 100 membres, auteur exclu
+        self.assertEqual(Notification.objects.count(), 100_000)
+        # Insertions groupées : autant que de lots imposés par la base, pas une par tâche
+        fields = [field for field in Notification._meta.concrete_fields if not field.primary_key]
+        batch_size = connection.ops.bulk_batch_size(fields, [None] * 100_000)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "accounts_notification"')]
+        self.assertEqual(len(inserts), -(-100_000 // batch_size))
+
+
+class UnreadCountTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='membre')
+        self.client.force_authenticate(self.user)
+
+    def test_counter_is_cached_and_maintained_incrementally(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'Première')
+        self.assertEqual(unread_count(self.user.pk), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notify([self.user.pk], 'Deuxième')
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(mark_read(self.user.pk, [created[0].pk]), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(unread_count(self.user.pk), 1)
+
+    def test_increment_lost_before_caching_is_recounted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'Première')
+        backend = get_cache()
+        add = backend.add
+
+        def add_after_concurrent_notification(*args, **kwargs):
+            # Notification validée entre le COUNT et add : son incrément ne trouve pas la clé
+            with self.captureOnCommitCallbacks(execute=True):
+                notify([self.user.pk], 'Concurrente')
+            return add(*args, **kwargs)
+
+        with mock.patch.object(backend, 'add', side_effect=add_after_concurrent_notification):
+            self.assertEqual(unread_count(self.user.pk), 2)
+        self.assertEqual(unread_count(self.user.pk), 2)
+
+    def test_counter_expires(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'Première')
+        with mock.patch.object(get_cache(), 'add', wraps=get_cache().add) as add:
+            unread_count(self.user.pk)
+        self.assertEqual(add.call_args.kwargs['timeout'], 3600)
+
+    def test_mark_all_read_is_a_single_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'Première')
+            notify([self.user.pk], 'Deuxième')
+        self.assertEqual(self.client.get('/accounts/api/notifications/unread_count/').data['unread'], 2)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/accounts/api/notifications/mark_all_read/')
+        self.assertEqual(response.data['marked'], 2)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.client.get('/accounts/api/notifications/unread_count/').data['unread'], 0)
+
+    def test_cascade_deletion_invalidates_counters_in_bulk(self):
+        manager = User.objects.create_user(username='chef')
+        project = create_project(manager, [self.user])
+        tasks = Task.objects.bulk_create([
+            Task(title=f'Tâche {index}', project=project, end_date=timezone.now().date()) for index in range(3)
+        ])
+        with self.captureOnCommitCallbacks(execute=True):
+            notify_overdue(tasks)
+        self.assertEqual(unread_count(self.user.pk), 3)
+
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            tasks[0].delete()
+        # Suppression groupée des notifications : aucune n'est chargée
+        self.assertFalse([query for query in queries if '"accounts_notification"."message"' in query['sql']])
+        self.assertEqual(unread_count(self.user.pk), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project.delete()
+        self.assertEqual(unread_count(self.user.pk), 0)
 
-# Create your tests here.
+    def test_deleted_notifications_are_not_counted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            notify([self.user.pk], 'Première')
+        self.assertEqual(unread_count(self.user.pk), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.all().delete()
+        self.assertEqual(unread_count(self.user.pk), 0)
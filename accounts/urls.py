@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from lon.async_views import async_read_urls
 from . import views
 
 router = DefaultRouter()
@@ -9,5 +10,6 @@ router.register(r'notifications', views.NotificationViewSet, basename='notificat
 app_name = 'accounts'
 
 urlpatterns = [
+    *async_read_urls('notifications', 'api/notifications/', views.NotificationViewSet),
     path('api/', include(router.urls)),
 ] 
\ No newline at end of file
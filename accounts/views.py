@@ -1,6 +1,10 @@
 # ... existing imports ...
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .models import Notification
+from . import notifications
 from .serializers import UserSerializer, NotificationSerializer
 from django.contrib.auth import get_user_model
 
@@ -22,7 +26,26 @@ class UserViewSet(viewsets.ModelViewSet):
 class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    # Requêtes SQL par appel, authentification JWT comprise (voir lon/metrics.py)
+    # unread_count : authentification, COUNT et recomptage lorsque le compteur n'est pas en cache
+    query_budgets = {'list': 2, 'unread_count': 3}
 
     def get_queryset(self):
         # Les utilisateurs ne voient que leurs propres notifications
-        return Notification.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Notification.objects.filter(user=self.request.user)
+
+    def perform_update(self, serializer):
+        was_read = serializer.instance.is_read
+        notification = serializer.save()
+        if notification.is_read != was_read:
+            notifications.invalidate_unread(notification.user_id)
+
+    @action(detail=False, methods=['get'])
+    def unread_count(self, request):
+        """Nombre de notifications non lues (compteur en cache, voir accounts/notifications.py)."""
+        return Response({'unread': notifications.unread_count(request.user.pk)})
+
+    @action(detail=False, methods=['post'])
+    def mark_all_read(self, request):
+        """Marque toutes les notifications comme lues, en une requête."""
+        return Response({'marked': notifications.mark_all_read(request.user.pk), 'unread': 0})
\ No newline at end of file
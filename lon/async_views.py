@@ -0,0 +1,168 @@
+"""
+Variantes asynchrones des lectures (list / retrieve) des viewsets de l'API.
+
+Sous ASGI, une vue DRF synchrone est exécutée dans un thread (sync_to_async)
+pour toute la durée de la requête. Les variantes asynchrones réutilisent la
+logique des viewsets (get_queryset, pagination, serializer, ?fields=) mais
+attendent la base avec l'ORM asynchrone (`aiterator`, `aget`) et le cache avec
+son API asynchrone ; la sérialisation, sur des objets déjà chargés, se fait
+dans la boucle. Si un serializer déclenche malgré tout une requête (relation
+non préchargée), elle est rejouée dans un thread plutôt que d'échouer.
+
+Activation par route avec `API_ASYNC_READ_ROUTES` (voir `async_read_urls`) :
+les autres méthodes (POST, PATCH, ...) de ces routes restent servies par le
+viewset synchrone.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist, SynchronousOnlyOperation
+from django.http import HttpResponse
+from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import status
+from rest_framework.exceptions import APIException, AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .cache import (
+    aget_user_version, build_cache_key, cache_enabled, cache_timeout, etag_matches,
+    finalize, get_cache, stats,
+)
+
+# Taille des lots de `aiterator` pour les listes non paginées
+ITERATOR_CHUNK_SIZE = 500
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    content = JSONRenderer().render(data) if data is not None else b''
+    return HttpResponse(content, status=status_code, content_type='application/json')
+
+
+async def aauthenticate(request):
+    """
+    Authentifie la requête par le jeton JWT de l'en-tête Authorization, comme
+    l'API synchrone : la validation du jeton ne touche pas la base, seul
+    l'utilisateur est chargé, par `aget`.
+    """
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.settings import api_settings as jwt_settings
+
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+        user_id = token[jwt_settings.USER_ID_CLAIM]
+        user = await authentication.user_model.objects.aget(**{jwt_settings.USER_ID_FIELD: user_id})
+    except (APIException, KeyError, ObjectDoesNotExist):
+        return None
+    return user if user.is_active else None
+
+
+async def serialize(serializer):
+    try:
+        return serializer.data
+    except SynchronousOnlyOperation:
+        # Relation non préchargée : sérialisation dans un thread
+        return await sync_to_async(lambda: serializer.data, thread_sensitive=False)()
+
+
+async def alist(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    paginator = view.paginator
+    if paginator is not None:
+        page = await paginator.apaginate_queryset(queryset, view.request, view=view)
+        data = await serialize(view.get_serializer(page, many=True))
+        return paginator.get_paginated_response(data).data
+    rows = [row async for row in queryset.aiterator(chunk_size=ITERATOR_CHUNK_SIZE)]
+    return await serialize(view.get_serializer(rows, many=True))
+
+
+async def aretrieve(view):
+    queryset = view.filter_queryset(view.get_queryset())
+    lookup_url_kwarg = view.lookup_url_kwarg or view.lookup_field
+    try:
+        instance = await queryset.aget(**{view.lookup_field: view.kwargs[lookup_url_kwarg]})
+    except ObjectDoesNotExist:
+        return None
+    return await serialize(view.get_serializer(instance))
+
+
+HANDLERS = {'list': alist, 'retrieve': aretrieve}
+
+
+def async_read_view(viewset_class, action, actions, cache_scope=None):
+    """
+    Vue asynchrone pour `action` ('list' ou 'retrieve') du viewset ; les autres
+    méthodes HTTP sont déléguées au viewset synchrone (`actions`).
+    """
+    sync_view = viewset_class.as_view(actions)
+    handler = HANDLERS[action]
+
+    async def view(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return await sync_to_async(sync_view)(request, *args, **kwargs)
+
+        user = await aauthenticate(request)
+        if user is None:
+            return json_response({'detail': AuthenticationFailed.default_detail}, status.HTTP_401_UNAUTHORIZED)
+        drf_request = Request(request, authenticators=(), parsers=())
+        drf_request.user = user
+        viewset = viewset_class(
+            action=action, request=drf_request, args=args, kwargs=kwargs, format_kwarg=None
+        )
+        try:
+            viewset.check_permissions(drf_request)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, exc.status_code)
+
+        use_cache = cache_scope is not None and cache_enabled()
+        if use_cache:
+            version = await aget_user_version(user.pk)
+            key, etag = build_cache_key(cache_scope, drf_request, kwargs, version=version)
+            data = await get_cache().aget(key)
+            if data is not None:
+                if etag_matches(drf_request, etag):
+                    stats.incr(cache_scope, 'not_modified')
+                    return finalize(json_response(None, status.HTTP_304_NOT_MODIFIED), etag)
+                stats.incr(cache_scope, 'hit')
+                return finalize(json_response(data), etag)
+            stats.incr(cache_scope, 'miss')
+
+        try:
+            data = await handler(viewset)
+        except APIException as exc:
+            return json_response({'detail': exc.detail}, exc.status_code)
+        if data is None:
+            return json_response({'detail': "Non trouvé."}, status.HTTP_404_NOT_FOUND)
+
+        response = json_response(data)
+        if use_cache:
+            await get_cache().aset(key, data, cache_timeout())
+            finalize(response, etag)
+        return response
+
+    return csrf_exempt(view)
+
+
+def async_read_urls(name, prefix, viewset_class, cache_scopes=None):
+    """
+    Routes asynchrones de liste et de détail d'un viewset, si `name` figure dans
+    API_ASYNC_READ_ROUTES (sinon aucune : le routeur DRF sert la route). À placer
+    avant l'inclusion du routeur.
+    """
+    if name not in getattr(settings, 'API_ASYNC_READ_ROUTES', ()):
+        return []
+    cache_scopes = cache_scopes or {}
+    return [
+        path(prefix, async_read_view(
+            viewset_class, 'list', {'get': 'list', 'post': 'create'}, cache_scopes.get('list')
+        ), name=f'{name}-async-list'),
+        path(f'{prefix}<int:pk>/', async_read_view(
+            viewset_class, 'retrieve',
+            {'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'},
+            cache_scopes.get('retrieve')
+        ), name=f'{name}-async-detail'),
+    ]
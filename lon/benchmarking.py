@@ -0,0 +1,243 @@
+"""
+Outils partagés par les commandes de benchmark : génération de données
+synthétiques et mesure du nombre de requêtes / de la latence.
+"""
+import hashlib
+import math
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.db import connection, models
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+
+def seed_tasks(projects=500, tasks=50000, users=200, members_per_project=10, seed=42, clients=1, password=None):
+    """
+    Crée des utilisateurs, des clients, des projets avec leurs équipes et des tâches
+    réparties sur tous les statuts et priorités. Toutes les insertions sont faites
+    par lots (`bulk_create`). Retourne un dictionnaire avec les objets créés.
+
+    `password` : mot de passe de tous les utilisateurs (haché une seule fois),
+    pour les benchmarks qui s'authentifient ; sans mot de passe par défaut.
+    """
+    from django.contrib.auth.hashers import make_password
+
+    from accounts.models import User
+    from clients.models import Client
+    from projects.counters import recompute_counters
+    from projects.models import Project
+    from tasks.models import Task
+
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    prefix = f'bench{seed}'
+
+    password_hash = make_password(password)
+    created_users = User.objects.bulk_create([
+        User(username=f'{prefix}_user{index}', first_name='Bench', last_name=str(index), password=password_hash)
+        for index in range(users)
+    ], batch_size=1000)
+    if created_users[0].pk is None:
+        created_users = list(User.objects.filter(username__startswith=f'{prefix}_user').order_by('pk'))
+
+    client = Client.objects.create(name=f'{prefix} client')
+    created_clients = [client] + [
+        Client.objects.create(name=f'{prefix} client {index}') for index in range(1, clients)
+    ]
+    created_projects = Project.objects.bulk_create([
+        Project(
+            name=f'{prefix} projet {index}',
+            client=created_clients[index % len(created_clients)],
+            location='Abidjan',
+            start_date=today - timedelta(days=rng.randint(0, 365)),
+            end_date=today + timedelta(days=rng.randint(0, 365)),
+            budget=rng.randint(1000, 1000000),
+            manager=rng.choice(created_users),
+        )
+        for index in range(projects)
+    ], batch_size=1000)
+    if created_projects[0].pk is None:
+        created_projects = list(Project.objects.filter(name__startswith=f'{prefix} projet').order_by('pk'))
+
+    Membership = Project.team_members.through
+    memberships = []
+    team_by_project = {}
+    for project in created_projects:
+        team = rng.sample(created_users, min(members_per_project, len(created_users)))
+        team_by_project[project.pk] = team
+        memberships.extend(Membership(project_id=project.pk, user_id=user.pk) for user in team)
+    Membership.objects.bulk_create(memberships, batch_size=5000)
+
+    statuses = [code for code, _ in Task.STATUS_CHOICES]
+    priorities = [code for code, _ in Task.PRIORITY_CHOICES]
+    batch = []
+    for index in range(tasks):
+        project = created_projects[index % len(created_projects)]
+        start = today - timedelta(days=rng.randint(0, 120))
+        batch.append(Task(
+            title=f'Tâche {index}',
+            project=project,
+            assigned_to=rng.choice(team_by_project[project.pk]),
+            created_by=project.manager,
+            status=rng.choice(statuses),
+            priority=rng.choice(priorities),
+            start_date=start,
+            end_date=start + timedelta(days=rng.randint(1, 90)),
+        ))
+        if len(batch) >= 5000:
+            Task.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        Task.objects.bulk_create(batch)
+    # bulk_create n'envoie pas de signaux : compteurs reconstruits en une passe
+    recompute_counters([project.pk for project in created_projects])
+
+    return {
+        'users': created_users,
+        'client': client,
+        'clients': created_clients,
+        'projects': created_projects,
+    }
+
+
+def seed_documents(task_ids, users, documents, seed=42, contents=20):
+    """
+    Crée `documents` documents répartis sur les tâches `task_ids`, partageant
+    `contents` contenus distincts (DocumentBlob, fichiers de 1 à 64 Ko écrits
+    dans le stockage). Insertions par lots : pas de signaux, donc pas de
+    génération d'aperçus. Retourne le nombre de documents créés.
+    """
+    from django.core.files.base import ContentFile
+
+    from tasks.models import DocumentBlob, TaskDocument
+
+    if not task_ids or not documents:
+        return 0
+    rng = random.Random(seed)
+    blobs = []
+    for index in range(contents):
+        content = f'bench{seed} document {index}\n'.encode() * rng.randint(40, 2500)
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob = DocumentBlob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            blob = DocumentBlob(sha256=sha256, size=len(content))
+            blob.file.save(sha256, ContentFile(content), save=False)
+            blob.save()
+        blobs.append(blob)
+
+    extensions = ['pdf', 'pdf', 'jpg', 'png', 'docx', 'xlsx']
+    batch = []
+    references = {}
+    for index in range(documents):
+        blob = rng.choice(blobs)
+        references[blob.pk] = references.get(blob.pk, 0) + 1
+        name = f'document_{index}.{rng.choice(extensions)}'
+        batch.append(TaskDocument(
+            task_id=rng.choice(task_ids),
+            file=blob.file.name,
+            title=f'Document {index}',
+            blob=blob,
+            original_name=name,
+            uploaded_by=rng.choice(users),
+        ))
+    TaskDocument.objects.bulk_create(batch, batch_size=5000)
+    for blob_id, count in references.items():
+        DocumentBlob.objects.filter(pk=blob_id).update(ref_count=models.F('ref_count') + count)
+    return len(batch)
+
+
+def seed_notifications(users, task_ids, per_user, seed=42, read_ratio=0.7):
+    """
+    Crée `per_user` notifications par utilisateur, de tous les types, dont
+    environ `read_ratio` déjà lues. Retourne le nombre de notifications créées.
+    """
+    from accounts.models import Notification
+
+    rng = random.Random(seed)
+    kinds = [code for code, _ in Notification.KIND_CHOICES]
+    batch = []
+    for user in users:
+        for index in range(per_user):
+            task_id = rng.choice(task_ids) if task_ids else None
+            batch.append(Notification(
+                user=user,
+                kind=rng.choice(kinds),
+                task_id=task_id,
+                message=f'Notification {index} (tâche {task_id})',
+                is_read=rng.random() < read_ratio,
+            ))
+    Notification.objects.bulk_create(batch, batch_size=5000)
+    return len(batch)
+
+
+def seed_dataset(users=200, clients=20, projects=500, members_per_project=10, tasks=50000,
+                 documents=5000, notifications_per_user=50, seed=42, password=None):
+    """
+    Jeu de données complet des benchmarks (commande seed_benchmark_data) :
+    utilisateurs, clients, projets et équipes, tâches, documents et
+    notifications. Le même `seed` donne les mêmes données. Retourne les
+    objets de seed_tasks et le nombre de lignes créées par type.
+    """
+    from tasks.models import Task
+
+    data = seed_tasks(
+        projects=projects, tasks=tasks, users=users, members_per_project=members_per_project,
+        seed=seed, clients=clients, password=password,
+    )
+    task_ids = list(
+        Task.objects.filter(project__in=data['projects']).order_by('pk').values_list('pk', flat=True)
+    )
+    data['counts'] = {
+        'users': len(data['users']),
+        'clients': len(data['clients']),
+        'projects': len(data['projects']),
+        'tasks': len(task_ids),
+        'documents': seed_documents(task_ids, data['users'], documents, seed=seed),
+        'notifications': seed_notifications(data['users'], task_ids, notifications_per_user, seed=seed),
+    }
+    return data
+
+
+def summarize(durations, elapsed):
+    """
+    Débit (requêtes par seconde) et latences en ms (moyenne, p50, p95, p99 au
+    rang le plus proche) d'une série de durées en secondes.
+    """
+    durations = sorted(durations)
+    if not durations:
+        return {'requests': 0}
+
+    def percentile(rank):
+        return round(durations[max(math.ceil(rank / 100 * len(durations)) - 1, 0)] * 1000, 2)
+
+    return {
+        'requests': len(durations),
+        'rps': round(len(durations) / elapsed, 1) if elapsed else None,
+        'mean_ms': round(statistics.fmean(durations) * 1000, 2),
+        'p50_ms': percentile(50),
+        'p95_ms': percentile(95),
+        'p99_ms': percentile(99),
+    }
+
+
+def measure(func, repeat=5):
+    """
+    Exécute `func` plusieurs fois et retourne le nombre de requêtes SQL de la
+    dernière exécution ainsi que les latences médiane et minimale (en ms).
+    """
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries = len(context.captured_queries)
+    return {
+        'queries': queries,
+        'median_ms': round(statistics.median(timings), 2),
+        'min_ms': round(min(timings), 2),
+    }
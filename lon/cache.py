@@ -0,0 +1,206 @@
+"""
+Cache des réponses des endpoints de lecture coûteux.
+
+Les clés sont propres à chaque utilisateur et à chaque requête (chemin et
+paramètres). Elles incluent un numéro de version par utilisateur ; les
+signaux de Task, Project, User et Client changent la version des utilisateurs
+concernés (équipe, chef de projet, assigné), une fois la transaction validée :
+une lecture concurrente ne peut pas remettre en cache l'état d'avant. La date
+du jour fait aussi partie de la clé, pour que les champs qui en dépendent (en
+retard, jours restants) changent à minuit. L'invalidation est donc précise
+sans avoir à énumérer les clés. L'ETag est dérivé de la même clé : une requête
+`If-None-Match` dont la réponse est toujours en cache reçoit un 304 sans accès
+à la base ni sérialisation.
+
+Désactivé par défaut (API_CACHE_ENABLED) : les versions ne sont cohérentes
+qu'avec un cache partagé par tous les processus (Redis, Memcached). Avec un
+cache local (LocMemCache), chaque worker garderait ses propres versions et
+servirait des réponses périmées après une modification faite par un autre.
+"""
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from rest_framework import status
+from rest_framework.response import Response
+
+VERSION_KEY = 'api:version:user:{}'
+
+
+def get_cache():
+    return caches[getattr(settings, 'API_CACHE_ALIAS', 'default')]
+
+
+def cache_enabled():
+    return getattr(settings, 'API_CACHE_ENABLED', False)
+
+
+class CacheStats:
+    """Compteurs de hits / misses / 304 par portée, partagés par le processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = {}
+
+    def incr(self, scope, outcome):
+        with self._lock:
+            key = (scope, outcome)
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+    def snapshot(self):
+        """Retourne {(portée, résultat): nombre}."""
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+stats = CacheStats()
+
+
+def get_user_version(user_id):
+    """
+    Retourne la version courante des réponses de l'utilisateur. Une version
+    absente (jamais créée ou évincée) est initialisée avec une valeur aléatoire,
+    pour ne jamais retomber sur une version déjà utilisée.
+    """
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, timeout=None)
+        version = cache.get(key)
+    return version
+
+
+async def aget_user_version(user_id):
+    """Variante asynchrone de `get_user_version`."""
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id)
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, uuid.uuid4().hex, timeout=None)
+        version = await cache.aget(key)
+    return version
+
+
+def invalidate_users(user_ids):
+    """
+    Change la version des utilisateurs donnés à la validation de la transaction
+    courante : leurs réponses en cache deviennent caduques.
+    """
+    user_ids = {user_id for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    transaction.on_commit(lambda: get_cache().set_many(
+        {VERSION_KEY.format(user_id): uuid.uuid4().hex for user_id in user_ids},
+        timeout=None
+    ))
+
+
+def project_audience(project_ids):
+    """Identifiants des membres et chefs des projets donnés."""
+    from projects.models import Project
+
+    project_ids = [project_id for project_id in project_ids if project_id is not None]
+    if not project_ids:
+        return set()
+    members = Project.team_members.through.objects.filter(
+        project_id__in=project_ids
+    ).values_list('user_id', flat=True)
+    managers = Project.objects.filter(pk__in=project_ids).values_list('manager_id', flat=True)
+    return set(members) | set(managers)
+
+
+def invalidate_projects(project_ids, extra_user_ids=()):
+    """Invalide les réponses de tous les utilisateurs qui voient ces projets."""
+    invalidate_users(project_audience(project_ids) | set(extra_user_ids))
+
+
+def user_audience(user_id):
+    """
+    Identifiants des utilisateurs dont les réponses peuvent contenir l'utilisateur
+    donné : équipes et chefs de ses projets et des projets de ses tâches.
+    """
+    from projects.models import Project
+    from tasks.models import Task
+
+    project_ids = set(Project.team_members.through.objects.filter(
+        user_id=user_id
+    ).values_list('project_id', flat=True))
+    project_ids |= set(Project.objects.filter(manager_id=user_id).values_list('pk', flat=True))
+    project_ids |= set(Task.objects.filter(assigned_to_id=user_id).values_list('project_id', flat=True))
+    return project_audience(project_ids) | {user_id}
+
+
+def build_cache_key(scope, request, kwargs, version=None):
+    """Retourne (clé de cache, ETag) pour la requête de l'utilisateur courant."""
+    user_id = request.user.pk
+    if version is None:
+        version = get_user_version(user_id)
+    params = sorted(request.query_params.lists())
+    raw = f'{request.path}|{params}|{sorted(kwargs.items())}'
+    digest = hashlib.md5(raw.encode('utf-8'), usedforsecurity=False).hexdigest()
+    key = f'api:response:{scope}:{user_id}:{version}:{timezone.localdate().isoformat()}:{digest}'
+    etag = '"{}"'.format(hashlib.md5(key.encode('utf-8'), usedforsecurity=False).hexdigest())
+    return key, etag
+
+
+def etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+def finalize(response, etag):
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Authorization', 'Cookie'))
+    return response
+
+
+def cache_timeout(timeout=None):
+    return timeout or getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+
+def cache_response(scope, timeout=None):
+    """
+    Décorateur pour les actions de lecture d'un viewset (list, retrieve, ...).
+    Met en cache `response.data` des réponses 200 par utilisateur et paramètres,
+    et répond 304 lorsque l'ETag fourni par le client est celui d'une réponse
+    toujours en cache (une entrée expirée ou évincée ne prouve plus rien).
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if not cache_enabled() or not request.user.is_authenticated:
+                return method(view, request, *args, **kwargs)
+
+            key, etag = build_cache_key(scope, request, kwargs)
+            cache = get_cache()
+            data = cache.get(key)
+            if data is not None:
+                if etag_matches(request, etag):
+                    stats.incr(scope, 'not_modified')
+                    return finalize(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+                stats.incr(scope, 'hit')
+                return finalize(Response(data), etag)
+
+            stats.incr(scope, 'miss')
+            response = method(view, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, cache_timeout(timeout))
+                finalize(response, etag)
+            return response
+        return wrapper
+    return decorator
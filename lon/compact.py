@@ -0,0 +1,274 @@
+"""
+Sérialisation compacte des listes de l'API (opt-in par API_COMPACT_LIST_ROUTES,
+voir CompactListMixin).
+
+Le serializer DRF de la vue est « compilé » une fois par ensemble de champs :
+chaque champ devient une fonction qui lit sa valeur dans les lignes de
+`.values()` (aucune instance de modèle, aucun get_attribute), avec une
+conversion préparée à l'avance :
+- champs simples : valeur telle quelle lorsque la conversion DRF ne la change
+  pas (texte, entier, booléen, clé primaire), sinon `to_representation` du
+  champ DRF lui-même ;
+- choix et libellés `get_<champ>_display` : tables de correspondance
+  construites depuis les `choices` du modèle ;
+- relations : `project.name` devient la colonne `project__name`, un serializer
+  imbriqué sur une clé étrangère lit les colonnes `manager__...`, un
+  serializer imbriqué `many=True` sur un ManyToMany est chargé en une requête
+  pour toute la page ;
+- propriétés du modèle : uniquement celles déclarées par la vue (`Computed`
+  ou nom de colonne annotée, comme pour les exports).
+
+Un champ qui ne se compile pas (SerializerMethodField, propriété non déclarée,
+relation nullable traversée, ...) fait revenir toute la réponse au chemin DRF
+habituel : la sortie est toujours identique à celle du serializer.
+"""
+import re
+
+from django.db import models
+from rest_framework import fields as drf_fields
+from rest_framework import relations, serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
+
+from .export import Computed
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+DISPLAY_RE = re.compile(r'^get_(\w+)_display$')
+
+
+class NotCompilable(Exception):
+    """Champ sans équivalent compact : la réponse passe par le serializer DRF."""
+
+
+def _unchanged(field, model_field):
+    """Vrai si `to_representation` du champ DRF rend la valeur lue telle quelle."""
+    if isinstance(field, (drf_fields.ReadOnlyField, relations.PrimaryKeyRelatedField)):
+        return True
+    if isinstance(field, drf_fields.BooleanField):
+        return isinstance(model_field, models.BooleanField)
+    if isinstance(field, drf_fields.CharField):
+        return isinstance(model_field, (models.CharField, models.TextField))
+    if isinstance(field, drf_fields.IntegerField):
+        return isinstance(model_field, models.IntegerField)
+    return False
+
+
+def converter(field, model_field=None):
+    """Conversion d'une valeur non nulle, ou None si la valeur est rendue telle quelle."""
+    if model_field is not None and _unchanged(field, model_field):
+        return None
+    if isinstance(field, drf_fields.ReadOnlyField):
+        return None
+    if isinstance(field, drf_fields.ChoiceField):
+        table = field.choice_strings_to_values
+        return lambda value: table.get(str(value), value)
+    if (
+        isinstance(field, drf_fields.DateField)
+        and getattr(field, 'format', api_settings.DATE_FORMAT) == api_settings.DATE_FORMAT
+        and (api_settings.DATE_FORMAT or '').lower() == drf_fields.ISO_8601
+    ):
+        return lambda value: value.isoformat() if value else None
+    return field.to_representation
+
+
+def _getter(column, convert):
+    if convert is None:
+        return lambda row: row[column]
+
+    def get(row):
+        value = row[column]
+        return None if value is None else convert(value)
+    return get
+
+
+class ManyLoader:
+    """Serializer imbriqué `many=True` sur un ManyToMany : une requête pour la page."""
+
+    def __init__(self, name, model_field, plan):
+        self.key = f'__{name}'
+        self.plan = plan
+        self.related_model = model_field.related_model
+        self.lookup = model_field.related_query_name()
+        self.owner_pk = model_field.model._meta.pk.attname
+
+    def load(self, rows):
+        pks = [row[self.owner_pk] for row in rows]
+        grouped = {pk: [] for pk in pks}
+        owner = 'compact_owner'
+        related = self.related_model._default_manager.filter(**{f'{self.lookup}__in': pks}).values(
+            *self.plan.columns, **{owner: models.F(self.lookup)}
+        )
+        for item in related:
+            grouped[item[owner]].append(item)
+        for row in rows:
+            row[self.key] = self.plan.serialize(grouped[row[self.owner_pk]])
+
+
+class CompactPlan:
+    """Colonnes à lire et fonctions de construction des lignes d'un serializer compilé."""
+
+    def __init__(self, serializer, computed=None, prefix=''):
+        self.model = serializer.Meta.model
+        self.computed = computed or {}
+        self.prefix = prefix
+        self.columns = []
+        self.getters = []
+        self.loaders = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.getters.append((name, self.compile(name, field)))
+
+    def column(self, name):
+        column = self.prefix + name
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def compile(self, name, field):
+        if name in self.computed and not self.prefix:
+            return self.compile_computed(field, self.computed[name])
+        if field.source == '*' or not field.source_attrs:
+            raise NotCompilable(name)
+
+        display = DISPLAY_RE.match(field.source)
+        if display and len(field.source_attrs) == 1:
+            return self.compile_display(field, display.group(1))
+
+        path, model_field, nullable = self.resolve(field.source_attrs)
+        if isinstance(field, serializers.ListSerializer):
+            if self.prefix or not model_field.many_to_many or not isinstance(field.child, serializers.ModelSerializer):
+                raise NotCompilable(name)
+            self.column(self.model._meta.pk.attname)
+            loader = ManyLoader(name, model_field, CompactPlan(field.child))
+            self.loaders.append(loader)
+            return lambda row: row[loader.key]
+        if model_field.many_to_many or model_field.one_to_many:
+            raise NotCompilable(name)
+        if isinstance(field, serializers.BaseSerializer):
+            if nullable or not model_field.is_relation or not isinstance(field, serializers.ModelSerializer):
+                raise NotCompilable(name)
+            return self.compile_nested(field, path, model_field)
+        if nullable:
+            # DRF omet le champ quand une relation intermédiaire est nulle
+            raise NotCompilable(name)
+        if isinstance(field, relations.RelatedField) and not isinstance(field, relations.PrimaryKeyRelatedField):
+            raise NotCompilable(name)
+        return _getter(self.column(path), converter(field, model_field))
+
+    def resolve(self, attrs):
+        """Chemin `.values()` d'une source DRF, champ du modèle et relation intermédiaire nullable."""
+        model, path, nullable = self.model, [], False
+        for index, attr in enumerate(attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except Exception:
+                raise NotCompilable('.'.join(attrs))
+            path.append(model_field.name)
+            if index < len(attrs) - 1:
+                if not (model_field.many_to_one or model_field.one_to_one) or model_field.auto_created:
+                    raise NotCompilable('.'.join(attrs))
+                nullable = nullable or model_field.null
+                model = model_field.related_model
+        return '__'.join(path), model_field, nullable
+
+    def compile_display(self, field, field_name):
+        try:
+            model_field = self.model._meta.get_field(field_name)
+        except Exception:
+            raise NotCompilable(field.source)
+        if not model_field.choices:
+            raise NotCompilable(field.source)
+        column = self.column(field_name)
+        labels = {value: str(label) for value, label in model_field.flatchoices}
+        convert = None if isinstance(field, drf_fields.CharField) else converter(field)
+
+        def get(row):
+            value = row[column]
+            if value is None:
+                return None
+            label = labels.get(value, value)
+            return label if convert is None else convert(label)
+        return get
+
+    def compile_nested(self, field, path, model_field):
+        nested = CompactPlan(field, prefix=f'{self.prefix}{path}__')
+        if nested.loaders:
+            raise NotCompilable(field.field_name)
+        self.columns.extend(column for column in nested.columns if column not in self.columns)
+        marker = self.column(f'{path}__{model_field.related_model._meta.pk.name}')
+        getters = nested.getters
+
+        def get(row):
+            if row[marker] is None:
+                return None
+            return {name: getter(row) for name, getter in getters}
+        return get
+
+    def compile_computed(self, field, source):
+        convert = converter(field)
+        if isinstance(source, Computed):
+            for column in source.sources:
+                self.column(column)
+            compute = source
+        else:
+            column = self.column(source)
+            compute = lambda row: row[column]  # noqa: E731
+        if convert is None:
+            return compute
+
+        def get(row):
+            value = compute(row)
+            return None if value is None else convert(value)
+        return get
+
+    def serialize(self, rows):
+        for loader in self.loaders:
+            loader.load(rows)
+        getters = self.getters
+        return [{name: getter(row) for name, getter in getters} for row in rows]
+
+
+def compile_serializer(serializer, computed=None):
+    """Retourne le CompactPlan du serializer, ou None s'il ne se compile pas."""
+    try:
+        return CompactPlan(serializer, computed)
+    except NotCompilable:
+        return None
+
+
+class CompactJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer produisant les mêmes octets, avec orjson lorsqu'il est installé
+    (sinon, ou pour une indentation demandée, le rendu de DRF).
+
+    Seule différence : un flottant en notation exponentielle (|x| < 1e-4 ou
+    ≥ 1e16) s'écrit `6.5e-5` au lieu de `6.5e-05`, même valeur. Le vérifier sur
+    chaque réponse coûterait plus que le rendu ; les flottants des listes
+    (progression, taux) restent dans [0, 100].
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None or data is None or self.ensure_ascii or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self._default,
+                # Dates, heures et sous-classes : formatées par l'encodeur de DRF
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS,
+            )
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        # Échappements ajoutés par JSONRenderer (séparateurs de ligne JavaScript)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def _default(self, obj):
+        return self.encoder_class().default(obj)
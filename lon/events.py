@@ -0,0 +1,277 @@
+"""
+Diffusion en temps réel des modifications (tâches, projets) aux clients abonnés.
+
+Les signaux publient des événements sur des sujets (`project:<id>`) après la
+validation de la transaction ; chaque connexion SSE ouverte (voir
+projects/streams.py) est un abonnement à un sujet.
+
+Le courtier a un backend interchangeable (`REALTIME_BROKER_BACKEND`) :
+- InMemoryBackend : diffusion dans le processus, pour les tests et un
+  serveur à un seul worker ;
+- CachePollingBackend : les événements sont écrits dans un cache partagé
+  dont `incr` est atomique (Redis, Memcached ; pas FileBasedCache ni
+  DatabaseCache, dont l'incrément lit puis réécrit la valeur) et chaque
+  worker les relit périodiquement pour ses propres abonnés.
+
+Chaque abonnement accumule les événements en attente dans un dictionnaire
+indexé par objet : une rafale de modifications d'une même tâche n'est envoyée
+qu'une fois (dernier état). Si un client lit trop lentement et que le nombre
+d'objets en attente dépasse `REALTIME_MAX_PENDING`, les événements sont
+abandonnés au profit d'un unique événement `resync` : le client se resynchronise
+par /api/tasks/changes/. La mémoire par connexion reste ainsi bornée.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+RESYNC = {'type': 'resync'}
+
+
+def project_topic(project_id):
+    return f'project:{project_id}'
+
+
+class Subscription:
+    """Abonnement d'une connexion à un sujet : événements en attente et réveil."""
+
+    __slots__ = ('topic', 'max_pending', 'pending', 'overflowed', 'loop', 'wakeup')
+
+    def __init__(self, topic, loop, max_pending):
+        self.topic = topic
+        self.max_pending = max_pending
+        self.pending = {}
+        self.overflowed = False
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+
+    def deliver(self, event):
+        """Ajoute un événement (dans la boucle de l'abonnement)."""
+        if not self.overflowed:
+            key = (event['type'], event.get('id'))
+            # Réinsertion en fin : l'ordre d'envoi suit la dernière modification
+            self.pending.pop(key, None)
+            self.pending[key] = event
+            if len(self.pending) > self.max_pending:
+                self.pending.clear()
+                self.overflowed = True
+        self.wakeup.set()
+
+    def drain(self):
+        """Retourne et vide les événements en attente."""
+        self.wakeup.clear()
+        if self.overflowed:
+            self.overflowed = False
+            return [RESYNC]
+        events = list(self.pending.values())
+        self.pending.clear()
+        return events
+
+    async def wait(self, timeout):
+        """Attend des événements ; retourne False si le délai expire sans événement."""
+        if self.pending or self.overflowed:
+            return True
+        try:
+            await asyncio.wait_for(self.wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class InMemoryBackend:
+    """Diffusion aux abonnés du processus courant."""
+
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, subscription):
+        with self._lock:
+            self._subscribers.setdefault(subscription.topic, set()).add(subscription)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish_many(self, items):
+        """Diffuse des couples (sujet, événement), depuis n'importe quel thread."""
+        by_loop = {}
+        with self._lock:
+            for topic, event in items:
+                for subscription in self._subscribers.get(topic, ()):
+                    by_loop.setdefault(subscription.loop, []).append((subscription, event))
+        for loop, deliveries in by_loop.items():
+            if _running_loop() is loop:
+                _deliver(deliveries)
+            elif not loop.is_closed():
+                loop.call_soon_threadsafe(_deliver, deliveries)
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+def _deliver(deliveries):
+    for subscription, event in deliveries:
+        subscription.deliver(event)
+
+
+class CachePollingBackend(InMemoryBackend):
+    """
+    Diffusion entre workers par un cache partagé : chaque événement reçoit un
+    numéro de séquence (`cache.incr`, qui doit être atomique), et chaque worker
+    relit les nouveaux numéros toutes les `interval` secondes pour ses abonnés
+    locaux.
+
+    Un numéro est réservé avant que l'événement ne soit écrit : un worker qui
+    relit entre les deux trouve un numéro sans événement. Il ne dépasse pas ce
+    numéro avant `gap_timeout` secondes ; passé ce délai (publication
+    interrompue, événement expiré), l'événement est tenu pour perdu et les
+    abonnés locaux reçoivent un `resync`.
+    """
+    SEQUENCE_KEY = 'realtime:sequence'
+    EVENT_KEY = 'realtime:event:{}'
+
+    def __init__(self, alias='default', interval=0.5, timeout=300, gap_timeout=5, **options):
+        super().__init__(**options)
+        self.alias = alias
+        self.interval = interval
+        self.timeout = timeout
+        self.gap_timeout = gap_timeout
+        self._cursor = None
+        self._gaps = {}
+        self._poller = None
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _sequence(self):
+        self.cache.add(self.SEQUENCE_KEY, 0, timeout=None)
+        return self.cache.get(self.SEQUENCE_KEY) or 0
+
+    def publish_many(self, items):
+        items = list(items)
+        if not items:
+            return
+        self._sequence()
+        last = self.cache.incr(self.SEQUENCE_KEY, len(items))
+        first = last - len(items) + 1
+        self.cache.set_many(
+            {self.EVENT_KEY.format(first + index): item for index, item in enumerate(items)},
+            timeout=self.timeout
+        )
+
+    def subscribe(self, subscription):
+        super().subscribe(subscription)
+        with self._lock:
+            if self._poller is None or self._poller.done():
+                self._poller = subscription.loop.create_task(self._poll())
+
+    async def _poll(self):
+        from asgiref.sync import sync_to_async
+
+        while self.subscriber_count():
+            await sync_to_async(self.poll_once, thread_sensitive=False)()
+            await asyncio.sleep(self.interval)
+
+    def poll_once(self):
+        """Relit les événements publiés depuis le dernier passage et les diffuse localement."""
+        current = self._sequence()
+        if self._cursor is None or current < self._cursor:
+            # Premier passage (ou séquence réinitialisée) : seuls les événements à venir
+            self._cursor = current
+            return
+        if current == self._cursor:
+            return
+        numbers = range(self._cursor + 1, current + 1)
+        found = self.cache.get_many([self.EVENT_KEY.format(number) for number in numbers])
+        now = time.monotonic()
+        events = []
+        lost = False
+        for number in numbers:
+            event = found.get(self.EVENT_KEY.format(number))
+            if event is None:
+                # Numéro réservé, événement pas encore écrit : on attend
+                if now - self._gaps.setdefault(number, now) < self.gap_timeout:
+                    break
+                lost = True
+            else:
+                events.append(event)
+            self._cursor = number
+        self._gaps = {number: seen for number, seen in self._gaps.items() if number > self._cursor}
+        super().publish_many(events)
+        if lost:
+            self.resync_all()
+
+    def resync_all(self):
+        """Envoie un `resync` à tous les abonnés locaux (événements perdus)."""
+        with self._lock:
+            topics = list(self._subscribers)
+        super().publish_many((topic, RESYNC) for topic in topics)
+
+
+class Broker:
+    def __init__(self, backend, max_pending=500):
+        self.backend = backend
+        self.max_pending = max_pending
+
+    def subscribe(self, topic):
+        """Crée un abonnement dans la boucle courante (à appeler depuis du code async)."""
+        subscription = Subscription(topic, asyncio.get_running_loop(), self.max_pending)
+        self.backend.subscribe(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.backend.unsubscribe(subscription)
+
+    def publish(self, topic, event):
+        self.backend.publish_many([(topic, event)])
+
+    def publish_many(self, items):
+        self.backend.publish_many(items)
+
+    def publish_on_commit(self, items):
+        """Publie après la validation de la transaction en cours (ou immédiatement hors transaction)."""
+        items = list(items)
+        if items:
+            transaction.on_commit(lambda: self.publish_many(items))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            config = getattr(settings, 'REALTIME_BROKER_BACKEND', {})
+            backend_class = import_string(config.get('BACKEND', 'lon.events.InMemoryBackend'))
+            _broker = Broker(
+                backend_class(**config.get('OPTIONS', {})),
+                max_pending=getattr(settings, 'REALTIME_MAX_PENDING', 500),
+            )
+        return _broker
+
+
+def reset_broker():
+    """Oublie le courtier courant (changement de configuration, tests)."""
+    global _broker
+    with _broker_lock:
+        _broker = None
@@ -0,0 +1,148 @@
+"""
+Exports en flux (CSV ou NDJSON) pour les actions `export` des viewsets.
+
+Les lignes sont lues par `.values(...).iterator(chunk_size=...)` (curseur côté
+serveur sous PostgreSQL) et écrites au fil de l'eau dans une
+StreamingHttpResponse : la mémoire utilisée ne dépend pas du nombre de lignes
+exportées. Aucune instance de modèle n'est créée ; les champs calculés
+(`Computed`) sont évalués sur les valeurs brutes de chaque ligne.
+
+Le format est choisi par `?format=csv|ndjson` (négociation de contenu DRF, voir
+CSVRenderer et NDJSONRenderer) ; CSV par défaut.
+"""
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.renderers import BaseRenderer
+
+# Lignes lues par aller-retour avec la base, et lignes regroupées par envoi
+DEFAULT_CHUNK_SIZE = 2000
+ROWS_PER_WRITE = 500
+
+
+class Computed:
+    """Colonne calculée à partir des valeurs `sources` de la ligne."""
+
+    def __init__(self, function, *sources):
+        self.function = function
+        self.sources = sources
+
+    def __call__(self, row):
+        return self.function(*(row[source] for source in self.sources))
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Déclare le format `csv` pour la négociation de contenu. Les exports sont des
+    réponses en flux ; le rendu ne sert qu'aux réponses d'erreur (401, 403, ...).
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, dict):
+            data = {'detail': data}
+        buffer = Echo()
+        writer = csv.writer(buffer)
+        return (writer.writerow(list(data)) + writer.writerow(list(data.values()))).encode(self.charset)
+
+
+class NDJSONRenderer(BaseRenderer):
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return (json.dumps(data, cls=DjangoJSONEncoder) + '\n').encode(self.charset)
+
+
+EXPORT_RENDERERS = [CSVRenderer, NDJSONRenderer]
+
+
+class Echo:
+    """Pseudo-fichier pour csv.writer : `write` retourne la ligne au lieu de la stocker."""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, columns, chunk_size=None, prepare=None):
+    """
+    Itère sur les lignes du queryset sous forme de listes de valeurs, dans l'ordre
+    des colonnes. `columns` est une liste de (nom, source) : chemin de champ pour
+    `.values()` ou colonne calculée (`Computed`). `prepare(rows)` complète chaque
+    lot de lignes lues avant le calcul des colonnes (une requête par lot plutôt
+    que par ligne).
+    """
+    chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    fields = []
+    for _, source in columns:
+        for name in source.sources if isinstance(source, Computed) else (source,):
+            if name not in fields:
+                fields.append(name)
+    getters = [source if isinstance(source, Computed) else _getter(source) for _, source in columns]
+    rows = queryset.values(*fields).iterator(chunk_size=chunk_size)
+    while batch := list(islice(rows, chunk_size)):
+        if prepare is not None:
+            prepare(batch)
+        for row in batch:
+            yield [getter(row) for getter in getters]
+
+
+def _getter(name):
+    return lambda row: row[name]
+
+
+def stream_csv(headers, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(headers)
+    batch = []
+    for row in rows:
+        batch.append(writer.writerow(row))
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_ndjson(headers, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    batch = []
+    for row in rows:
+        batch.append(encoder.encode(dict(zip(headers, row))) + '\n')
+        if len(batch) >= ROWS_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+STREAMERS = {'csv': stream_csv, 'ndjson': stream_ndjson}
+
+
+def export_response(request, queryset, columns, basename, prepare=None):
+    """Réponse en flux de l'export, au format négocié par DRF (`request.accepted_renderer`)."""
+    renderer = request.accepted_renderer
+    headers = [name for name, _ in columns]
+    content = STREAMERS[renderer.format](headers, export_rows(queryset, columns, prepare=prepare))
+    response = StreamingHttpResponse(
+        (chunk.encode(renderer.charset) for chunk in content),
+        content_type=f'{renderer.media_type}; charset={renderer.charset}',
+    )
+    filename = f'{basename}-{timezone.now():%Y%m%d-%H%M}.{renderer.format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['Cache-Control'] = 'no-store'
+    # Pas de mise en tampon par nginx : les lignes partent dès qu'elles sont lues
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,348 @@
+"""
+Mesures des requêtes HTTP (RequestMetricsMiddleware) et budgets de requêtes SQL.
+
+Pour chaque requête, le middleware mesure :
+- le nombre de requêtes SQL et leur durée (execute_wrapper sur chaque connexion) ;
+- la durée de la vue (chargement et sérialisation des données, jusqu'au rendu) ;
+- la durée du rendu (JSON de DRF, gabarits) ;
+- la durée totale.
+
+Les mesures sont agrégées en histogrammes par vue (nom de la route) et méthode,
+en mémoire dans chaque processus, et exposées au format texte de Prometheus par
+`metrics_view` (personnel ou jeton METRICS_TOKEN) avec les compteurs du cache
+des réponses. Chaque processus expose ses propres mesures : Prometheus les
+agrège à la lecture.
+
+Une requête plus lente que METRICS_SLOW_REQUEST_MS est journalisée avec ses
+requêtes SQL les plus fréquentes (empreintes : valeurs et listes IN
+remplacées). Une vue peut déclarer un budget de requêtes SQL (authentification
+comprise) : attribut `query_budgets = {action: nombre}` d'un viewset, ou
+décorateur `query_budget(nombre)` d'une vue fonction. Un dépassement est
+compté et journalisé ; avec QUERY_BUDGET_STRICT (actif pendant les tests), il
+lève QueryBudgetExceeded et fait échouer le test.
+
+Sous ASGI, les vues asynchrones n'ont que les durées : leurs requêtes SQL
+passent par le thread de sync_to_async, partagé entre les requêtes.
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from django.utils.crypto import constant_time_compare
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .cache import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+# (nom, description, seuils) des histogrammes exposés, par vue et méthode
+HISTOGRAMS = (
+    ('lon_request_duration_seconds', "Durée totale des requêtes", SECONDS_BUCKETS),
+    ('lon_request_view_seconds', "Durée des vues (requêtes SQL et sérialisation)", SECONDS_BUCKETS),
+    ('lon_request_render_seconds', "Durée du rendu des réponses (JSON, gabarits)", SECONDS_BUCKETS),
+    ('lon_request_db_seconds', "Durée cumulée des requêtes SQL", SECONDS_BUCKETS),
+    ('lon_request_queries', "Nombre de requêtes SQL", QUERY_BUCKETS),
+)
+
+# Empreintes SQL : littéraux et listes de paramètres remplacés
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST_RE = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+SPACE_RE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Vue ayant fait plus de requêtes SQL que son budget (QUERY_BUDGET_STRICT)."""
+
+
+def metrics_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+def fingerprint(sql):
+    """Requête SQL sans ses valeurs : `... WHERE id IN (%s, %s)` devient `... WHERE id IN (...)`."""
+    sql = STRING_RE.sub('?', sql)
+    sql = NUMBER_RE.sub('?', sql)
+    sql = IN_LIST_RE.sub('(...)', sql)
+    return SPACE_RE.sub(' ', sql).strip()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histogrammes et compteurs des requêtes, partagés par le processus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+        self._exceeded = {}
+
+    def record(self, view, method, status_code, values, budget_exceeded=False):
+        """`values` : {nom d'histogramme: valeur} (les valeurs absentes ne sont pas observées)."""
+        with self._lock:
+            for name, _, buckets in HISTOGRAMS:
+                if values.get(name) is None:
+                    continue
+                key = (name, view, method)
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = Histogram(buckets)
+                histogram.observe(values[name])
+            key = (view, method, str(status_code))
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if budget_exceeded:
+                self._exceeded[(view, method)] = self._exceeded.get((view, method), 0) + 1
+
+    def histogram(self, name, view, method):
+        with self._lock:
+            return self._histograms.get((name, view, method))
+
+    def totals(self, name):
+        """(somme, nombre d'observations) d'un histogramme, toutes vues confondues."""
+        with self._lock:
+            histograms = [h for (metric, _, _), h in self._histograms.items() if metric == name]
+            return sum(h.sum for h in histograms), sum(h.count for h in histograms)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+            self._exceeded.clear()
+
+    def render(self):
+        """Texte au format d'exposition de Prometheus (version 0.0.4)."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            requests = dict(self._requests)
+            exceeded = dict(self._exceeded)
+        lines = []
+        for name, description, buckets in HISTOGRAMS:
+            lines += [f'# HELP {name} {description}', f'# TYPE {name} histogram']
+            for (metric, view, method), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                labels = f'view="{escape(view)}",method="{method}"'
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{{labels}}} {total}')
+                lines.append(f'{name}_count{{{labels}}} {count}')
+        lines += ['# HELP lon_requests_total Requêtes traitées', '# TYPE lon_requests_total counter']
+        for (view, method, status_code), count in sorted(requests.items()):
+            lines.append(f'lon_requests_total{{view="{escape(view)}",method="{method}",status="{status_code}"}} {count}')
+        lines += [
+            '# HELP lon_query_budget_exceeded_total Requêtes ayant dépassé le budget de requêtes SQL de la vue',
+            '# TYPE lon_query_budget_exceeded_total counter',
+        ]
+        for (view, method), count in sorted(exceeded.items()):
+            lines.append(f'lon_query_budget_exceeded_total{{view="{escape(view)}",method="{method}"}} {count}')
+        lines += ['# HELP lon_cache_requests_total Lectures du cache des réponses', '# TYPE lon_cache_requests_total counter']
+        for (scope, outcome), count in sorted(cache_stats.snapshot().items()):
+            lines.append(f'lon_cache_requests_total{{scope="{escape(scope)}",outcome="{outcome}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def query_budget(queries):
+    """Décorateur d'une vue fonction : budget de requêtes SQL de chaque appel."""
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def view_budget(view_func, method):
+    """Budget de requêtes SQL de la vue pour la méthode HTTP, ou None."""
+    budget = getattr(view_func, 'query_budget', None)
+    if budget is not None:
+        return budget
+    cls = getattr(view_func, 'cls', None)
+    action = getattr(view_func, 'actions', {}).get(method.lower())
+    if cls is None or action is None:
+        return None
+    return getattr(cls, 'query_budgets', {}).get(action)
+
+
+class RequestProbe:
+    """Mesures d'une requête en cours (requêtes SQL, étapes)."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = self.view_ended = self.render_ended = None
+        self.budget = None
+        self.queries = []
+        self.db_seconds = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_seconds += time.perf_counter() - started
+            self.queries.append(sql)
+
+    def recording(self):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(self))
+        return stack
+
+    def rendered(self, response):
+        self.render_ended = time.perf_counter()
+
+    def top_queries(self, limit=5):
+        """Empreintes des requêtes SQL les plus fréquentes : [(empreinte, nombre)]."""
+        return Counter(fingerprint(sql) for sql in self.queries).most_common(limit)
+
+
+class RequestMetricsMiddleware:
+    """
+    Mesure chaque requête (voir le module). À placer en tête de MIDDLEWARE pour
+    compter toutes les requêtes SQL, y compris celles des autres middlewares.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not metrics_enabled():
+            return self.get_response(request)
+        probe = request._metrics_probe = RequestProbe()
+        with probe.recording():
+            response = self.get_response(request)
+        self.finish(request, response, probe)
+        return response
+
+    async def __acall__(self, request):
+        if not metrics_enabled():
+            return await self.get_response(request)
+        probe = request._metrics_probe = RequestProbe()
+        probe.queries = None
+        response = await self.get_response(request)
+        self.finish(request, response, probe)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        probe = getattr(request, '_metrics_probe', None)
+        if probe is not None:
+            probe.view_started = time.perf_counter()
+            probe.budget = view_budget(view_func, request.method)
+        return None
+
+    def process_template_response(self, request, response):
+        # Appelé juste avant le rendu (middleware placé en tête : appelé en dernier)
+        probe = getattr(request, '_metrics_probe', None)
+        if probe is not None:
+            probe.view_ended = time.perf_counter()
+            response.add_post_render_callback(probe.rendered)
+        return response
+
+    def finish(self, request, response, probe):
+        ended = time.perf_counter()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match is not None else '<unmatched>'
+        duration = ended - probe.started
+        values = {'lon_request_duration_seconds': duration}
+        if probe.view_started is not None:
+            values['lon_request_view_seconds'] = (probe.view_ended or ended) - probe.view_started
+        if probe.view_ended is not None and probe.render_ended is not None:
+            values['lon_request_render_seconds'] = probe.render_ended - probe.view_ended
+        exceeded = False
+        if probe.queries is not None:
+            values['lon_request_queries'] = len(probe.queries)
+            values['lon_request_db_seconds'] = probe.db_seconds
+            exceeded = probe.budget is not None and len(probe.queries) > probe.budget
+        registry.record(view, request.method, response.status_code, values, budget_exceeded=exceeded)
+
+        slow_ms = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500)
+        if exceeded or (slow_ms is not None and duration * 1000 >= slow_ms):
+            self.log(request, view, duration, probe, exceeded)
+        if exceeded and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} ({view}) : {len(probe.queries)} requêtes SQL "
+                f"pour un budget de {probe.budget}\n" + format_queries(probe.top_queries(limit=None))
+            )
+
+    def log(self, request, view, duration, probe, exceeded):
+        if probe.queries is None:
+            logger.warning("Requête lente %s %s (%s) : %.0f ms", request.method, request.path, view, duration * 1000)
+            return
+        logger.warning(
+            "%s %s %s (%s) : %.0f ms, %d requêtes SQL (%.0f ms, budget %s)\n%s",
+            "Budget de requêtes dépassé" if exceeded else "Requête lente",
+            request.method, request.path, view, duration * 1000,
+            len(probe.queries), probe.db_seconds * 1000, probe.budget,
+            format_queries(probe.top_queries()),
+        )
+
+
+def format_queries(queries):
+    return '\n'.join(f'  {count} × {sql}' for sql, count in queries)
+
+
+def metrics_user(request):
+    """Utilisateur de la session ou des authentifications de l'API (JWT)."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        return Request(request, authenticators=authenticators).user
+    except APIException:
+        return None
+
+
+def metrics_view(request):
+    """
+    Mesures du processus au format de Prometheus. Réservé au personnel, ou à
+    l'en-tête `Authorization: Bearer <METRICS_TOKEN>` (collecteur).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    allowed = bool(token) and constant_time_compare(header, f'Bearer {token}')
+    if not allowed:
+        user = metrics_user(request)
+        allowed = user is not None and user.is_staff
+    if not allowed:
+        return HttpResponse(status=403)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,103 @@
+"""
+Mixins partagés par les viewsets de l'API.
+"""
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .compact import CompactJSONRenderer, compile_serializer
+
+
+class SparseFieldsetMixin:
+    """
+    Permet au client de restreindre les champs renvoyés avec `?fields=a,b,c`.
+    Les champs non demandés sont retirés du serializer avant la sérialisation,
+    ce qui évite aussi de calculer les champs coûteux (statistiques, imbrications).
+    """
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        """Retourne l'ensemble des champs demandés, ou None si tous sont demandés."""
+        request = getattr(self, 'request', None)
+        if request is None or request.method not in ('GET', 'HEAD'):
+            return None
+        value = request.query_params.get(self.fields_query_param)
+        if not value:
+            return None
+        return {name.strip() for name in value.split(',') if name.strip()}
+
+    def field_requested(self, name):
+        requested = self.get_requested_fields()
+        return requested is None or name in requested
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        requested = self.get_requested_fields()
+        if requested is not None:
+            target = getattr(serializer, 'child', serializer)
+            for name in list(target.fields):
+                if name not in requested:
+                    target.fields.pop(name)
+        return serializer
+
+
+class CompactListMixin:
+    """
+    Sert la liste (`list`) par le serializer compilé de lon/compact.py lorsque
+    `compact_route` figure dans API_COMPACT_LIST_ROUTES : lignes lues par
+    `.values()`, sans instance de modèle, et rendu JSON par orjson s'il est
+    installé. La réponse est identique à celle du serializer ; un serializer qui
+    ne se compile pas est servi par le chemin habituel.
+
+    `compact_computed` déclare les champs lus par une propriété du modèle :
+    {champ: nom de colonne annotée ou Computed}.
+    """
+    compact_route = None
+    compact_computed = {}
+    _compact_plans = {}
+
+    def compact_enabled(self):
+        return (
+            self.compact_route is not None
+            and self.compact_route in getattr(settings, 'API_COMPACT_LIST_ROUTES', ())
+        )
+
+    def get_compact_plan(self):
+        """CompactPlan du serializer de la vue (champs `?fields=` compris), ou None."""
+        serializer = self.get_serializer()
+        key = (type(self), type(serializer), tuple(serializer.fields))
+        try:
+            return self._compact_plans[key]
+        except KeyError:
+            pass
+        plan = self._compact_plans[key] = compile_serializer(serializer, self.compact_computed)
+        return plan
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if getattr(self, 'action', None) != 'list' or not self.compact_enabled():
+            return renderers
+        return [
+            CompactJSONRenderer() if type(renderer) is JSONRenderer else renderer
+            for renderer in renderers
+        ]
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_compact_plan() if self.compact_enabled() else None
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        columns = list(plan.columns)
+        paginator = self.paginator
+        if paginator is not None and hasattr(paginator, 'get_ordering_keys'):
+            # Colonnes du curseur de KeysetPagination
+            for key in paginator.get_ordering_keys(queryset, self):
+                if key.attname not in columns:
+                    columns.append(key.attname)
+        queryset = queryset.values(*columns)
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.serialize(page))
+        return Response(plan.serialize(list(queryset)))
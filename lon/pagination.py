@@ -0,0 +1,276 @@
+"""
+Pagination par curseur (keyset) pour les API.
+
+Contrairement à `CursorPagination` de DRF, qui ne se positionne que sur la
+première clé de tri et complète par un OFFSET, le curseur encode la valeur de
+toutes les clés de tri de la dernière ligne. La page suivante est obtenue par
+un prédicat lexicographique sur ces clés : le coût d'une page profonde est
+donc le même que celui de la première page, à condition qu'un index couvre
+l'ordre de tri.
+
+Deux précautions pour que cet index serve réellement :
+
+- les clés nullables sont triées sur `(clé IS NULL, clé)` plutôt qu'avec
+  NULLS FIRST/LAST, dont le placement par défaut diffère selon la base
+  (SQLite place les NULL en tête en ordre croissant, PostgreSQL en fin) et
+  qu'aucun index SQLite ne peut reproduire. L'index doit suivre la même
+  expression (voir `task_ordering_idx`) ;
+- le prédicat du curseur est précédé d'une borne sur la première clé
+  (`priority <= p AND (...)`), qui se traduit par un parcours d'index par
+  plage au lieu d'une union de recherches suivie d'un tri des lignes
+  restantes.
+"""
+import datetime
+import decimal
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import F, Q
+from django.db.models.lookups import IsNull
+from django.utils.encoding import force_str
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_value(value):
+    """
+    Sérialise une valeur de clé pour le curseur, sans perte de précision
+    (DjangoJSONEncoder tronque les microsecondes, ce qui fausserait la position).
+    """
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (decimal.Decimal, datetime.timedelta)):
+        return str(value)
+    raise TypeError(f'Type non sérialisable dans un curseur : {type(value).__name__}')
+
+
+class OrderingKey:
+    """Une clé de tri : nom (champ ou annotation), sens et champ modèle associé."""
+
+    def __init__(self, name, descending, field):
+        self.name = name
+        self.descending = descending
+        self.field = field
+        self.attname = getattr(field, 'attname', name)
+        self.nullable = getattr(field, 'null', False)
+
+    def reversed(self):
+        return OrderingKey(self.name, not self.descending, self.field)
+
+    def order_by(self, nulls_first):
+        """Expressions de tri de la clé : `(clé IS NULL, clé)` si elle est nullable."""
+        expression = F(self.name)
+        value = expression.desc() if self.descending else expression.asc()
+        if not self.nullable:
+            return [value]
+        is_null = IsNull(expression, True)
+        return [is_null.desc() if nulls_first else is_null.asc(), value]
+
+    def bound(self, value):
+        """Borne large ("pas avant `value`") sur une clé non nullable, ou None."""
+        if self.nullable or value is None:
+            return None
+        return Q(**{f"{self.name}__{'lte' if self.descending else 'gte'}": value})
+
+    def equal(self, value):
+        if value is None:
+            return Q(**{f'{self.name}__isnull': True})
+        return Q(**{self.name: value})
+
+    def after(self, value, nulls_first):
+        """Prédicat "strictement après `value`" pour cette clé, ou None si impossible."""
+        lookup = 'lt' if self.descending else 'gt'
+        if value is None:
+            # Les NULL sont en tête : toute valeur non nulle vient après
+            return Q(**{f'{self.name}__isnull': False}) if nulls_first else None
+        condition = Q(**{f'{self.name}__{lookup}': value})
+        if self.nullable and not nulls_first:
+            condition |= Q(**{f'{self.name}__isnull': True})
+        return condition
+
+    def to_python(self, value):
+        if value is None or self.field is None:
+            return value
+        return self.field.to_python(value)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Pagination keyset sur l'ordre `ordering` de la vue (ou `Meta.ordering` du
+    modèle), complété par la clé primaire pour garantir un ordre total.
+    Les valeurs NULL sont placées en fin de liste dans le sens "suivant".
+    """
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Curseur invalide'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.prepare_queryset(queryset, request, view)
+        return self.set_page(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """Variante asynchrone de `paginate_queryset` (vues de lecture async)."""
+        queryset = self.prepare_queryset(queryset, request, view)
+        rows = [row async for row in queryset[:self.page_size + 1].aiterator(chunk_size=self.page_size + 1)]
+        return self.set_page(rows)
+
+    def prepare_queryset(self, queryset, request, view=None):
+        """Applique le tri et le prédicat du curseur (sans exécuter la requête)."""
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.keys = self.get_ordering_keys(queryset, view)
+
+        values, self.reverse = self.decode_cursor(request)
+        keys = [key.reversed() for key in self.keys] if self.reverse else self.keys
+        # En sens inverse, l'ordre des NULL est lui aussi inversé
+        nulls_first = self.reverse
+
+        queryset = queryset.order_by(*self.get_order_by(keys, nulls_first))
+        if values is not None:
+            queryset = queryset.filter(self.build_predicate(keys, values, nulls_first))
+        self.has_cursor = values is not None
+        return queryset
+
+    @staticmethod
+    def get_order_by(keys, nulls_first):
+        return [expression for key in keys for expression in key.order_by(nulls_first)]
+
+    def set_page(self, results):
+        self.has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def get_ordering_keys(self, queryset, view):
+        ordering = getattr(view, 'ordering', None) or queryset.model._meta.ordering or []
+        ordering = [name for name in ordering if isinstance(name, str)]
+        if not any(name.lstrip('-') in ('pk', 'id') for name in ordering):
+            ordering = list(ordering) + ['-pk']
+
+        keys = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            keys.append(OrderingKey(name, descending, self.resolve_field(queryset, name)))
+        return keys
+
+    @staticmethod
+    def resolve_field(queryset, name):
+        model = queryset.model
+        if name == 'pk':
+            return model._meta.pk
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+    @staticmethod
+    def build_predicate(keys, values, nulls_first):
+        predicate = None
+        prefix = Q()
+        for key, value in zip(keys, values):
+            after = key.after(value, nulls_first)
+            if after is not None:
+                condition = prefix & after
+                predicate = condition if predicate is None else predicate | condition
+            prefix &= key.equal(value)
+        # Curseur positionné sur la dernière ligne possible : page vide
+        if predicate is None:
+            return Q(pk__in=[])
+        # Borne redondante sur la première clé : parcours de l'index par plage
+        bound = keys[0].bound(values[0])
+        return predicate if bound is None else bound & predicate
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            raw_values = payload['v']
+            if len(raw_values) != len(self.keys):
+                raise ValueError
+            values = [key.to_python(value) for key, value in zip(self.keys, raw_values)]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+        return values, bool(payload.get('r'))
+
+    def encode_cursor(self, row, reverse):
+        values = []
+        for key in self.keys:
+            # Instance de modèle, ou ligne de `.values()` (listes compactes)
+            values.append(row[key.attname] if isinstance(row, dict) else getattr(row, key.attname))
+        payload = {'v': values}
+        if reverse:
+            payload['r'] = 1
+        encoded = b64encode(json.dumps(payload, default=encode_value).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.page:
+            return None
+        if self.reverse or self.has_more:
+            return self.encode_cursor(self.page[-1], reverse=False)
+        return None
+
+    def get_previous_link(self):
+        if not self.page:
+            return None
+        if (self.reverse and self.has_more) or (not self.reverse and self.has_cursor):
+            return self.encode_cursor(self.page[0], reverse=True)
+        return None
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_schema_operation_parameters(self, view):
+        return [
+            {
+                'name': self.cursor_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str('Curseur de pagination'),
+                'schema': {'type': 'string'},
+            },
+            {
+                'name': self.page_size_query_param,
+                'required': False,
+                'in': 'query',
+                'description': force_str('Nombre de résultats par page'),
+                'schema': {'type': 'integer'},
+            },
+        ]
@@ -0,0 +1,29 @@
+"""
+Outils partagés par les serializers de l'API.
+"""
+
+
+class SharedRepresentationMixin:
+    """
+    Serializer imbriqué dont la représentation d'un objet n'est calculée qu'une
+    fois par réponse : un utilisateur membre de plusieurs projets de la page est
+    sérialisé une seule fois, les projets suivants réutilisent le même
+    dictionnaire. Le cache vit dans le contexte du serializer racine, donc le
+    temps d'une réponse.
+    """
+    shared_cache_key = '_shared_representations'
+
+    def to_representation(self, instance):
+        shared = self.context.setdefault(self.shared_cache_key, {})
+        key = (type(self), instance.pk)
+        representation = shared.get(key)
+        if representation is None:
+            representation = shared[key] = super().to_representation(instance)
+        return representation
+
+
+def model_field_names(serializer_class):
+    """Champs du modèle lus par le serializer, pour restreindre un préchargement (`only`)."""
+    model = serializer_class.Meta.model
+    names = {name for field in model._meta.concrete_fields for name in (field.name, field.attname)}
+    return [name for name in serializer_class.Meta.fields if name in names]
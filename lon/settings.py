@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -62,6 +63,8 @@ SIMPLE_JWT = {
 }
 
 MIDDLEWARE = [
+    # En tête : mesure toute la requête, requêtes SQL des autres middlewares comprises
+    'lon.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -104,6 +107,97 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+# Le backend mémoire locale évince les entrées les moins récemment utilisées
+# au-delà de MAX_ENTRIES (un tiers des entrées à chaque éviction)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'lon-default',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+            'CULL_FREQUENCY': 3,
+        },
+    }
+}
+
+# Cache des réponses de l'API (voir lon/cache.py). À n'activer qu'avec un cache
+# partagé par tous les workers (Redis, Memcached) : pas avec LocMemCache
+API_CACHE_ENABLED = False
+API_CACHE_ALIAS = 'default'
+API_CACHE_TIMEOUT = 300
+
+# Durée de vie (secondes) des compteurs de notifications non lues (voir
+# accounts/notifications.py) ; comme le cache des réponses, suppose un cache partagé
+NOTIFICATION_UNREAD_TIMEOUT = 3600
+
+# Flux de modifications des tâches (/api/tasks/changes/) : fenêtre relue à chaque
+# synchronisation (transactions validées en retard), conservation des suppressions
+TASK_CHANGES_GRACE_SECONDS = 60
+TASK_TOMBSTONE_RETENTION_DAYS = 30
+
+# Diffusion temps réel (voir lon/events.py). Avec plusieurs workers ASGI, utiliser
+# 'lon.events.CachePollingBackend' avec un cache partagé entre les processus et
+# dont l'incrément est atomique (Redis, Memcached ; pas FileBasedCache).
+REALTIME_BROKER_BACKEND = {
+    'BACKEND': 'lon.events.InMemoryBackend',
+    'OPTIONS': {},
+}
+REALTIME_MAX_PENDING = 500
+REALTIME_HEARTBEAT_SECONDS = 15
+REALTIME_COALESCE_SECONDS = 0.05
+
+# Exports en flux (/api/tasks/export/, /api/projects/export/, voir lon/export.py) :
+# lignes lues par aller-retour avec la base
+EXPORT_CHUNK_SIZE = 2000
+
+# Documents des tâches : taille maximale, envoi par morceaux (voir tasks/uploads.py)
+TASK_DOCUMENT_MAX_SIZE = 10 * 1024 * 1024
+DOCUMENT_UPLOAD_MAX_CHUNK_SIZE = 5 * 1024 * 1024
+DOCUMENT_UPLOAD_EXPIRY_HOURS = 24
+# Téléchargement (/api/documents/<id>/download/, voir tasks/downloads.py) : '' pour
+# servir le fichier depuis Django, 'x-accel-redirect' (nginx) ou 'x-sendfile'
+# (Apache) pour le confier au serveur web frontal
+DOCUMENT_SERVE_BACKEND = ''
+DOCUMENT_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+DOCUMENT_DOWNLOAD_BLOCK_SIZE = 512 * 1024
+
+# Aperçus des documents, générés par la commande preview_worker (voir
+# tasks/previews.py) : taille en pixels, processus de rendu, nouvelles tentatives
+# (délai en secondes doublé à chaque fois), taille maximale du cache sur disque
+DOCUMENT_PREVIEW_SIZE = 320
+DOCUMENT_PREVIEW_PROCESSES = 2
+DOCUMENT_PREVIEW_MAX_ATTEMPTS = 5
+DOCUMENT_PREVIEW_RETRY_DELAY = 30
+DOCUMENT_PREVIEW_CACHE_MAX_SIZE = 500 * 1024 * 1024
+
+# Analyse périodique des tâches passées en retard (commande scan_overdue_tasks,
+# voir tasks/overdue.py) : intervalle et durée du bail en secondes, tâches par lot
+OVERDUE_SCAN_INTERVAL = 3600
+OVERDUE_SCAN_LEASE_SECONDS = 300
+OVERDUE_SCAN_CHUNK_SIZE = 2000
+
+# Routes dont les lectures (list / retrieve) sont servies par des vues asynchrones
+# sous ASGI (voir lon/async_views.py) : 'tasks', 'projects', 'notifications'
+API_ASYNC_READ_ROUTES = ()
+
+# Routes dont la liste est servie par le serializer compilé et le rendu orjson
+# (voir lon/compact.py et CompactListMixin) : 'tasks', 'projects'
+API_COMPACT_LIST_ROUTES = ()
+
+# Mesures des requêtes (voir lon/metrics.py) : seuil de journalisation des
+# requêtes lentes en ms (None : aucune), jeton du collecteur Prometheus pour
+# /metrics/ (sinon réservé au personnel), dépassement de budget de requêtes
+# SQL bloquant (pendant les tests)
+METRICS_ENABLED = True
+METRICS_SLOW_REQUEST_MS = 500
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+QUERY_BUDGET_STRICT = sys.argv[1:2] == ['test']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
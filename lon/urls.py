@@ -24,16 +24,24 @@ from django.conf.urls.static import static
 from rest_framework.routers import DefaultRouter
 from accounts.views import UserViewSet
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from tasks.views import TaskViewSet  # Ajoutez cette ligne
+from tasks.views import DocumentUploadViewSet, TaskViewSet  # Ajoutez cette ligne
+from tasks.downloads import document_download, document_preview
+from lon.async_views import async_read_urls
+from lon.metrics import metrics_view
 
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 router.register(r'tasks', TaskViewSet, basename='task')
+router.register(r'document-uploads', DocumentUploadViewSet, basename='document-upload')
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', metrics_view, name='metrics'),
+    *async_read_urls('tasks', 'api/tasks/', TaskViewSet, {'list': 'tasks.list'}),
+    path('api/documents/<int:pk>/download/', document_download, name='document-download'),
+    path('api/documents/<int:pk>/preview/', document_preview, name='document-preview'),
     path('api/', include(router.urls)),
     path('accounts/', include('accounts.urls')),
     path('api/projects/', include('projects.urls')),
@@ -0,0 +1,178 @@
+"""
+Maintenance des compteurs de tâches dénormalisés (ProjectTaskCounter).
+
+Les compteurs sont mis à jour de façon incrémentale par des UPDATE atomiques
+(expressions F) à chaque création, modification de statut ou suppression de
+tâche. La date de fin ouverte la plus proche ne peut qu'être abaissée de
+façon incrémentale ; lorsqu'elle peut augmenter (tâche terminée, supprimée ou
+replanifiée), elle est recalculée pour le seul projet concerné.
+"""
+from django.db.models import Count, F, Min, Q
+
+from .models import OPEN_STATUSES, Project, ProjectTaskCounter
+
+STATUS_FIELDS = ('todo', 'in_progress', 'review', 'done')
+
+
+def _open_end_date(status, end_date):
+    """Date de fin prise en compte pour le retard (None si la tâche est terminée)."""
+    return end_date if status in OPEN_STATUSES else None
+
+
+def compute_counters(project_ids=None):
+    """
+    Calcule les compteurs à partir des tâches, en deux requêtes groupées.
+    Retourne un dictionnaire {project_id: ProjectTaskCounter} (non enregistrés).
+    """
+    from tasks.models import Task
+
+    projects = Project.objects.all()
+    tasks = Task.objects.order_by()
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+        tasks = tasks.filter(project_id__in=project_ids)
+
+    counters = {
+        project_id: ProjectTaskCounter(project_id=project_id)
+        for project_id in projects.values_list('pk', flat=True)
+    }
+    for row in tasks.values('project_id', 'status').annotate(count=Count('pk')):
+        counter = counters.get(row['project_id'])
+        if counter is not None:
+            setattr(counter, row['status'], row['count'])
+    earliest = tasks.filter(status__in=OPEN_STATUSES, end_date__isnull=False).values(
+        'project_id'
+    ).annotate(earliest=Min('end_date'))
+    for row in earliest:
+        counter = counters.get(row['project_id'])
+        if counter is not None:
+            counter.earliest_open_end_date = row['earliest']
+    return counters
+
+
+def recompute_counters(project_ids=None):
+    """Recalcule et enregistre les compteurs (tous les projets, ou ceux donnés)."""
+    counters = list(compute_counters(project_ids).values())
+    ProjectTaskCounter.objects.bulk_create(
+        counters,
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['project'],
+        update_fields=[*STATUS_FIELDS, 'earliest_open_end_date', 'updated_at'],
+    )
+    return counters
+
+
+def check_counters(project_ids=None):
+    """
+    Compare les compteurs enregistrés aux valeurs recalculées.
+    Retourne la liste des (project_id, attendu, enregistré) incohérents.
+    """
+    expected = compute_counters(project_ids)
+    stored = ProjectTaskCounter.objects.in_bulk(list(expected))
+    fields = (*STATUS_FIELDS, 'earliest_open_end_date')
+    mismatches = []
+    for project_id, counter in expected.items():
+        current = stored.get(project_id)
+        expected_values = {name: getattr(counter, name) for name in fields}
+        current_values = {name: getattr(current, name) for name in fields} if current else None
+        if expected_values != current_values:
+            mismatches.append((project_id, expected_values, current_values))
+    return mismatches
+
+
+def _refresh_earliest(project_id):
+    from tasks.models import Task
+
+    earliest = Task.objects.filter(
+        project_id=project_id,
+        status__in=OPEN_STATUSES,
+        end_date__isnull=False
+    ).order_by().aggregate(earliest=Min('end_date'))['earliest']
+    ProjectTaskCounter.objects.filter(project_id=project_id).update(earliest_open_end_date=earliest)
+
+
+def _lower_earliest(project_id, end_date):
+    ProjectTaskCounter.objects.filter(project_id=project_id).filter(
+        Q(earliest_open_end_date__isnull=True) | Q(earliest_open_end_date__gt=end_date)
+    ).update(earliest_open_end_date=end_date)
+
+
+def apply_delta(project_id, removed=None, added=None):
+    """
+    Applique une transition à la ligne de compteurs d'un projet.
+    `removed` et `added` sont des couples (statut, date de fin) : l'état quitté et
+    l'état atteint par une tâche (None pour une création ou une suppression).
+    """
+    changes = {}
+    if removed is not None:
+        changes[removed[0]] = changes.get(removed[0], 0) - 1
+    if added is not None:
+        changes[added[0]] = changes.get(added[0], 0) + 1
+    changes = {status: delta for status, delta in changes.items() if delta}
+
+    if changes:
+        updated = ProjectTaskCounter.objects.filter(project_id=project_id).update(**{
+            status: F(status) + delta for status, delta in changes.items()
+        })
+        if not updated:
+            # Pas encore de compteurs pour ce projet : on les construit à partir des tâches
+            recompute_counters([project_id])
+            return
+
+    old_end = _open_end_date(*removed) if removed else None
+    new_end = _open_end_date(*added) if added else None
+    if old_end == new_end:
+        return
+    if old_end is not None:
+        # La date quittée était peut-être la plus proche : recalcul pour ce projet
+        _refresh_earliest(project_id)
+    elif new_end is not None:
+        _lower_earliest(project_id, new_end)
+
+
+def task_saved(task, previous):
+    """
+    Met à jour les compteurs après l'enregistrement d'une tâche.
+    `previous` est l'état chargé depuis la base (None pour une création).
+    """
+    current = (task.status, task.end_date)
+    if previous is None:
+        apply_delta(task.project_id, added=current)
+        return
+
+    old_state = (previous['status'], previous['end_date'])
+    if previous['project_id'] != task.project_id:
+        apply_delta(previous['project_id'], removed=old_state)
+        apply_delta(task.project_id, added=current)
+    elif old_state != current:
+        apply_delta(task.project_id, removed=old_state, added=current)
+
+
+def tasks_created(tasks):
+    """
+    Ajoute des tâches créées en masse aux compteurs : une mise à jour par projet
+    (incréments groupés par statut, puis date de fin ouverte la plus proche).
+    """
+    by_project = {}
+    for task in tasks:
+        changes, earliest = by_project.get(task.project_id, ({}, None))
+        changes[task.status] = changes.get(task.status, 0) + 1
+        end_date = _open_end_date(task.status, task.end_date)
+        if end_date is not None and (earliest is None or end_date < earliest):
+            earliest = end_date
+        by_project[task.project_id] = (changes, earliest)
+
+    for project_id, (changes, earliest) in by_project.items():
+        updated = ProjectTaskCounter.objects.filter(project_id=project_id).update(**{
+            status: F(status) + count for status, count in changes.items()
+        })
+        if not updated:
+            recompute_counters([project_id])
+        elif earliest is not None:
+            _lower_earliest(project_id, earliest)
+
+
+def task_deleted(task, previous):
+    state = previous or {'status': task.status, 'end_date': task.end_date, 'project_id': task.project_id}
+    apply_delta(state['project_id'], removed=(state['status'], state['end_date']))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.template import Context, Template
+from django.template.loader import render_to_string
+
+from lon.benchmarking import measure, seed_tasks
+from projects.models import Project
+from projects.pages import get_detail_project, project_detail_context
+from tasks.models import Task
+from tasks.pages import kanban_context
+
+# Anciens fragments des gabarits, pour comparaison : toutes les tâches du projet
+# chargées pour en afficher cinq, statistiques relues à chaque utilisation
+LEGACY_PROJECT_TEMPLATE = Template("""
+{{ project.progress }} {{ project.progress }} {{ project.progress }}
+{{ project.task_statistics.total }} {{ project.task_statistics.done }}
+{% if project.is_delayed %}retard{% endif %}
+{{ project.task_statistics.todo }} {{ project.task_statistics.in_progress }}
+{{ project.task_statistics.review }} {{ project.task_statistics.done }}
+{% for task in project.tasks.all|dictsortreversed:"end_date"|slice:":5" %}
+{{ task.title }} {{ task.end_date|date:"d/m/Y" }} {% if task.is_overdue %}retard{% endif %}
+{% endfor %}
+""")
+
+LEGACY_KANBAN_TEMPLATE = Template("""
+{% for column in columns %}{% for task in column %}
+{{ task.title }} {{ task.project.name }} {{ task.get_priority_display }} {{ task.assigned_to.get_full_name }}
+{% if task.is_overdue %}retard{% endif %}
+{% endfor %}{% endfor %}
+""")
+
+
+class Command(BaseCommand):
+    help = "Mesure le coût de rendu de la fiche projet et du kanban selon la taille du projet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[100, 2000, 20000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for index, size in enumerate(options['sizes']):
+                data = seed_tasks(projects=1, tasks=size, users=20, seed=1000 + index)
+                project = data['projects'][0]
+                user = Project.objects.select_related('manager').get(pk=project.pk).manager
+                self.report(size, project.pk, user, options['repeat'])
+            transaction.set_rollback(True)
+
+    def report(self, size, project_id, user, repeat):
+        def legacy_detail():
+            project = Project.objects.get(pk=project_id)
+            LEGACY_PROJECT_TEMPLATE.render(Context({'project': project}))
+
+        def detail():
+            context = project_detail_context(get_detail_project(project_id))
+            render_to_string('projects/_project_tasks.html', context)
+
+        def legacy_kanban():
+            tasks = Task.objects.visible_to(user).filter(project_id=project_id).select_related(
+                'project', 'assigned_to'
+            )
+            columns = {code: [] for code, _ in Task.STATUS_CHOICES}
+            for task in tasks:
+                columns[task.status].append(task)
+            LEGACY_KANBAN_TEMPLATE.render(Context({'columns': columns.values()}))
+
+        def kanban():
+            project = Project.objects.get(pk=project_id)
+            render_to_string('tasks/_kanban_board.html', kanban_context(user, project))
+
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Projet de {size} tâches"))
+        for label, func in [
+            ('fiche projet, avant', legacy_detail),
+            ('fiche projet, après', detail),
+            ('kanban, avant', legacy_kanban),
+            ('kanban, après', kanban),
+        ]:
+            result = measure(func, repeat=repeat)
+            self.stdout.write(
+                f"{label:>20} : {result['queries']} requêtes, "
+                f"médiane {result['median_ms']} ms, min {result['min_ms']} ms"
+            )
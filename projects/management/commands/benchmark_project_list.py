@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from accounts.serializers import UserSerializer
+from clients.serializers import ClientSerializer
+from lon.benchmarking import measure, seed_tasks
+from projects.serializers import ProjectSerializer
+from projects.views import ProjectViewSet
+
+
+class UnsharedProjectSerializer(ProjectSerializer):
+    """Imbrications sans partage des représentations, pour comparaison."""
+    manager = UserSerializer(read_only=True)
+    team_members = UserSerializer(many=True, read_only=True)
+    client_details = ClientSerializer(source='client', read_only=True)
+
+
+class UnsharedProjectViewSet(ProjectViewSet):
+    def get_serializer_class(self):
+        return UnsharedProjectSerializer
+
+
+class Command(BaseCommand):
+    help = "Mesure les requêtes et la latence de la liste des projets (équipes imbriquées)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=500)
+        parser.add_argument('--members', type=int, default=20)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(), override_settings(API_CACHE_ENABLED=False):
+            data = seed_tasks(
+                projects=options['projects'], tasks=options['projects'] * 10,
+                users=options['users'], members_per_project=options['members'],
+            )
+            user = data['users'][0]
+            for project in data['projects']:
+                project.team_members.add(user)
+
+            factory = APIRequestFactory()
+
+            def list_projects(viewset):
+                view = viewset.as_view({'get': 'list'})
+
+                def run():
+                    request = factory.get('/api/projects/', {'page_size': options['projects']})
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    assert len(response.data['results']) == options['projects']
+                return run
+
+            for label, func in (
+                ('représentations partagées', list_projects(ProjectViewSet)),
+                ('sans partage', list_projects(UnsharedProjectViewSet)),
+            ):
+                result = measure(func, repeat=options['repeat'])
+                self.stdout.write(
+                    f"{label:>26} : {result['queries']} requêtes, "
+                    f"médiane {result['median_ms']} ms, min {result['min_ms']} ms"
+                )
+            transaction.set_rollback(True)
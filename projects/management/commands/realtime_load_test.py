@@ -0,0 +1,151 @@
+import asyncio
+import resource
+import time
+import tracemalloc
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from clients.models import Client
+from lon.events import get_broker
+from projects.models import Project
+from tasks.models import Task
+
+
+class Connection:
+    """Client SSE simulé, branché directement sur l'application ASGI (sans socket)."""
+
+    def __init__(self, application, path, token):
+        self.application = application
+        self.scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0'},
+            'http_version': '1.1',
+            'method': 'GET',
+            'scheme': 'http',
+            'path': path,
+            'raw_path': path.encode(),
+            'query_string': b'',
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+            'client': ('127.0.0.1', 0),
+            'server': ('localhost', 80),
+        }
+        self.status = None
+        self.chunks = 0
+        self.events = 0
+        self.connected = asyncio.Event()
+        self.closed = asyncio.Event()
+        self.request_sent = False
+
+    async def receive(self):
+        if not self.request_sent:
+            self.request_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await self.closed.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message):
+        if message['type'] == 'http.response.start':
+            self.status = message['status']
+        elif message['type'] == 'http.response.body':
+            body = message.get('body', b'')
+            if body:
+                self.chunks += 1
+                self.events += body.count(b'event: ')
+            self.connected.set()
+
+    async def run(self):
+        await self.application(self.scope, self.receive, self.send)
+
+
+class Command(BaseCommand):
+    help = "Ouvre de nombreuses connexions SSE inactives dans un seul worker et mesure la mémoire par connexion"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=5000)
+        parser.add_argument('--tasks', type=int, default=20)
+        parser.add_argument('--updates', type=int, default=5, help="Modifications par tâche pendant la rafale")
+
+    def handle(self, *args, **options):
+        user, project, tasks = self.setup_data(options['tasks'])
+        try:
+            asyncio.run(self.run(user, project, tasks, options))
+        finally:
+            Task.objects.filter(project=project).delete()
+            client = project.client
+            project.delete()
+            client.delete()
+            user.delete()
+
+    def setup_data(self, task_count):
+        stamp = int(time.time() * 1000)
+        user = User.objects.create_user(username=f'realtime{stamp}', password=None)
+        today = timezone.now().date()
+        project = Project.objects.create(
+            name=f'Temps réel {stamp}',
+            client=Client.objects.create(name=f'Temps réel {stamp}'),
+            location='Abidjan',
+            start_date=today,
+            end_date=today + timedelta(days=30),
+            budget=1000,
+            manager=user,
+        )
+        tasks = Task.objects.bulk_create([
+            Task(title=f'Tâche {index}', project=project) for index in range(task_count)
+        ])
+        return user, project, tasks
+
+    async def run(self, user, project, tasks, options):
+        application = get_asgi_application()
+        token = str(AccessToken.for_user(user))
+        path = f'/api/projects/{project.pk}/events/'
+        broker = get_broker()
+
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        connections = [Connection(application, path, token) for _ in range(options['connections'])]
+        runners = [asyncio.create_task(connection.run()) for connection in connections]
+        await asyncio.gather(*(connection.connected.wait() for connection in connections))
+        elapsed = time.perf_counter() - start
+
+        statuses = {connection.status for connection in connections}
+        snapshot = tracemalloc.take_snapshot()
+        allocated = sum(stat.size_diff for stat in snapshot.compare_to(baseline, 'filename'))
+        tracemalloc.stop()
+        self.stdout.write(
+            f"{len(connections)} connexions ouvertes en {elapsed:.1f} s (statuts {sorted(statuses)}), "
+            f"{broker.backend.subscriber_count()} abonnements"
+        )
+        self.stdout.write(
+            f"Mémoire Python : {allocated / 1024 / 1024:.1f} Mo, "
+            f"{allocated / len(connections) / 1024:.1f} Ko par connexion ; "
+            f"RSS max du processus : {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} Mo"
+        )
+
+        # Rafale : plusieurs modifications de chaque tâche, fusionnées par connexion
+        def burst():
+            for _ in range(options['updates']):
+                for task in tasks:
+                    task.title = f'{task.title}.'
+                    task.save(update_fields=['title', 'updated_at'])
+
+        start = time.perf_counter()
+        await sync_to_async(burst)()
+        await asyncio.sleep(0.5)
+        elapsed = time.perf_counter() - start
+        received = [connection.events for connection in connections]
+        self.stdout.write(
+            f"Rafale de {options['updates'] * len(tasks)} modifications : "
+            f"{min(received)} à {max(received)} événements reçus par connexion en {elapsed:.1f} s"
+        )
+
+        for connection in connections:
+            connection.closed.set()
+        await asyncio.gather(*runners, return_exceptions=True)
+        self.stdout.write(f"Après déconnexion : {broker.backend.subscriber_count()} abonnement(s)")
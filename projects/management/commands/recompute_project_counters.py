@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from projects.counters import check_counters, recompute_counters
+
+
+class Command(BaseCommand):
+    help = "Recalcule les compteurs de tâches dénormalisés des projets, ou vérifie leur cohérence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_ids', nargs='*', type=int, help="Projets à traiter (tous par défaut)")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Vérifie les compteurs sans les modifier (code de sortie non nul si incohérence)"
+        )
+
+    def handle(self, *args, **options):
+        project_ids = options['project_ids'] or None
+
+        if options['check']:
+            mismatches = check_counters(project_ids)
+            for project_id, expected, stored in mismatches:
+                self.stdout.write(self.style.WARNING(
+                    f"Projet {project_id} : attendu {expected}, enregistré {stored}"
+                ))
+            if mismatches:
+                raise CommandError(f"{len(mismatches)} projet(s) avec des compteurs incohérents")
+            self.stdout.write(self.style.SUCCESS("Compteurs cohérents"))
+            return
+
+        with transaction.atomic():
+            counters = recompute_counters(project_ids)
+        self.stdout.write(self.style.SUCCESS(f"{len(counters)} projet(s) recalculé(s)"))
@@ -1,8 +1,108 @@
 from django.db import models
+from django.db.models import Count, Min, Q
 from django.conf import settings
 from django.utils import timezone
 from clients.models import Client
 
+
+# Pondération des statuts pour le calcul de la progression
+STATUS_WEIGHTS = {
+    'done': 1.0,
+    'review': 0.75,
+    'in_progress': 0.5,
+    'todo': 0.0
+}
+
+# Statuts considérés comme "ouverts" (tâche non terminée)
+OPEN_STATUSES = ['todo', 'in_progress', 'review']
+
+
+class ProjectQuerySet(models.QuerySet):
+    def with_task_stats(self):
+        """
+        Annote chaque projet avec les compteurs de tâches par statut et l'indicateur
+        de retard, calculés en une seule requête groupée (agrégation conditionnelle).
+        """
+        today = timezone.now().date()
+        return self.annotate(
+            stats_total=Count('tasks'),
+            stats_todo=Count('tasks', filter=Q(tasks__status='todo')),
+            stats_in_progress=Count('tasks', filter=Q(tasks__status='in_progress')),
+            stats_review=Count('tasks', filter=Q(tasks__status='review')),
+            stats_done=Count('tasks', filter=Q(tasks__status='done')),
+            stats_delayed=Count('tasks', filter=Q(
+                tasks__end_date__lt=today,
+                tasks__status__in=OPEN_STATUSES
+            )),
+        )
+
+    def with_task_counters(self):
+        """
+        Joint la ligne de compteurs dénormalisés (ProjectTaskCounter) de chaque projet :
+        les statistiques, la progression et le retard se lisent alors sans agrégation.
+        Pour une page de projets, `attach_missing_task_stats` complète ceux qui
+        n'ont pas encore de ligne.
+        """
+        return self.select_related('task_counter')
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Crée aussi les lignes de compteurs, que bulk_create n'obtient pas de post_save."""
+        projects = super().bulk_create(objs, *args, **kwargs)
+        ProjectTaskCounter.objects.bulk_create(
+            [ProjectTaskCounter(project_id=project.pk) for project in projects if project.pk is not None],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        return projects
+
+
+def task_counter_aggregates(prefix=''):
+    """
+    Agrégations donnant les colonnes de ProjectTaskCounter ; `prefix` est le
+    chemin vers les tâches (`'tasks__'` depuis Project, vide depuis `project.tasks`).
+    """
+    return {
+        'todo': Count(f'{prefix}pk', filter=Q(**{f'{prefix}status': 'todo'})),
+        'in_progress': Count(f'{prefix}pk', filter=Q(**{f'{prefix}status': 'in_progress'})),
+        'review': Count(f'{prefix}pk', filter=Q(**{f'{prefix}status': 'review'})),
+        'done': Count(f'{prefix}pk', filter=Q(**{f'{prefix}status': 'done'})),
+        'earliest_open_end_date': Min(f'{prefix}end_date', filter=Q(**{f'{prefix}status__in': OPEN_STATUSES})),
+    }
+
+
+# Colonnes `.values()` des compteurs, lues par la liste compacte et l'export
+COUNTER_COLUMNS = tuple(f'task_counter__{name}' for name in task_counter_aggregates())
+
+
+def attach_missing_task_stats(projects):
+    """
+    Calcule en une requête groupée les compteurs des projets d'une page qui n'ont
+    pas de ligne ProjectTaskCounter (données antérieures aux compteurs : voir la
+    commande recompute_project_counters), sans les enregistrer :
+    - instances chargées par `with_task_counters` : ligne de compteurs en cache ;
+    - lignes `.values()` (liste compacte, export) : colonnes `task_counter__...`.
+    """
+    instances = {}
+    rows = {}
+    for project in projects:
+        if isinstance(project, Project):
+            if Project.task_counter.is_cached(project) and project._state.fields_cache['task_counter'] is None:
+                instances[project.pk] = project
+        elif COUNTER_COLUMNS[0] in project and project[COUNTER_COLUMNS[0]] is None:
+            rows.setdefault(project['id'], []).append(project)
+    if not instances and not rows:
+        return
+    counters = Project.objects.filter(pk__in=[*instances, *rows]).order_by().values('pk').annotate(
+        **task_counter_aggregates('tasks__')
+    )
+    for values in counters:
+        pk = values.pop('pk')
+        if pk in instances:
+            instances[pk]._state.fields_cache['task_counter'] = ProjectTaskCounter(project_id=pk, **values)
+        for row in rows.get(pk, ()):
+            row.update({f'task_counter__{name}': value for name, value in values.items()})
+
+
 class Project(models.Model):
     STATUS_CHOICES = [
         ('NEW', 'Nouveau'),
@@ -43,23 +143,61 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = ProjectQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Projet"
         verbose_name_plural = "Projets"
         ordering = ['-created_at']
+        indexes = [
+            # Couvre l'ordre par défaut et la pagination par curseur (-created_at, -id)
+            models.Index(fields=['-created_at', '-id'], name='project_ordering_idx'),
+        ]
 
     def __str__(self):
         return self.name
 
+    def _get_task_counter(self):
+        """
+        Retourne la ligne de compteurs du projet. Si elle n'existe pas encore, les
+        compteurs sont calculés en une requête d'agrégation et gardés sur l'instance
+        (non enregistrés) pour les autres propriétés.
+        """
+        try:
+            return self.task_counter
+        except ProjectTaskCounter.DoesNotExist:
+            pass
+        counter = ProjectTaskCounter(project_id=self.pk, **self.tasks.aggregate(**task_counter_aggregates()))
+        self._state.fields_cache['task_counter'] = counter
+        return counter
+
+    def _task_counts(self):
+        """
+        Retourne les compteurs de tâches par statut.
+        Utilise les valeurs annotées par `with_task_stats()`, sinon la ligne de
+        compteurs dénormalisés (calculée si elle manque).
+        """
+        if hasattr(self, 'stats_total'):
+            return {
+                'total': self.stats_total,
+                'todo': self.stats_todo,
+                'in_progress': self.stats_in_progress,
+                'review': self.stats_review,
+                'done': self.stats_done,
+                'delayed': self.stats_delayed,
+            }
+        return self._get_task_counter().as_counts()
+
     @property
     def task_statistics(self):
         """Retourne les statistiques des tâches du projet"""
+        counts = self._task_counts()
         stats = {
-            'total': self.tasks.count(),
-            'todo': self.tasks.filter(status='todo').count(),
-            'in_progress': self.tasks.filter(status='in_progress').count(),
-            'review': self.tasks.filter(status='review').count(),
-            'done': self.tasks.filter(status='done').count()
+            'total': counts['total'],
+            'todo': counts['todo'],
+            'in_progress': counts['in_progress'],
+            'review': counts['review'],
+            'done': counts['done']
         }
         stats['completion_rate'] = (stats['done'] / stats['total'] * 100) if stats['total'] > 0 else 0
         return stats
@@ -67,27 +205,72 @@ class Project(models.Model):
     @property
     def is_delayed(self):
         """Vérifie si le projet a des tâches en retard"""
-        return self.tasks.filter(end_date__lt=timezone.now().date()).exclude(status='done').exists()
+        if hasattr(self, 'stats_delayed'):
+            return self.stats_delayed > 0
+        return self._get_task_counter().is_delayed
 
     @property
     def progress(self):
         """Calcule la progression globale du projet"""
-        total_tasks = self.tasks.count()
+        counts = self._task_counts()
+        total_tasks = counts['total']
         if total_tasks == 0:
             return 0
-        
-        # Pondération des statuts
-        weights = {
-            'done': 1.0,
-            'review': 0.75,
-            'in_progress': 0.5,
-            'todo': 0.0
-        }
-        
+
         weighted_sum = sum(
-            self.tasks.filter(status=status).count() * weight
-            for status, weight in weights.items()
+            counts[status] * weight
+            for status, weight in STATUS_WEIGHTS.items()
         )
-        
+
         progress = (weighted_sum / total_tasks) * 100
         return round(progress, 1)
+
+
+class ProjectTaskCounter(models.Model):
+    """
+    Compteurs de tâches dénormalisés d'un projet, maintenus de façon incrémentale
+    lors de l'enregistrement et de la suppression des tâches (voir projects.counters).
+    Permet de lire les statistiques, la progression et le retard en O(1).
+    """
+    project = models.OneToOneField(
+        Project,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='task_counter',
+        verbose_name="Projet"
+    )
+    todo = models.IntegerField(default=0)
+    in_progress = models.IntegerField(default=0)
+    review = models.IntegerField(default=0)
+    done = models.IntegerField(default=0)
+    # Plus petite date de fin parmi les tâches non terminées
+    earliest_open_end_date = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Compteurs de tâches"
+        verbose_name_plural = "Compteurs de tâches"
+
+    def __str__(self):
+        return f"Compteurs de {self.project_id}"
+
+    @property
+    def total(self):
+        return self.todo + self.in_progress + self.review + self.done
+
+    @property
+    def is_delayed(self):
+        return (
+            self.earliest_open_end_date is not None
+            and self.earliest_open_end_date < timezone.now().date()
+        )
+
+    def as_counts(self):
+        return {
+            'total': self.total,
+            'todo': self.todo,
+            'in_progress': self.in_progress,
+            'review': self.review,
+            'done': self.done,
+            'delayed': int(self.is_delayed),
+        }
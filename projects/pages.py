@@ -0,0 +1,53 @@
+"""
+Contextes des pages HTML des projets.
+
+Les données affichées sont calculées une fois par requête dans la vue, et non
+par le gabarit : statistiques lues une seule fois (compteurs dénormalisés),
+prochaines échéances limitées par la base (ORDER BY ... LIMIT) au lieu de
+charger toutes les tâches du projet pour en afficher cinq. Le coût de la page
+ne dépend donc pas du nombre de tâches du projet.
+"""
+from django.db.models import F
+
+from .models import Project
+
+# Nombre d'échéances affichées sur la fiche projet
+UPCOMING_TASKS_LIMIT = 5
+
+
+def get_detail_project(pk):
+    """Charge le projet avec les relations affichées par la fiche (une requête + équipe)."""
+    return Project.objects.select_related('manager', 'client').with_task_counters().prefetch_related(
+        'team_members'
+    ).get(pk=pk)
+
+
+def project_stats(project):
+    """Statistiques affichées par la fiche projet, calculées une seule fois."""
+    stats = project.task_statistics
+    stats['progress'] = project.progress
+    stats['is_delayed'] = project.is_delayed
+    return stats
+
+
+def upcoming_tasks(project, limit=UPCOMING_TASKS_LIMIT):
+    """Tâches affichées dans "Prochaines échéances" : les `limit` premières, triées par la base."""
+    from tasks.models import Task
+
+    return list(
+        Task.objects.filter(project=project).with_timing().only(
+            'id', 'title', 'status', 'end_date', 'project'
+        ).order_by(F('end_date').desc(nulls_last=True), '-pk')[:limit]
+    )
+
+
+def project_detail_context(project):
+    """
+    Contexte de templates/projects/project_detail.html. Le projet doit être chargé
+    par `get_detail_project` pour que l'équipe et les compteurs soient préchargés.
+    """
+    return {
+        'project': project,
+        'stats': project_stats(project),
+        'upcoming_tasks': upcoming_tasks(project),
+    }
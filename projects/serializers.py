@@ -2,16 +2,26 @@ from rest_framework import serializers
 from .models import Project
 from accounts.serializers import UserSerializer
 from clients.serializers import ClientSerializer
+from lon.serializers import SharedRepresentationMixin
+
+
+class ProjectUserSerializer(SharedRepresentationMixin, UserSerializer):
+    """Chef de projet et membres : chaque utilisateur sérialisé une fois par réponse."""
+
+
+class ProjectClientSerializer(SharedRepresentationMixin, ClientSerializer):
+    pass
+
 
 class ProjectSerializer(serializers.ModelSerializer):
-    manager = UserSerializer(read_only=True)
-    team_members = UserSerializer(many=True, read_only=True)
+    manager = ProjectUserSerializer(read_only=True)
+    team_members = ProjectUserSerializer(many=True, read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     task_statistics = serializers.ReadOnlyField()
     progress = serializers.ReadOnlyField()
     is_delayed = serializers.ReadOnlyField()
     client_name = serializers.CharField(source='client.name', read_only=True)
-    client_details = ClientSerializer(source='client', read_only=True)
+    client_details = ProjectClientSerializer(source='client', read_only=True)
 
     class Meta:
         model = Project
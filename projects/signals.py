@@ -0,0 +1,91 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from accounts.models import User
+from clients.models import Client
+from lon.cache import invalidate_projects, invalidate_users, project_audience, user_audience
+from lon.events import get_broker, project_topic
+from .models import Project, ProjectTaskCounter
+
+
+@receiver(post_save, sender=Project)
+def create_task_counter(sender, instance, created, raw=False, **kwargs):
+    """Crée la ligne de compteurs d'un nouveau projet."""
+    if created and not raw:
+        ProjectTaskCounter.objects.get_or_create(project_id=instance.pk)
+
+
+@receiver(post_save, sender=Project)
+def invalidate_project_caches(sender, instance, **kwargs):
+    """Invalide les réponses en cache de l'équipe et du chef de projet."""
+    invalidate_projects([instance.pk])
+
+
+@receiver(pre_delete, sender=Project)
+def remember_project_audience(sender, instance, **kwargs):
+    # L'équipe n'est plus lisible après la suppression
+    instance._cache_audience = project_audience([instance.pk])
+
+
+@receiver(post_delete, sender=Project)
+def invalidate_deleted_project_caches(sender, instance, **kwargs):
+    invalidate_users(getattr(instance, '_cache_audience', {instance.manager_id}))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_caches(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Invalide les réponses qui affichent l'utilisateur (équipes, chefs de projet,
+    assignés). Ignore la création et la mise à jour de la date de connexion.
+    """
+    if created or raw or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    invalidate_users(user_audience(instance.pk))
+
+
+@receiver(post_save, sender=Client)
+def invalidate_client_caches(sender, instance, created, raw=False, **kwargs):
+    """Invalide les réponses des utilisateurs qui voient les projets du client."""
+    if created or raw:
+        return
+    invalidate_projects(Project.objects.filter(client_id=instance.pk).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Project.team_members.through)
+def invalidate_team_caches(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalide les réponses en cache lors d'un changement d'équipe."""
+    if action == 'pre_clear':
+        # Les lignes supprimées ne seront plus lisibles en post_clear
+        if reverse:
+            instance._cache_projects = set(instance.projects.values_list('pk', flat=True))
+        else:
+            instance._cache_audience = project_audience([instance.pk])
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance est un utilisateur, pk_set des projets
+        project_ids = getattr(instance, '_cache_projects', set()) if action == 'post_clear' else pk_set
+        invalidate_projects(project_ids or [], extra_user_ids={instance.pk})
+    else:
+        removed = getattr(instance, '_cache_audience', set()) if action == 'post_clear' else set()
+        invalidate_projects([instance.pk], extra_user_ids=set(pk_set or ()) | removed)
+
+
+@receiver(post_save, sender=Project)
+def publish_project_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_broker().publish_on_commit([(project_topic(instance.pk), {
+            'type': 'project',
+            'id': instance.pk,
+            'name': instance.name,
+            'status': instance.status,
+            'updated_at': instance.updated_at,
+            'deleted': False,
+        })])
+
+
+@receiver(post_delete, sender=Project)
+def publish_project_deleted(sender, instance, **kwargs):
+    get_broker().publish_on_commit([(project_topic(instance.pk), {
+        'type': 'project', 'id': instance.pk, 'deleted': True,
+    })])
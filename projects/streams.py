@@ -0,0 +1,126 @@
+"""
+Flux SSE (Server-Sent Events) des modifications d'un projet :
+GET /api/projects/<id>/events/
+
+Vue asynchrone servie par l'ASGI (lon/asgi.py) : une connexion ouverte ne
+mobilise ni thread ni connexion à la base, seulement un abonnement au courtier
+(lon/events.py) et une coroutine en attente. Les événements arrivés pendant
+`REALTIME_COALESCE_SECONDS` sont regroupés dans un même envoi ; un commentaire
+est envoyé toutes les `REALTIME_HEARTBEAT_SECONDS` pour maintenir la connexion.
+
+L'accès au projet est revérifié au même rythme : un membre retiré de l'équipe
+ou un ancien chef de projet voit son flux fermé (sa reconnexion reçoit un 404).
+Les vérifications passent par le pool de threads partagé et rendent leur
+connexion à la base ensuite, comme à la fin d'une requête.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections
+from django.db.models import Exists, OuterRef, Q
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from lon.events import get_broker, project_topic
+from .models import Project
+
+
+def authenticate(request):
+    """Authentifie la requête avec les authentifications de l'API (JWT)."""
+    authenticators = [auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    try:
+        user = Request(request, authenticators=authenticators).user
+    except APIException:
+        return None
+    return user if user.is_authenticated else None
+
+
+def can_follow(user, project_id):
+    """Le flux d'un projet est réservé à son équipe et à son chef de projet."""
+    membership = Project.team_members.through.objects.filter(project_id=OuterRef('pk'), user_id=user.pk)
+    return Project.objects.filter(pk=project_id).filter(Q(manager_id=user.pk) | Exists(membership)).exists()
+
+
+async def run_in_pool(function, *args):
+    """
+    Exécute `function` dans le pool de threads partagé (thread_sensitive=False) :
+    un flux ouvert ne garde pas de thread dédié. Les threads du pool ne passent
+    pas par la fin de requête de Django : la connexion à la base est rendue ici
+    (fermée selon CONN_MAX_AGE).
+    """
+    def call():
+        try:
+            return function(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def event_stream(topic, heartbeat=None, coalesce=None, allowed=None):
+    """
+    Générateur SSE d'un sujet. L'abonnement est pris au premier envoi et rendu à la
+    fermeture du générateur (déconnexion du client, ou accès retiré).
+    `allowed` (coroutine sans argument) est rappelée au plus toutes les
+    `heartbeat` secondes ; le flux se termine dès qu'elle retourne faux.
+    """
+    broker = get_broker()
+    loop = asyncio.get_running_loop()
+    heartbeat = heartbeat or getattr(settings, 'REALTIME_HEARTBEAT_SECONDS', 15)
+    coalesce = getattr(settings, 'REALTIME_COALESCE_SECONDS', 0.05) if coalesce is None else coalesce
+    subscription = broker.subscribe(topic)
+    try:
+        yield 'retry: 5000\n\n'
+        checked_at = loop.time()
+        while True:
+            received = await subscription.wait(heartbeat)
+            # Revérifiée à chaque battement, et sur un flux qui n'en laisse pas passer
+            if allowed is not None and (not received or loop.time() - checked_at >= heartbeat):
+                if not await allowed():
+                    return
+                checked_at = loop.time()
+            if not received:
+                yield ': ping\n\n'
+                continue
+            if coalesce:
+                # Laisse la rafale se terminer : les modifications d'un même objet fusionnent
+                await asyncio.sleep(coalesce)
+            yield ''.join(format_event(event) for event in subscription.drain())
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def check_access(request, pk):
+    """Retourne (utilisateur, code d'erreur HTTP ou None)."""
+    user = authenticate(request)
+    if user is None:
+        return None, 401
+    if not can_follow(user, pk):
+        return user, 404
+    return user, None
+
+
+async def project_events(request, pk):
+    # Pool de threads partagé : en mode "thread sensitive", chaque requête ASGI a son
+    # propre thread (et sa propre connexion à la base), conservé tant que le flux
+    # reste ouvert.
+    user, error = await run_in_pool(check_access, request, pk)
+    if error == 401:
+        return JsonResponse({'detail': "Authentification requise."}, status=401)
+    if error == 404:
+        return JsonResponse({'detail': "Projet introuvable."}, status=404)
+
+    stream = event_stream(project_topic(pk), allowed=lambda: run_in_pool(can_follow, user, pk))
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Désactive la mise en tampon de nginx devant le serveur ASGI
+    response['X-Accel-Buffering'] = 'no'
+    return response
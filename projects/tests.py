@@ -1,3 +1,477 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import User
+from clients.models import Client
+from lon.events import (
+    RESYNC, CachePollingBackend, InMemoryBackend, Subscription, get_broker, project_topic, reset_broker,
+)
+from tasks.models import Task
+from tasks.signals import task_event_items
+from .counters import check_counters, recompute_counters
+from .models import Project, ProjectTaskCounter
+from .pages import get_detail_project, project_detail_context
+from .streams import check_access, event_stream, run_in_pool
+
+
+class ProjectTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='chef', password='secret')
+        self.client_company = Client.objects.create(name='Client')
+        self.client.force_authenticate(self.user)
+
+    def create_project(self, name, statuses=('todo', 'in_progress', 'review', 'done')):
+        today = timezone.now().date()
+        project = Project.objects.create(
+            name=name,
+            client=self.client_company,
+            location='Abidjan',
+            start_date=today,
+            end_date=today + timedelta(days=30),
+            budget=1000,
+            manager=self.user,
+        )
+        project.team_members.add(self.user)
+        for status in statuses:
+            Task.objects.create(
+                title=f'{name} - {status}',
+                project=project,
+                status=status,
+                end_date=today - timedelta(days=1),
+            )
+        return project
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/projects/')
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class ProjectTaskStatisticsTests(ProjectTestMixin, APITestCase):
+    def test_annotated_statistics_match_properties(self):
+        project = self.create_project('Chantier', statuses=('todo', 'todo', 'review', 'done'))
+        annotated = Project.objects.with_task_stats().get(pk=project.pk)
+
+        self.assertEqual(annotated.task_statistics, project.task_statistics)
+        self.assertEqual(annotated.progress, project.progress)
+        self.assertEqual(annotated.is_delayed, project.is_delayed)
+        self.assertEqual(annotated.task_statistics['todo'], 2)
+        self.assertEqual(annotated.progress, 43.8)
+        self.assertTrue(annotated.is_delayed)
+
+    def test_annotated_statistics_use_no_extra_queries(self):
+        self.create_project('Chantier')
+        project = Project.objects.with_task_stats().get()
+
+        with self.assertNumQueries(0):
+            project.task_statistics
+            project.progress
+            project.is_delayed
+
+    def test_list_query_count_is_constant(self):
+        for index in range(3):
+            self.create_project(f'Projet {index}')
+        small = self.count_list_queries()
+
+        for index in range(3, 20):
+            self.create_project(f'Projet {index}')
+        large = self.count_list_queries()
+
+        self.assertEqual(small, large)
+        with self.assertNumQueries(2):
+            self.client.get('/api/projects/')
+
+    def test_projects_without_counter_row(self):
+        self.create_project('Chantier', statuses=('todo', 'done'))
+        legacy = self.create_project('Ancien', statuses=('todo', 'review', 'done'))
+        ProjectTaskCounter.objects.filter(project=legacy).delete()
+
+        # Repli en une requête pour toute la page
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/projects/')
+        rows = {row['id']: row for row in response.data['results']}
+        self.assertEqual(rows[legacy.pk]['task_statistics']['total'], 3)
+        self.assertEqual(rows[legacy.pk]['progress'], 58.3)
+        self.assertTrue(rows[legacy.pk]['is_delayed'])
+
+        # Une seule agrégation pour toutes les propriétés d'un projet isolé
+        project = Project.objects.with_task_counters().get(pk=legacy.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                (project.task_statistics['review'], project.progress, project.is_delayed), (1, 58.3, True)
+            )
+
+        response = self.client.get('/api/projects/export/', {'format': 'ndjson'})
+        exported = {
+            row['id']: row for row in map(json.loads, b''.join(response.streaming_content).splitlines())
+        }
+        self.assertEqual(
+            (exported[legacy.pk]['tasks_total'], exported[legacy.pk]['tasks_done'], exported[legacy.pk]['is_delayed']),
+            (3, 1, True)
+        )
+
+    def test_bulk_created_projects_get_counters(self):
+        today = timezone.now().date()
+        projects = Project.objects.bulk_create([
+            Project(
+                name=f'Projet {index}', client=self.client_company, location='Abidjan', start_date=today,
+                end_date=today, budget=1000, manager=self.user,
+            )
+            for index in range(3)
+        ])
+        self.assertEqual(
+            ProjectTaskCounter.objects.filter(project__in=projects).count(), len(projects)
+        )
+
+    def test_shared_users_are_serialized_once(self):
+        members = [User.objects.create_user(username=f'membre{index}') for index in range(5)]
+        for index in range(3):
+            self.create_project(f'Projet {index}', statuses=()).team_members.add(*members)
+
+        with self.assertNumQueries(2):
+            results = self.client.get('/api/projects/').data['results']
+        first, second = results[0], results[1]
+        self.assertEqual(len(first['team_members']), 6)
+        self.assertIs(first['manager'], second['manager'])
+        self.assertIs(first['client_details'], second['client_details'])
+        shared = {member['id']: member for member in first['team_members']}
+        for member in second['team_members']:
+            self.assertIs(shared[member['id']], member)
+
+    def test_sparse_fieldset_skips_statistics(self):
+        self.create_project('Chantier')
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/projects/?fields=id,name')
+        self.assertEqual(response.data['results'], [{'id': response.data['results'][0]['id'], 'name': 'Chantier'}])
+
+
+class ProjectTaskCounterTests(ProjectTestMixin, APITestCase):
+    def assertCountersConsistent(self):
+        self.assertEqual(check_counters(), [])
+
+    def test_counters_follow_task_lifecycle(self):
+        project = self.create_project('Chantier', statuses=('todo', 'in_progress'))
+        other = self.create_project('Autre', statuses=())
+        task = project.tasks.get(status='todo')
+
+        task.status = 'in_progress'
+        task.save()
+        task.status = 'review'
+        task.end_date = timezone.now().date() + timedelta(days=3)
+        task.save()
+        self.assertCountersConsistent()
+
+        task.project = other
+        task.save()
+        self.assertCountersConsistent()
+
+        project.tasks.get().delete()
+        moved = other.tasks.get()
+        moved.status = 'done'
+        moved.save()
+        self.assertCountersConsistent()
+        self.assertIsNone(ProjectTaskCounter.objects.get(project=other).earliest_open_end_date)
+        self.assertEqual(ProjectTaskCounter.objects.get(project=project).total, 0)
+        self.assertIsNone(ProjectTaskCounter.objects.get(project=project).earliest_open_end_date)
+
+    def test_counter_reads_use_no_queries(self):
+        self.create_project('Chantier', statuses=('todo', 'review', 'done'))
+        project = Project.objects.with_task_counters().get()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(project.task_statistics['total'], 3)
+            self.assertEqual(project.progress, 58.3)
+            self.assertTrue(project.is_delayed)
+
+    def test_recompute_repairs_counters(self):
+        project = self.create_project('Chantier')
+        ProjectTaskCounter.objects.filter(project=project).update(todo=42, earliest_open_end_date=None)
+        self.assertEqual(len(check_counters()), 1)
+
+        recompute_counters()
+        self.assertCountersConsistent()
+
+
+@override_settings(API_CACHE_ENABLED=True)
+class ProjectResponseCacheTests(ProjectTestMixin, APITestCase):
+    def test_unchanged_list_is_served_from_cache_and_etag(self):
+        self.create_project('Chantier')
+        first = self.client.get('/api/projects/')
+
+        with self.assertNumQueries(0):
+            cached = self.client.get('/api/projects/')
+            not_modified = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(cached.data, first.data)
+        self.assertEqual(not_modified.status_code, 304)
+
+        # Entrée évincée : l'ETag ne suffit plus, la réponse est recalculée
+        cache.clear()
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_responses_change_with_the_date(self):
+        self.create_project('Chantier')
+        first = self.client.get('/api/projects/')
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        with mock.patch('lon.cache.timezone.localdate', return_value=tomorrow):
+            response = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_invalidation_waits_for_commit(self):
+        project = self.create_project('Chantier', statuses=('todo',))
+        first = self.client.get('/api/projects/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            project.tasks.update(status='in_progress')
+            project.tasks.get().save()
+            # Transaction en cours : une lecture concurrente ne doit pas remettre
+            # en cache l'ancien état sous une nouvelle version
+            self.assertEqual(
+                self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304
+            )
+        self.assertEqual(
+            self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200
+        )
+
+    def test_user_and_client_changes_invalidate_responses(self):
+        self.create_project('Chantier')
+        first = self.client.get('/api/projects/')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Awa'
+            self.user.save()
+        second = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client_company.name = 'Client renommé'
+            self.client_company.save()
+        third = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=second['ETag'])
+        self.assertEqual(third.status_code, 200)
+
+        # Simple connexion : rien à invalider
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save(update_fields=['last_login'])
+        self.assertEqual(self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=third['ETag']).status_code, 304)
+
+    def test_task_change_invalidates_team_responses(self):
+        project = self.create_project('Chantier', statuses=('todo',))
+        first = self.client.get('/api/projects/')
+
+        task = project.tasks.get()
+        task.status = 'in_progress'
+        with self.captureOnCommitCallbacks(execute=True):
+            task.save()
+
+        response = self.client.get('/api/projects/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.data['results'][0]['task_statistics']['in_progress'], 1)
+
+    def test_responses_are_per_user(self):
+        self.create_project('Chantier')
+        self.client.get('/api/projects/')
+
+        outsider = User.objects.create_user(username='externe', password='secret')
+        self.client.force_authenticate(outsider)
+        self.assertEqual(self.client.get('/api/projects/').data['results'], [])
+
+
+class ProjectDetailPageTests(ProjectTestMixin, APITestCase):
+    def test_context_cost_does_not_depend_on_task_count(self):
+        project = self.create_project('Chantier')
+        with CaptureQueriesContext(connection) as small:
+            render_to_string('projects/_project_tasks.html', project_detail_context(get_detail_project(project.pk)))
+
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=project) for index in range(50)])
+        with CaptureQueriesContext(connection) as large:
+            html = render_to_string(
+                'projects/_project_tasks.html', project_detail_context(get_detail_project(project.pk))
+            )
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+        self.assertIn('Projet en retard', html)
+
+    def test_upcoming_tasks_are_limited_and_sorted(self):
+        project = self.create_project('Chantier', statuses=())
+        today = timezone.now().date()
+        for days in range(8):
+            Task.objects.create(title=f'J+{days}', project=project, end_date=today + timedelta(days=days))
+        Task.objects.create(title='Sans date', project=project)
+
+        upcoming = project_detail_context(get_detail_project(project.pk))['upcoming_tasks']
+        self.assertEqual([task.title for task in upcoming], ['J+7', 'J+6', 'J+5', 'J+4', 'J+3'])
+
+
+class RealtimeEventTests(ProjectTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        reset_broker()
+        self.addCleanup(reset_broker)
+
+    def test_subscription_coalesces_and_bounds_pending_events(self):
+        async def scenario():
+            subscription = Subscription('project:1', asyncio.get_running_loop(), max_pending=3)
+            for status in ('todo', 'in_progress', 'review'):
+                subscription.deliver({'type': 'task', 'id': 1, 'status': status})
+            subscription.deliver({'type': 'task', 'id': 2, 'status': 'todo'})
+            self.assertTrue(await subscription.wait(0.1))
+            self.assertEqual(
+                [(event['id'], event['status']) for event in subscription.drain()],
+                [(1, 'review'), (2, 'todo')]
+            )
+            for pk in range(5):
+                subscription.deliver({'type': 'task', 'id': pk})
+            self.assertEqual(subscription.drain(), [RESYNC])
+            self.assertFalse(await subscription.wait(0.01))
+
+        asyncio.run(scenario())
+
+    def test_polling_waits_for_reserved_events(self):
+        async def scenario():
+            backend = CachePollingBackend(gap_timeout=5)
+            subscription = Subscription('project:1', asyncio.get_running_loop(), max_pending=10)
+            # Abonnement sans la tâche de relecture périodique : poll_once est appelé ici
+            InMemoryBackend.subscribe(backend, subscription)
+            backend.poll_once()
+
+            # Numéro réservé par un autre worker, événement pas encore écrit
+            cache.incr(backend.SEQUENCE_KEY)
+            backend.publish_many([('project:1', {'type': 'task', 'id': 2})])
+            backend.poll_once()
+            self.assertEqual(subscription.drain(), [])
+
+            cache.set(backend.EVENT_KEY.format(1), ('project:1', {'type': 'task', 'id': 1}))
+            backend.poll_once()
+            self.assertEqual([event['id'] for event in subscription.drain()], [1, 2])
+
+            # Événement jamais écrit : abandonné après gap_timeout, avec un resync
+            cache.incr(backend.SEQUENCE_KEY)
+            backend.poll_once()
+            self.assertEqual(subscription.drain(), [])
+            with mock.patch('lon.events.time.monotonic', return_value=time.monotonic() + 10):
+                backend.poll_once()
+            self.assertEqual(subscription.drain(), [RESYNC])
+
+        asyncio.run(scenario())
+
+    def test_stream_receives_task_changes_of_project(self):
+        project = self.create_project('Chantier', statuses=('todo',))
+        other = self.create_project('Autre', statuses=('todo',))
+        task = project.tasks.get()
+        items = task_event_items(task, None) + task_event_items(other.tasks.get(), None)
+        broker = get_broker()
+
+        async def scenario():
+            stream = event_stream(project_topic(project.pk), heartbeat=5, coalesce=0.01)
+            self.assertEqual(await anext(stream), 'retry: 5000\n\n')
+            broker.publish_many(items)
+            chunk = await anext(stream)
+            await stream.aclose()
+            return chunk
+
+        chunk = asyncio.run(scenario())
+        self.assertIn(f'"id": {task.pk}', chunk)
+        self.assertEqual(chunk.count('event: task'), 1)
+        self.assertEqual(broker.backend.subscriber_count(), 0)
+
+    def test_stream_closes_when_access_is_revoked(self):
+        checks = []
+
+        async def allowed():
+            checks.append(True)
+            return len(checks) < 2
+
+        async def scenario():
+            stream = event_stream(project_topic(1), heartbeat=0.01, coalesce=0, allowed=allowed)
+            chunks = [chunk async for chunk in stream]
+            return chunks
+
+        chunks = asyncio.run(scenario())
+        # Premier battement autorisé, flux fermé au second
+        self.assertEqual(chunks, ['retry: 5000\n\n', ': ping\n\n'])
+        self.assertEqual(len(checks), 2)
+        self.assertEqual(get_broker().backend.subscriber_count(), 0)
+
+    def test_pooled_checks_release_their_connection(self):
+        with mock.patch('projects.streams.close_old_connections') as close:
+            self.assertEqual(asyncio.run(run_in_pool(lambda value: value * 2, 21)), 42)
+        close.assert_called_once_with()
+
+    def test_stream_requires_project_access(self):
+        project = self.create_project('Chantier', statuses=())
+        outsider = User.objects.create_user(username='externe', password='secret')
+        self.assertEqual(check_access(RequestFactory().get('/'), project.pk)[1], 401)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(outsider)}')
+        self.assertEqual(check_access(request, project.pk)[1], 404)
+        request = RequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.assertEqual(check_access(request, project.pk), (self.user, None))
+
+
+class ProjectExportTests(ProjectTestMixin, APITestCase):
+    def test_export_matches_project_properties(self):
+        project = self.create_project('Chantier', statuses=('todo', 'review', 'done', 'done'))
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/projects/export/', {'format': 'ndjson'})
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['id'], project.pk)
+        self.assertEqual(rows[0]['tasks_total'], 4)
+        self.assertEqual(rows[0]['progress'], project.progress)
+        self.assertEqual(rows[0]['is_delayed'], project.is_delayed)
+
+    def test_export_computes_missing_counters_per_batch(self):
+        for name in ('Ancien', 'Archivé', 'Historique'):
+            project = self.create_project(name, statuses=('todo', 'done'))
+            ProjectTaskCounter.objects.filter(project=project).delete()
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/projects/export/', {'format': 'ndjson'})
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        self.assertEqual([row['tasks_total'] for row in rows], [2, 2, 2])
+        self.assertEqual([row['progress'] for row in rows], [project.progress] * 3)
+        self.assertEqual([row['is_delayed'] for row in rows], [project.is_delayed] * 3)
+
+    def test_csv_export_is_default(self):
+        self.create_project('Chantier')
+        response = self.client.get('/api/projects/export/')
+
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'name', 'client'])
+        self.assertEqual(len(lines), 2)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class ProjectCompactListTests(ProjectTestMixin, APITestCase):
+    def test_compact_list_is_byte_identical(self):
+        member = User.objects.create_user(username='membre', first_name='Aïcha')
+        self.create_project('Chantier', statuses=('todo', 'review', 'done')).team_members.add(member)
+        self.create_project('Sans tâches', statuses=())
+        # Sans ligne de compteurs : calculés pour la page en une requête groupée
+        ProjectTaskCounter.objects.filter(project=self.create_project('Ancien')).delete()
+
+        for url in ('/api/projects/', '/api/projects/?fields=id,manager,progress,task_statistics'):
+            with self.subTest(url=url):
+                responses = []
+                for routes in ((), ('projects',)):
+                    with override_settings(API_COMPACT_LIST_ROUTES=routes):
+                        responses.append(self.client.get(url))
+                self.assertEqual(responses[1].content, responses[0].content)
+                self.assertEqual(len(responses[1].data['results']), 3)
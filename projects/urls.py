@@ -1,6 +1,8 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from lon.async_views import async_read_urls
 from . import views
+from .streams import project_events
 
 router = DefaultRouter()
 router.register('', views.ProjectViewSet, basename='project')
@@ -8,5 +10,9 @@ router.register('', views.ProjectViewSet, basename='project')
 app_name = 'projects'
 
 urlpatterns = [
+    path('<int:pk>/events/', project_events, name='project-events'),
+    *async_read_urls('projects', '', views.ProjectViewSet, {
+        'list': 'projects.list', 'retrieve': 'projects.retrieve',
+    }),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,17 +1,120 @@
+from operator import attrgetter
+
+from django.db.models import Prefetch
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Project
-from .serializers import ProjectSerializer, ProjectCreateUpdateSerializer
+from accounts.models import User
+from lon.cache import cache_response
+from lon.export import EXPORT_RENDERERS, Computed, export_response
+from lon.mixins import CompactListMixin, SparseFieldsetMixin
+from lon.pagination import KeysetPagination
+from lon.serializers import model_field_names
+from .models import COUNTER_COLUMNS, Project, ProjectTaskCounter, attach_missing_task_stats
+from .serializers import ProjectSerializer, ProjectCreateUpdateSerializer, ProjectUserSerializer
+
+# Champs de ProjectSerializer calculés à partir des statistiques de tâches
+TASK_STATS_FIELDS = ('task_statistics', 'progress', 'is_delayed')
+
+
+def counter_project(pk, todo, in_progress, review, done, earliest_open_end_date):
+    """
+    Projet construit depuis les colonnes de compteurs d'une ligne `.values()`,
+    pour évaluer ses propriétés sans requête (liste compacte, export). Les
+    colonnes des projets sans ligne de compteurs sont complétées par lot
+    (`attach_missing_task_stats`) avant le calcul des propriétés.
+    """
+    project = Project(pk=pk)
+    counter = None
+    if todo is not None:
+        counter = ProjectTaskCounter(
+            project_id=pk, todo=todo, in_progress=in_progress, review=review, done=done,
+            earliest_open_end_date=earliest_open_end_date,
+        )
+    # Même état qu'après select_related('task_counter')
+    project._state.fields_cache['task_counter'] = counter
+    return project
+
+
+def counter_property(name, function=None):
+    """Colonne calculée depuis les compteurs : propriété `name` du projet, ou `function(projet)`."""
+    return Computed(
+        lambda *values: (function or attrgetter(name))(counter_project(*values)),
+        'id', *COUNTER_COLUMNS
+    )
+
+
+def export_columns():
+    """Colonnes de /api/projects/export/ : (nom, champ ou colonne calculée)."""
+    return [
+        ('id', 'id'),
+        ('name', 'name'),
+        ('client', 'client__name'),
+        ('location', 'location'),
+        ('status', 'status'),
+        ('budget', 'budget'),
+        ('start_date', 'start_date'),
+        ('end_date', 'end_date'),
+        ('manager', 'manager__username'),
+        ('tasks_total', counter_property('tasks_total', lambda project: project.task_statistics['total'])),
+        ('tasks_done', counter_property('tasks_done', lambda project: project.task_statistics['done'])),
+        ('progress', counter_property('progress')),
+        ('is_delayed', counter_property('is_delayed')),
+        ('created_at', 'created_at'),
+        ('updated_at', 'updated_at'),
+    ]
+
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class ProjectViewSet(SparseFieldsetMixin, CompactListMixin, viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
+    compact_route = 'projects'
+    compact_computed = {name: counter_property(name) for name in TASK_STATS_FIELDS}
+    # Requêtes SQL par appel, authentification JWT comprise (voir lon/metrics.py)
+    query_budgets = {'list': 3, 'retrieve': 3, 'managed': 3}
     
     def get_queryset(self):
         user = self.request.user
-        return Project.objects.filter(
+        # Une seule ligne d'appartenance par (projet, membre) : pas besoin de DISTINCT
+        queryset = Project.objects.filter(
             team_members=user
-        ).distinct()
+        )
+        return self._optimize_queryset(queryset)
+
+    def _optimize_queryset(self, queryset):
+        """
+        Précharge les relations et les statistiques de tâches utilisées par
+        ProjectSerializer pour éviter les requêtes N+1 en lecture.
+        Seuls les champs demandés via `?fields=` sont préchargés.
+        """
+        if self.action in ['create', 'update', 'partial_update']:
+            return queryset
+        related = []
+        if self.field_requested('manager'):
+            related.append('manager')
+        if self.field_requested('client_name') or self.field_requested('client_details'):
+            related.append('client')
+        if related:
+            queryset = queryset.select_related(*related)
+        if self.field_requested('team_members'):
+            # Membres de tous les projets de la page en une requête, limitée aux
+            # colonnes sérialisées
+            members = User.objects.only(*model_field_names(ProjectUserSerializer))
+            queryset = queryset.prefetch_related(Prefetch('team_members', queryset=members))
+        if any(self.field_requested(field) for field in TASK_STATS_FIELDS):
+            queryset = queryset.with_task_counters()
+        return queryset
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            attach_missing_task_stats(page)
+        return page
+
+    def get_object(self):
+        project = super().get_object()
+        attach_missing_task_stats([project])
+        return project
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -21,12 +124,28 @@ class ProjectViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(manager=self.request.user)
 
+    @cache_response('projects.list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('projects.retrieve')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=False, methods=['GET'])
-    def managed(self):
+    @cache_response('projects.managed')
+    def managed(self, request):
         """Retourne les projets gérés par l'utilisateur"""
-        projects = Project.objects.filter(manager=self.request.user)
-        serializer = self.get_serializer(projects, many=True)
-        return Response(serializer.data)
+        projects = self._optimize_queryset(Project.objects.filter(manager=request.user))
+        page = self.paginate_queryset(projects)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['GET'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """Export en flux des projets de l'utilisateur : ?format=csv (par défaut) ou ?format=ndjson."""
+        queryset = Project.objects.filter(team_members=request.user).order_by('pk')
+        return export_response(request, queryset, export_columns(), 'projets', prepare=attach_missing_task_stats)
 
     @action(detail=True, methods=['PATCH'])
     def update_status(self, request, pk=None):
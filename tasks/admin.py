@@ -2,11 +2,29 @@ from django.contrib import admin
 from django.utils.html import format_html
 from .models import Task, TaskDocument
 
+
+class OverdueFilter(admin.SimpleListFilter):
+    """Filtre sur le retard, évalué par la base (Task.objects.with_timing())."""
+    title = "En retard"
+    parameter_name = 'overdue'
+
+    def lookups(self, request, model_admin):
+        return (('1', 'Oui'), ('0', 'Non'))
+
+    def queryset(self, request, queryset):
+        if self.value() == '1':
+            return queryset.overdue()
+        if self.value() == '0':
+            return queryset.filter(timing_overdue=False)
+        return queryset
+
+
 @admin.register(Task)
 class TaskAdmin(admin.ModelAdmin):
     list_display = ('title', 'project', 'colored_status', 'colored_priority', 
-                   'assigned_to', 'start_date', 'end_date', 'is_overdue_status')
-    list_filter = ('status', 'priority', 'project', 'assigned_to')
+                   'assigned_to', 'start_date', 'end_date', 'is_overdue_status', 'delay_days_display')
+    list_filter = ('status', 'priority', OverdueFilter, 'project', 'assigned_to')
+    list_select_related = ('project', 'assigned_to')
     search_fields = ('title', 'description', 'project__name')
     date_hierarchy = 'start_date'
     readonly_fields = ('created_at', 'updated_at', 'created_by')
@@ -39,10 +57,20 @@ class TaskAdmin(admin.ModelAdmin):
         )
     colored_priority.short_description = 'Priorité'
 
+    def get_queryset(self, request):
+        # Retard calculé par la base : la liste peut être triée par retard
+        return super().get_queryset(request).with_timing()
+
     def is_overdue_status(self, obj):
         return obj.is_overdue
     is_overdue_status.boolean = True
     is_overdue_status.short_description = "En retard ?"
+    is_overdue_status.admin_order_field = 'timing_overdue'
+
+    def delay_days_display(self, obj):
+        return obj.delay_days or ''
+    delay_days_display.short_description = "Retard (jours)"
+    delay_days_display.admin_order_field = 'timing_delay'
 
     def save_model(self, request, obj, form, change):
         if not change:  # Si c'est une nouvelle tâche
@@ -0,0 +1,222 @@
+"""
+Opérations en masse sur les tâches (création, modification, changement de statut).
+
+Les tâches visées sont chargées en une fois, les transitions de statut sont
+validées en mémoire par la machine à états (tasks/status.py), puis toutes les
+écritures valides sont faites par `bulk_create` / `bulk_update` dans une seule
+transaction. Chaque élément reçoit son propre résultat : un élément invalide
+n'empêche pas l'enregistrement des autres. Les changements de statut seuls sont
+conditionnés au statut chargé : une tâche modifiée entre-temps par une autre
+requête est signalée en conflit plutôt qu'écrasée.
+
+La forme du corps est vérifiée d'abord (objet, listes d'objets, identifiants
+convertibles par le champ clé primaire) : une erreur de forme donne un 400
+pour toute la requête.
+"""
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError as APIValidationError
+
+from .models import Task, validate_date_range
+from .signals import tasks_bulk_changed
+from .status import status_machine
+
+# Nombre maximal d'éléments par requête (toutes opérations confondues)
+MAX_BULK_ITEMS = 5000
+# Taille des lots pour les IN (...) et les écritures
+BATCH_SIZE = 500
+
+
+def transition_error(task, new_status):
+    """Retourne un message d'erreur si la transition est interdite, sinon None."""
+    old_status = status_machine.original_status(task)
+    if status_machine.can_transition(old_status, new_status):
+        return None
+    return status_machine.error_message(old_status, new_status)
+
+
+def error_detail(exc):
+    if isinstance(exc, ValidationError):
+        return exc.message_dict if hasattr(exc, 'error_dict') else {'non_field_errors': exc.messages}
+    return exc.detail
+
+
+class BulkTaskOperation:
+    def __init__(self, user, serializer_class, context):
+        self.user = user
+        self.serializer_class = serializer_class
+        self.context = context
+
+    def load_tasks(self, ids):
+        """Charge en une passe les tâches visibles par l'utilisateur, par identifiant."""
+        ids = list(ids)
+        tasks = {}
+        queryset = Task.objects.visible_to(self.user).select_related('project')
+        for start in range(0, len(ids), BATCH_SIZE):
+            tasks.update(queryset.in_bulk(ids[start:start + BATCH_SIZE]))
+        return tasks
+
+    def clean_ids(self, section, items):
+        """
+        Convertit sur place l'identifiant de chaque élément par le champ clé primaire
+        ("5" comme 5) ; lève une erreur de validation (400) si l'un est invalide.
+        """
+        pk_field = Task._meta.pk
+        errors = {}
+        for index, item in enumerate(items):
+            if item.get('id') is None:
+                continue
+            try:
+                if isinstance(item['id'], bool) or not isinstance(item['id'], (int, str)):
+                    raise ValidationError("")
+                item['id'] = pk_field.to_python(item['id'])
+            except ValidationError:
+                errors[index] = {'id': ["Identifiant de tâche invalide."]}
+        if errors:
+            raise APIValidationError({section: errors})
+
+    def run(self, payload):
+        if not isinstance(payload, dict):
+            raise APIValidationError("Le corps doit être un objet JSON.")
+        creates = payload.get('create') or []
+        updates = payload.get('update') or []
+        status_changes = payload.get('status') or []
+        if not all(isinstance(items, list) for items in (creates, updates, status_changes)):
+            raise APIValidationError("'create', 'update' et 'status' doivent être des listes.")
+        if len(creates) + len(updates) + len(status_changes) > MAX_BULK_ITEMS:
+            raise APIValidationError(f"Au plus {MAX_BULK_ITEMS} éléments par requête.")
+        for section, items in (('create', creates), ('update', updates), ('status', status_changes)):
+            if not all(isinstance(item, dict) for item in items):
+                raise APIValidationError({section: ["Chaque élément doit être un objet."]})
+        self.clean_ids('update', updates)
+        self.clean_ids('status', status_changes)
+
+        ids = {item.get('id') for item in [*updates, *status_changes]}
+        tasks = self.load_tasks(ids - {None})
+        previous = {pk: task.loaded_state() for pk, task in tasks.items()}
+        now = timezone.now()
+
+        results = {'create': [], 'update': [], 'status': []}
+        to_create = []
+        dirty = {}
+        # Champs modifiés par tâche : bulk_update n'écrit que ceux-là, par groupe
+        dirty_fields = {}
+        # Tâches modifiées uniquement par un changement de statut : écrites par un
+        # UPDATE ... WHERE id IN (...) par statut cible, bien moins coûteux qu'un
+        # bulk_update (CASE WHEN par ligne)
+        status_only = set()
+
+        for index, item in enumerate(creates):
+            serializer = self.serializer_class(data=item, context=self.context)
+            try:
+                serializer.is_valid(raise_exception=True)
+                data = serializer.validated_data
+                validate_date_range(data.get('start_date'), data.get('end_date'))
+            except (ValidationError, APIValidationError) as exc:
+                results['create'].append({'index': index, 'errors': error_detail(exc)})
+                continue
+            to_create.append((index, Task(**{**data, 'created_by': self.user})))
+
+        for index, item in enumerate(updates):
+            task = tasks.get(item.get('id'))
+            if task is None:
+                results['update'].append({'index': index, 'errors': {'id': ["Tâche introuvable."]}})
+                continue
+            serializer = self.serializer_class(task, data=item, partial=True, context=self.context)
+            try:
+                serializer.is_valid(raise_exception=True)
+                data = serializer.validated_data
+                validate_date_range(
+                    data.get('start_date', task.start_date),
+                    data.get('end_date', task.end_date)
+                )
+                if 'status' in data:
+                    error = transition_error(task, data['status'])
+                    if error:
+                        raise ValidationError({'status': error})
+            except (ValidationError, APIValidationError) as exc:
+                results['update'].append({'index': index, 'id': task.pk, 'errors': error_detail(exc)})
+                continue
+            for name, value in data.items():
+                setattr(task, name, value)
+            dirty_fields.setdefault(task.pk, {'updated_at'}).update(data)
+            dirty[task.pk] = task
+            status_only.discard(task.pk)
+            results['update'].append({'index': index, 'id': task.pk})
+
+        valid_statuses = dict(Task.STATUS_CHOICES)
+        for index, item in enumerate(status_changes):
+            task = tasks.get(item.get('id'))
+            if task is None:
+                results['status'].append({'index': index, 'errors': {'id': ["Tâche introuvable."]}})
+                continue
+            new_status = item.get('status')
+            if new_status not in valid_statuses:
+                results['status'].append({'index': index, 'id': task.pk, 'errors': {'status': ["Statut invalide."]}})
+                continue
+            error = transition_error(task, new_status)
+            if error:
+                results['status'].append({'index': index, 'id': task.pk, 'errors': {'status': [error]}})
+                continue
+            task.status = new_status
+            if task.pk not in dirty:
+                status_only.add(task.pk)
+            dirty_fields.setdefault(task.pk, {'updated_at'}).add('status')
+            dirty[task.pk] = task
+            results['status'].append({'index': index, 'id': task.pk, 'status': new_status})
+
+        with transaction.atomic():
+            created = Task.objects.bulk_create([task for _, task in to_create], batch_size=BATCH_SIZE)
+            updated = list(dirty.values())
+            for task in updated:
+                task.updated_at = now
+
+            # UPDATE ... WHERE id IN (...) AND status = <ancien statut>, par transition
+            by_transition = {}
+            for pk in status_only:
+                by_transition.setdefault((previous[pk]['status'], dirty[pk].status), []).append(pk)
+            conflicts = set()
+            for (old_status, new_status), pks in by_transition.items():
+                for start in range(0, len(pks), BATCH_SIZE):
+                    chunk = pks[start:start + BATCH_SIZE]
+                    written = Task.objects.filter(pk__in=chunk, status=old_status).update(
+                        status=new_status, updated_at=now
+                    )
+                    if written != len(chunk):
+                        # Certaines lignes ont changé de statut entre-temps
+                        written = set(Task.objects.filter(
+                            pk__in=chunk, status=new_status, updated_at=now
+                        ).values_list('pk', flat=True))
+                        conflicts.update(set(chunk) - written)
+            for pk in conflicts:
+                del dirty[pk]
+            updated = list(dirty.values())
+
+            by_fields = {}
+            for task in updated:
+                if task.pk not in status_only:
+                    by_fields.setdefault(tuple(sorted(dirty_fields[task.pk])), []).append(task)
+            for fields, group in by_fields.items():
+                Task.objects.bulk_update(group, fields, batch_size=BATCH_SIZE)
+            if created or updated:
+                tasks_bulk_changed.send(
+                    sender=Task,
+                    created=created,
+                    updated=updated,
+                    previous={pk: previous[pk] for pk in dirty},
+                    actor=self.user,
+                )
+
+        for task in updated:
+            task._loaded_values = task.tracked_state()
+        for pk in conflicts:
+            tasks[pk].status = previous[pk]['status']
+        for result in results['status']:
+            if result.get('id') in conflicts and 'errors' not in result:
+                del result['status']
+                result['errors'] = {'status': ["Le statut de la tâche a été modifié entre-temps."]}
+        for (index, _), task in zip(to_create, created):
+            results['create'].append({'index': index, 'id': task.pk})
+        results['create'].sort(key=lambda result: result['index'])
+        return results
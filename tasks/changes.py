@@ -0,0 +1,143 @@
+"""
+Flux de modifications des tâches (GET /api/tasks/changes/?since=<jeton>).
+
+Un client (tableau kanban, application) charge la liste une fois puis ne
+demande que ce qui a changé depuis son dernier jeton : tâches créées ou
+modifiées (`updated_at`) et tâches supprimées ou sorties de sa visibilité
+(TaskTombstone). Chaque flux est parcouru par plage sur un index
+(updated_at, id) / (deleted_at, id). Une trace ne va qu'aux utilisateurs qui
+voyaient la tâche ; celles des tâches qu'il voit toujours (déplacées dans un
+autre de ses projets, par exemple) sont écartées.
+
+Les tâches qui deviennent visibles sans être modifiées (utilisateur ajouté à
+une équipe, nouveau chef de projet) n'apparaissent dans aucun flux : une trace
+TaskFeedReset postérieure au jeton donne un 410, comme un jeton expiré, et le
+client recharge la liste complète.
+
+Le jeton contient, pour chaque flux, une position (horodatage, identifiant) :
+- identifiant renseigné : la page précédente était incomplète, la suivante
+  reprend strictement après cette ligne ;
+- identifiant nul : le client est à jour à cet instant. La lecture suivante
+  reprend `TASK_CHANGES_GRACE_SECONDS` avant, car une transaction peut valider
+  après une lecture une ligne dont `updated_at` est antérieur (écritures
+  concurrentes, horloges des serveurs). Les lignes de cette fenêtre peuvent
+  donc être renvoyées deux fois : le client les applique de façon idempotente.
+"""
+import json
+from base64 import b64decode, b64encode
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from lon.pagination import encode_value
+from .models import TaskFeedReset, TaskTombstone, visibility_filter
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+
+
+class InvalidToken(Exception):
+    pass
+
+
+class ExpiredToken(Exception):
+    """Jeton antérieur à la conservation des suppressions : le client doit tout recharger."""
+
+
+def grace_period():
+    return timedelta(seconds=getattr(settings, 'TASK_CHANGES_GRACE_SECONDS', 60))
+
+
+def tombstone_retention():
+    return timedelta(days=getattr(settings, 'TASK_TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def encode_token(positions):
+    payload = {name: [timestamp, pk] for name, (timestamp, pk) in positions.items()}
+    return b64encode(json.dumps(payload, default=encode_value).encode('utf-8')).decode('ascii')
+
+
+def decode_token(token, streams):
+    try:
+        payload = json.loads(b64decode(token.encode('ascii')).decode('utf-8'))
+        positions = {}
+        for name in streams:
+            timestamp, pk = payload[name]
+            timestamp = parse_datetime(timestamp)
+            if timestamp is None or not (pk is None or isinstance(pk, int)):
+                raise ValueError
+            positions[name] = (timestamp, pk)
+    except Exception:
+        raise InvalidToken("Jeton de synchronisation invalide")
+    return positions
+
+
+class ChangeStream:
+    """Un flux parcouru par (horodatage, identifiant) croissants."""
+
+    def __init__(self, queryset, time_field):
+        self.queryset = queryset
+        self.time_field = time_field
+
+    def read(self, position, limit, now):
+        """Retourne (lignes, position suivante, reste-t-il des lignes)."""
+        timestamp, pk = position
+        if pk is None:
+            condition = Q(**{f'{self.time_field}__gte': timestamp - grace_period()})
+        else:
+            condition = Q(**{f'{self.time_field}__gt': timestamp}) | Q(**{self.time_field: timestamp, 'pk__gt': pk})
+        rows = list(self.queryset.filter(condition).order_by(self.time_field, 'pk')[:limit + 1])
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            return rows, (getattr(last, self.time_field), last.pk), True
+        return rows, (now, None), False
+
+
+class TaskChangeFeed:
+    """Modifications des tâches visibles par un utilisateur depuis un jeton."""
+
+    streams = ('tasks', 'deleted')
+
+    def __init__(self, user, tasks_queryset):
+        self.user = user
+        self.tasks_queryset = tasks_queryset
+        self.tasks = ChangeStream(tasks_queryset, 'updated_at')
+        # Traces propres à l'utilisateur, ou destinées aux lecteurs d'alors du
+        # projet et de l'assigné enregistrés
+        self.deleted = ChangeStream(
+            TaskTombstone.objects.filter(Q(user_id=user.pk) | Q(user_id__isnull=True) & visibility_filter(user)),
+            'deleted_at'
+        )
+
+    def initial_token(self, now=None):
+        now = now or timezone.now()
+        return encode_token({name: (now, None) for name in self.streams})
+
+    def read(self, token, limit=DEFAULT_LIMIT):
+        """
+        Retourne {'changed': [tâches], 'deleted': [identifiants], 'token', 'has_more'}.
+        Lève InvalidToken ou ExpiredToken.
+        """
+        now = timezone.now()
+        positions = decode_token(token, self.streams)
+        if positions['deleted'][0] < now - tombstone_retention():
+            raise ExpiredToken("Jeton trop ancien, rechargement complet nécessaire")
+        synced_at = min(timestamp for timestamp, _ in positions.values())
+        if TaskFeedReset.objects.filter(user_id=self.user.pk, created_at__gt=synced_at).exists():
+            raise ExpiredToken("Nouvelles tâches visibles, rechargement complet nécessaire")
+
+        changed, positions['tasks'], more_tasks = self.tasks.read(positions['tasks'], limit, now)
+        deleted, positions['deleted'], more_deleted = self.deleted.read(positions['deleted'], limit, now)
+        deleted = {tombstone.task_id for tombstone in deleted}
+        if deleted:
+            deleted -= set(self.tasks_queryset.filter(pk__in=deleted).values_list('pk', flat=True))
+        return {
+            'changed': changed,
+            'deleted': sorted(deleted),
+            'token': encode_token(positions),
+            'has_more': more_tasks or more_deleted,
+        }
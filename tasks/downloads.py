@@ -0,0 +1,224 @@
+"""
+Téléchargement des documents de tâches : GET /api/documents/<id>/download/
+(aperçu : GET /api/documents/<id>/preview/, voir tasks/previews.py)
+
+Réservé aux utilisateurs qui voient la tâche (session ou jeton JWT). Gère les
+requêtes conditionnelles (ETag, Last-Modified : 304) et les plages d'octets
+(Range, If-Range : 206, 416) pour reprendre un téléchargement interrompu ou
+afficher une page d'un PDF sans tout télécharger.
+
+Selon `DOCUMENT_SERVE_BACKEND`, le fichier est :
+- lu et envoyé par Django (''), par blocs de DOCUMENT_DOWNLOAD_BLOCK_SIZE ;
+  sans plage, le serveur WSGI peut utiliser sendfile (wsgi.file_wrapper) ;
+- confié au serveur web frontal après la vérification des droits :
+  'x-accel-redirect' (nginx, emplacement `internal` sous
+  DOCUMENT_ACCEL_REDIRECT_PREFIX) ou 'x-sendfile' (Apache mod_xsendfile,
+  lighttpd). Le frontal gère alors lui-même les plages et les requêtes
+  conditionnelles ; le worker est libéré immédiatement.
+
+`?inline=1` n'affiche dans le navigateur que les types sans script
+(INLINE_CONTENT_TYPES : PDF et images matricielles) ; tout autre fichier,
+HTML ou SVG en tête, est envoyé en pièce jointe avec
+`Content-Security-Policy: sandbox` pour qu'un document déposé ne puisse
+jamais s'exécuter dans l'origine de l'application.
+"""
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from projects.streams import authenticate
+from .models import DocumentPreview, Task, TaskDocument
+from .previews import preview_file
+
+DEFAULT_BLOCK_SIZE = 512 * 1024
+
+# Types affichables dans le navigateur (?inline=1) : aucun ne peut exécuter de script
+INLINE_CONTENT_TYPES = frozenset({
+    'application/pdf', 'image/png', 'image/jpeg', 'image/gif', 'image/webp', 'image/bmp',
+})
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header, size):
+    """
+    Retourne la plage (début, fin incluse) demandée par l'en-tête Range, ou None
+    pour envoyer le fichier entier (pas d'en-tête, syntaxe non reconnue ou plages
+    multiples, que la norme permet d'ignorer).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+class RangeFile:
+    """Lecture limitée à `length` octets d'un fichier déjà positionné."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def document_etag(document, size, mtime):
+    if document.blob_id:
+        # Contenu adressé par son empreinte : l'ETag ne change jamais
+        return quote_etag(document.blob.sha256)
+    return quote_etag(f'{size:x}-{int(mtime):x}')
+
+
+def range_applies(request, etag, last_modified):
+    """If-Range : la plage n'est servie que si la version du client est toujours la bonne."""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(last_modified) <= since
+
+
+def secure_headers(response, as_attachment):
+    response['X-Content-Type-Options'] = 'nosniff'
+    if as_attachment:
+        response['Content-Security-Policy'] = 'sandbox'
+    return response
+
+
+def offloaded_response(document, content_type, disposition):
+    backend = getattr(settings, 'DOCUMENT_SERVE_BACKEND', '')
+    response = HttpResponse(content_type=content_type)
+    if backend == 'x-accel-redirect':
+        prefix = getattr(settings, 'DOCUMENT_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(document.file.name)
+    else:
+        response['X-Sendfile'] = document.file.path
+    response['Content-Disposition'] = disposition
+    return response
+
+
+def serve_document(request, document):
+    storage, name = document.file.storage, document.file.name
+    filename = document.filename()
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    as_attachment = (
+        request.GET.get('inline') not in ('1', 'true') or content_type not in INLINE_CONTENT_TYPES
+    )
+    disposition = content_disposition_header(as_attachment, filename)
+
+    if getattr(settings, 'DOCUMENT_SERVE_BACKEND', ''):
+        return secure_headers(offloaded_response(document, content_type, disposition), as_attachment)
+
+    size = storage.size(name)
+    mtime = storage.get_modified_time(name).timestamp()
+    etag = document_etag(document, size, mtime)
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(mtime))
+    if not_modified is not None:
+        return not_modified
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), size) if range_applies(request, etag, mtime) else None
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    file = storage.open(name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response.block_size = getattr(settings, 'DOCUMENT_DOWNLOAD_BLOCK_SIZE', DEFAULT_BLOCK_SIZE)
+    response['Content-Disposition'] = disposition
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(mtime)
+    response['Cache-Control'] = 'private, no-cache'
+    return secure_headers(response, as_attachment)
+
+
+def visible_document(request, pk):
+    """Retourne (document, None), ou (None, réponse d'erreur) si l'accès est refusé."""
+    user = request.user if request.user.is_authenticated else authenticate(request)
+    if user is None:
+        return None, JsonResponse({'detail': "Authentification requise."}, status=401)
+    document = TaskDocument.objects.select_related('blob').filter(
+        pk=pk, task__in=Task.objects.visible_to(user).values('pk')
+    ).first()
+    if document is None or not document.file:
+        return None, JsonResponse({'detail': "Document introuvable."}, status=404)
+    return document, None
+
+
+@require_safe
+def document_download(request, pk):
+    document, error = visible_document(request, pk)
+    if error is not None:
+        return error
+    return serve_document(request, document)
+
+
+@require_safe
+def document_preview(request, pk):
+    """
+    Aperçu JPEG du document (voir tasks/previews.py) ; 202 tant qu'il est en cours
+    de génération, 404 s'il n'y en aura pas.
+    """
+    document, error = visible_document(request, pk)
+    if error is not None:
+        return error
+    preview = DocumentPreview.objects.filter(document=document).first()
+    path = preview_file(preview) if preview is not None else None
+    if path is None:
+        status = preview.status if preview is not None else None
+        if status in ('pending', 'running'):
+            return JsonResponse({'status': status}, status=202)
+        return JsonResponse({'detail': "Pas d'aperçu pour ce document.", 'status': status}, status=404)
+
+    etag = quote_etag(preview.cache_key)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+    response = FileResponse(open(path, 'rb'), content_type='image/jpeg')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
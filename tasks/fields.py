@@ -0,0 +1,101 @@
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.utils.functional import cached_property
+
+
+class RankedChoiceField(models.PositiveSmallIntegerField):
+    """
+    Champ à choix stocké en base sous forme d'entier court (rang), mais manipulé
+    en Python avec les codes texte des choix ('todo', 'high', ...).
+
+    Le rang d'un code est sa position dans `choices` : l'ordre des choix définit
+    donc l'ordre de tri en base. Les filtres (`status='done'`,
+    `priority__in=[...]`, `priority__gte='high'`) sont traduits en rangs, et les
+    valeurs lues sont reconverties en codes. Formulaires, admin et serializers
+    continuent donc de voir les codes texte, tandis que le tri et le filtrage se
+    font sur une colonne entière indexable. Pour convertir une colonne de codes
+    existante, voir `ranked_choice_conversion`.
+    """
+    description = "Choix stocké sous forme de rang entier"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        codes = [code for code, _ in self.flatchoices]
+        self.rank_by_code = {code: rank for rank, code in enumerate(codes)}
+        self.code_by_rank = dict(enumerate(codes))
+
+    @cached_property
+    def validators(self):
+        # Les validateurs de bornes entières ne s'appliquent pas aux codes texte
+        return [*self.default_validators, *self._validators]
+
+    def rank(self, value):
+        if value is None or value == '':
+            return None
+        if isinstance(value, str) and value in self.rank_by_code:
+            return self.rank_by_code[value]
+        if isinstance(value, int) and value in self.code_by_rank:
+            return value
+        raise ValueError(f"Le champ '{self.name}' attendait l'un des codes {list(self.rank_by_code)}, reçu {value!r}.")
+
+    def to_python(self, value):
+        if value is None or value in self.rank_by_code:
+            return value
+        try:
+            return self.code_by_rank[int(value)]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return self.code_by_rank.get(value, value)
+
+    def get_prep_value(self, value):
+        value = models.Field.get_prep_value(self, value)
+        return self.rank(value)
+
+
+def ranked_choice_conversion(model_label, code_field, rank_field, choices):
+    """
+    Retourne les fonctions (aller, retour) d'un `migrations.RunPython` qui
+    convertit une colonne de codes texte en rangs de RankedChoiceField, et
+    inversement. Une migration de passage à RankedChoiceField :
+
+    1. AddField de `rank_field` (PositiveSmallIntegerField, null=True) ;
+    2. RunPython(*ranked_choice_conversion('tasks.Task', 'status', 'status_rank',
+       STATUS_CHOICES)) ;
+    3. RemoveField de `code_field`, RenameField de `rank_field` vers
+       `code_field`, puis AlterField vers RankedChoiceField.
+
+    `choices` est recopié dans la migration : le rang d'un code est sa position,
+    comme pour le champ. Une requête UPDATE par choix ; l'aller échoue avant
+    toute écriture si la colonne contient un code absent de `choices`.
+    """
+    codes = [code for code, _ in choices]
+
+    def forward(apps, schema_editor):
+        model = apps.get_model(model_label)
+        manager = model._base_manager.using(schema_editor.connection.alias)
+        unknown = set(manager.exclude(**{f'{code_field}__in': codes}).exclude(
+            **{f'{code_field}__isnull': True}
+        ).values_list(code_field, flat=True).distinct()[:10])
+        if unknown:
+            raise ValueError(
+                f"{model_label}.{code_field} contient des codes inconnus : {sorted(unknown)} "
+                f"(attendus : {codes})"
+            )
+        for rank, code in enumerate(codes):
+            manager.filter(**{code_field: code}).update(**{rank_field: rank})
+
+    def backward(apps, schema_editor):
+        model = apps.get_model(model_label)
+        manager = model._base_manager.using(schema_editor.connection.alias)
+        for rank, code in enumerate(codes):
+            manager.filter(**{rank_field: rank}).update(**{code_field: code})
+
+    return forward, backward
@@ -32,8 +32,6 @@ class TaskForm(forms.ModelForm):
         cleaned_data = super().clean()
         start_date = cleaned_data.get('start_date')
         end_date = cleaned_data.get('end_date')
-        status = cleaned_data.get('status')
-        old_status = self.instance.status if self.instance.pk else None
 
         # Validation des dates
         if start_date and end_date and start_date > end_date:
@@ -41,13 +39,8 @@ class TaskForm(forms.ModelForm):
                 "La date de début ne peut pas être postérieure à la date de fin."
             )
 
-        # Validation du changement de statut
-        if old_status and status != old_status:
-            valid_transitions = Task.VALID_STATUS_TRANSITIONS.get(old_status, [])
-            if status not in valid_transitions:
-                raise forms.ValidationError(
-                    f"Impossible de passer directement de '{self.instance.get_status_display()}' à '{dict(Task.STATUS_CHOICES)[status]}'"
-                )
+        # Les transitions de statut sont validées par Task.clean (machine à états
+        # de tasks/status.py), appelé par la validation du ModelForm
 
         return cleaned_data
 
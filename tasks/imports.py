@@ -0,0 +1,345 @@
+"""
+Import en masse de tâches depuis un fichier CSV ou JSON (commande import_tasks,
+POST /api/tasks/import/).
+
+Le fichier est lu au fil de l'eau (csv.DictReader, ou décodage incrémental d'un
+tableau JSON / de lignes NDJSON) et traité par lots : les projets et les
+utilisateurs référencés par un lot sont résolus en une requête chacun (les
+références déjà vues sont gardées en mémoire), chaque ligne est validée avec
+les règles du modèle (choix, longueur du titre, `validate_date_range` comme
+Task.clean), puis les lignes valides sont insérées par `bulk_create` dans une
+transaction par lot. Les lignes invalides sont rapportées avec leur numéro et
+n'empêchent pas l'import des autres, sauf en mode `atomic` (tout ou rien).
+"""
+import codecs
+import csv
+import datetime
+import json
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from accounts.models import User
+from projects.models import Project
+from .models import Task, validate_date_range
+from .signals import tasks_bulk_changed
+
+DEFAULT_BATCH_SIZE = 1000
+# Erreurs détaillées conservées dans le rapport (les suivantes sont seulement comptées)
+MAX_REPORTED_ERRORS = 1000
+# Taille des blocs lus dans le fichier
+READ_SIZE = 64 * 1024
+# Taille maximale d'un objet JSON (au-delà, le fichier est tenu pour mal formé)
+MAX_JSON_OBJECT_SIZE = 1024 * 1024
+# Une erreur JSON plus proche que cela de la fin du texte lu peut venir d'un
+# élément coupé par la fin du bloc (nombre, littéral) : on lit le bloc suivant
+JSON_TAIL_SIZE = 64
+
+FORMATS = ('csv', 'json')
+
+
+class ImportFormatError(Exception):
+    """Fichier illisible (format inconnu, JSON mal formé) : l'import est interrompu."""
+
+
+def guess_format(filename, default='csv'):
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension in ('json', 'ndjson', 'jsonl'):
+        return 'json'
+    if extension == 'csv':
+        return 'csv'
+    return default
+
+
+def text_blocks(stream, encoding='utf-8-sig'):
+    """Itère sur les blocs décodés d'un fichier binaire, sans tout lire en mémoire."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for block in iter(lambda: stream.read(READ_SIZE), b''):
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def text_lines(stream):
+    pending = ''
+    for block in text_blocks(stream):
+        *lines, pending = (pending + block).split('\n')
+        for line in lines:
+            yield line + '\n'
+    if pending:
+        yield pending
+
+
+def read_csv(stream):
+    """Lignes (numéro de ligne, dictionnaire) d'un CSV avec en-tête (séparateur , ou ;)."""
+    lines = text_lines(stream)
+    header = next(lines, '')
+    delimiter = ';' if header.count(';') > header.count(',') else ','
+    reader = csv.DictReader(_prepend(header, lines), delimiter=delimiter)
+    for row in reader:
+        yield reader.line_num, {key.strip(): value for key, value in row.items() if key}
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def read_json(stream):
+    """
+    Objets (numéro, dictionnaire) d'un tableau JSON ou d'un fichier NDJSON, décodés
+    un par un au fil de la lecture. Seule une erreur située en fin de texte lu
+    (objet coupé par la fin d'un bloc) fait lire la suite : toute autre erreur
+    interrompt l'import aussitôt, sans relire le reste du fichier à chaque bloc.
+    """
+    decoder = json.JSONDecoder()
+    blocks = text_blocks(stream)
+    buffer, position, number = '', 0, 0
+    exhausted = False
+    while True:
+        # Séparateurs entre objets : espaces, virgules, crochets du tableau
+        while position < len(buffer) and buffer[position] in ' \t\r\n,[]':
+            position += 1
+        if position >= len(buffer):
+            if exhausted:
+                return
+            buffer, position = next(blocks, None), 0
+            if buffer is None:
+                return
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as exc:
+            truncated = exc.msg.startswith('Unterminated string') or len(buffer) - exc.pos <= JSON_TAIL_SIZE
+            if exhausted or not truncated:
+                raise ImportFormatError(f"JSON invalide après l'élément {number} : {exc.msg}")
+            if len(buffer) - position > MAX_JSON_OBJECT_SIZE:
+                raise ImportFormatError(
+                    f"JSON invalide après l'élément {number} : élément de plus de {MAX_JSON_OBJECT_SIZE} caractères"
+                )
+            block = next(blocks, None)
+            if block is None:
+                exhausted = True
+            else:
+                buffer = buffer[position:] + block
+                position = 0
+            continue
+        number += 1
+        if not isinstance(value, dict):
+            raise ImportFormatError(f"L'élément {number} n'est pas un objet JSON.")
+        yield number, value
+        position = end
+
+
+READERS = {'csv': read_csv, 'json': read_json}
+
+
+class ImportResult:
+    def __init__(self):
+        self.created = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'error_count': self.error_count, 'errors': self.errors}
+
+
+def _clean(value):
+    if value is None:
+        return ''
+    return str(value).strip()
+
+
+def _is_id(ref):
+    """Référence en chiffres ASCII : un identifiant (int() accepterait aussi '٣' ou '²')."""
+    return ref.isascii() and ref.isdigit()
+
+
+def _resolve_refs(refs, queryset, name_field):
+    """
+    Retourne {référence: identifiant ou None}. Une référence en chiffres désigne
+    d'abord l'identifiant, puis le nom s'il n'existe pas d'objet de cet
+    identifiant ; les deux correspondances sont cherchées séparément, sans
+    dépendre de l'ordre des lignes lues. Entre homonymes, le plus ancien l'emporte.
+    """
+    ids = {int(ref) for ref in refs if _is_id(ref)}
+    by_pk, by_name = {}, {}
+    for pk, name in queryset.filter(Q(pk__in=ids) | Q(**{f'{name_field}__in': refs})).order_by(
+        'pk'
+    ).values_list('pk', name_field):
+        if pk in ids:
+            by_pk[pk] = pk
+        by_name.setdefault(name, pk)
+    resolved = {}
+    for ref in refs:
+        pk = by_pk.get(int(ref)) if _is_id(ref) else None
+        resolved[ref] = pk if pk is not None else by_name.get(ref)
+    return resolved
+
+
+class TaskImporter:
+    """
+    Colonnes reconnues : title (obligatoire), description, project (identifiant ou
+    nom ; facultatif si un projet par défaut est donné), assigned_to (identifiant
+    ou nom d'utilisateur), status et priority (code ou libellé), start_date et
+    end_date (AAAA-MM-JJ ou JJ/MM/AAAA).
+
+    `user` : auteur des tâches ; si `restrict_projects` est vrai, seuls les projets
+    dont il est membre ou chef de projet sont acceptés (import par l'API).
+    """
+
+    def __init__(self, user=None, project=None, batch_size=DEFAULT_BATCH_SIZE,
+                 restrict_projects=False, atomic=False, dry_run=False):
+        self.user = user
+        self.default_project = project
+        self.batch_size = batch_size
+        self.restrict_projects = restrict_projects
+        self.atomic = atomic
+        self.dry_run = dry_run
+        self.projects = {}
+        self.users = {}
+        self.statuses = self._choice_map(Task.STATUS_CHOICES)
+        self.priorities = self._choice_map(Task.PRIORITY_CHOICES)
+        self.title_length = Task._meta.get_field('title').max_length
+        self.date_field = forms.DateField()
+
+    @staticmethod
+    def _choice_map(choices):
+        mapping = {}
+        for code, label in choices:
+            mapping[code.lower()] = code
+            mapping[label.lower()] = code
+        return mapping
+
+    def run(self, stream, file_format):
+        """
+        Importe le fichier ; retourne un ImportResult. En simulation (`dry_run`),
+        `created` compte les lignes valides et rien n'est écrit.
+        """
+        if file_format not in READERS:
+            raise ImportFormatError(f"Format inconnu : {file_format} (attendu : {', '.join(FORMATS)}).")
+        result = ImportResult()
+        rows = READERS[file_format](stream)
+        if self.atomic:
+            with transaction.atomic():
+                self._import(rows, result)
+                if result.error_count:
+                    # Tout ou rien : aucune tâche n'est conservée
+                    transaction.set_rollback(True)
+                    result.created = 0
+        else:
+            self._import(rows, result)
+        return result
+
+    def _import(self, rows, result):
+        batch = []
+        for line, row in rows:
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch, result)
+                batch = []
+        if batch:
+            self._import_batch(batch, result)
+
+    def _import_batch(self, batch, result):
+        self._resolve([row for _, row in batch])
+        tasks = []
+        for line, row in batch:
+            try:
+                tasks.append(self.build_task(row))
+            except ValidationError as exc:
+                result.add_error(line, exc.message_dict if hasattr(exc, 'error_dict') else exc.messages)
+        if not tasks:
+            return
+        if self.dry_run:
+            result.created += len(tasks)
+            return
+        with transaction.atomic():
+            created = Task.objects.bulk_create(tasks)
+            tasks_bulk_changed.send(sender=Task, created=created, updated=[], previous={})
+        result.created += len(created)
+
+    def _resolve(self, rows):
+        """Charge en une requête chacun les projets et utilisateurs encore inconnus du lot."""
+        project_refs = {_clean(row.get('project')) for row in rows} - {''} - set(self.projects)
+        if project_refs:
+            queryset = Project.objects.all()
+            if self.restrict_projects:
+                membership = Project.team_members.through.objects.filter(
+                    project_id=OuterRef('pk'), user_id=self.user.pk
+                )
+                queryset = queryset.filter(Q(manager_id=self.user.pk) | Exists(membership))
+            self.projects.update(_resolve_refs(project_refs, queryset, 'name'))
+
+        user_refs = {_clean(row.get('assigned_to')) for row in rows} - {''} - set(self.users)
+        if user_refs:
+            self.users.update(_resolve_refs(user_refs, User.objects.all(), 'username'))
+
+    def parse_date(self, value):
+        value = _clean(value)
+        if not value:
+            return None
+        try:
+            return datetime.date.fromisoformat(value)
+        except ValueError:
+            # Formats de saisie de la langue courante (JJ/MM/AAAA en français)
+            return self.date_field.to_python(value)
+
+    def build_task(self, row):
+        """Construit la tâche d'une ligne (non enregistrée) ; ValidationError si invalide."""
+        errors = {}
+        title = _clean(row.get('title'))
+        if not title:
+            errors['title'] = ["Ce champ est obligatoire."]
+        elif len(title) > self.title_length:
+            errors['title'] = [f"Au plus {self.title_length} caractères."]
+
+        project_ref = _clean(row.get('project'))
+        project_id = self.projects.get(project_ref) if project_ref else getattr(self.default_project, 'pk', None)
+        if project_id is None:
+            errors['project'] = [f"Projet introuvable : {project_ref}." if project_ref else "Ce champ est obligatoire."]
+
+        assignee_ref = _clean(row.get('assigned_to'))
+        assigned_to_id = self.users.get(assignee_ref) if assignee_ref else None
+        if assignee_ref and assigned_to_id is None:
+            errors['assigned_to'] = [f"Utilisateur introuvable : {assignee_ref}."]
+
+        values = {}
+        for name, mapping, default in (('status', self.statuses, 'todo'), ('priority', self.priorities, 'medium')):
+            ref = _clean(row.get(name))
+            values[name] = mapping.get(ref.lower()) if ref else default
+            if values[name] is None:
+                errors[name] = [f"Valeur inconnue : {ref}."]
+
+        for name in ('start_date', 'end_date'):
+            try:
+                values[name] = self.parse_date(row.get(name))
+            except ValidationError:
+                errors[name] = ["Date invalide (AAAA-MM-JJ ou JJ/MM/AAAA)."]
+
+        if not errors:
+            try:
+                validate_date_range(values['start_date'], values['end_date'])
+            except ValidationError as exc:
+                errors.update(exc.message_dict)
+        if errors:
+            raise ValidationError(errors)
+
+        return Task(
+            title=title,
+            description=_clean(row.get('description')),
+            project_id=project_id,
+            assigned_to_id=assigned_to_id,
+            created_by=self.user,
+            **values,
+        )
@@ -0,0 +1,330 @@
+import itertools
+import json
+import platform
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Notification, User
+from lon.benchmarking import summarize
+from lon.metrics import registry
+from projects.models import Project
+from tasks.models import Task, TaskDocument
+from tasks.pages import kanban_context
+from tasks.status import status_machine
+
+SCENARIOS = ('token', 'task_list', 'project_list', 'change_status', 'bulk_status', 'kanban')
+# Changement de statut aller-retour : todo -> in_progress -> todo
+STATUS_TOGGLE = {'todo': 'in_progress', 'in_progress': 'todo'}
+# Hôte des requêtes simulées, ajouté à ALLOWED_HOSTS le temps de la mesure
+BENCHMARK_HOST = 'testserver'
+
+
+def git_commit():
+    """Commit courant du dépôt (suffixé de `-dirty` si modifié), ou None hors dépôt git."""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'status', '--porcelain', '--untracked-files=no'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f'{commit}-dirty' if dirty else commit
+
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le débit et les latences (p50, p95, p99) des principaux points d'accès "
+        "de l'API sur les données de seed_benchmark_data, et enregistre le résultat en JSON"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help="Graine du jeu de données (seed_benchmark_data)")
+        parser.add_argument('--password', default='benchmark')
+        parser.add_argument('--users', type=int, default=20, help="Utilisateurs simulés")
+        parser.add_argument('--requests', type=int, default=200, help="Requêtes mesurées par scénario")
+        parser.add_argument('--warmup', type=int, default=10, help="Requêtes non mesurées par scénario")
+        parser.add_argument('--concurrency', type=int, default=1, help="Requêtes simultanées (threads)")
+        parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+        parser.add_argument(
+            '--bulk-size', type=int, default=1000,
+            help="Changements de statut par requête du scénario bulk_status (dans la limite des tâches disponibles)"
+        )
+        parser.add_argument('--no-cache', action='store_true', help="Désactive le cache des réponses")
+        parser.add_argument(
+            '--output', help="Fichier JSON du résultat (par défaut <BASE_DIR>/benchmark-results/<date>-<commit>.json)"
+        )
+        parser.add_argument('--compare', help="Résultat JSON précédent à comparer")
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.filter(username__startswith=f"bench{options['seed']}_user").order_by('pk')[:options['users']]
+        )
+        if not users:
+            raise CommandError(f"Aucune donnée pour la graine {options['seed']} : lancer seed_benchmark_data")
+        self.application = get_wsgi_application()
+        self.factory = RequestFactory(SERVER_NAME=BENCHMARK_HOST)
+        self.users = users
+        self.tokens = [str(AccessToken.for_user(user)) for user in users]
+        self.options = options
+
+        commit = git_commit()
+        result = {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'machine': platform.machine(),
+            },
+            'options': {
+                name: options[name]
+                for name in ('seed', 'users', 'requests', 'warmup', 'concurrency', 'scenarios', 'bulk_size', 'no_cache')
+            },
+            'dataset': self.dataset(),
+            'scenarios': {},
+        }
+        self.stdout.write(
+            f"{len(users)} utilisateurs, {options['requests']} requêtes par scénario, "
+            f"{options['concurrency']} simultanée(s), commit {commit or 'inconnu'}"
+        )
+        # Pas de journalisation des requêtes lentes pendant la mesure ; l'hôte
+        # simulé doit passer la validation de l'en-tête Host (DEBUG désactivé)
+        overrides = {
+            'METRICS_SLOW_REQUEST_MS': None,
+            'ALLOWED_HOSTS': [*settings.ALLOWED_HOSTS, BENCHMARK_HOST],
+        }
+        if options['no_cache']:
+            overrides['API_CACHE_ENABLED'] = False
+        with override_settings(**overrides):
+            for name in options['scenarios']:
+                self.cleanup = None
+                summary = self.run_scenario(getattr(self, f'scenario_{name}')())
+                result['scenarios'][name] = summary
+                self.report(name, summary)
+
+        # Des latences d'erreurs ne mesurent rien : pas de résultat enregistré
+        failed = [name for name, summary in result['scenarios'].items() if summary['errors']]
+        if failed:
+            raise CommandError(
+                "Réponses en erreur dans les scénarios : "
+                + ', '.join(f"{name} ({result['scenarios'][name]['statuses']})" for name in failed)
+            )
+        output = Path(options['output'] or settings.BASE_DIR / 'benchmark-results' / (
+            f"{timezone.now():%Y%m%d-%H%M%S}-{commit or 'sans-commit'}.json"
+        ))
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(result, indent=2, ensure_ascii=False) + '\n')
+        self.stdout.write(f"Résultat enregistré dans {output}")
+        if options['compare']:
+            self.compare(result, json.loads(Path(options['compare']).read_text()))
+
+    def dataset(self):
+        prefix = f"bench{self.options['seed']}"
+        projects = Project.objects.filter(name__startswith=f'{prefix} projet')
+        return {
+            'seed': self.options['seed'],
+            'users': User.objects.filter(username__startswith=f'{prefix}_user').count(),
+            'projects': projects.count(),
+            'tasks': Task.objects.filter(project__in=projects).count(),
+            'documents': TaskDocument.objects.filter(task__project__in=projects).count(),
+            'notifications': Notification.objects.filter(user__username__startswith=f'{prefix}_user').count(),
+        }
+
+    def call(self, request):
+        """Appelle l'application WSGI ; retourne le statut HTTP."""
+        statuses = []
+        response = self.application(request.environ, lambda status, headers: statuses.append(int(status[:3])))
+        b''.join(response)
+        response.close()
+        return statuses[0]
+
+    def get(self, index, path):
+        token = self.tokens[index % len(self.tokens)]
+        return self.call(self.factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token}'))
+
+    def scenario_token(self):
+        def run(index):
+            user = self.users[index % len(self.users)]
+            body = json.dumps({'username': user.username, 'password': self.options['password']})
+            return self.call(self.factory.post('/api/token/', body, content_type='application/json'))
+        return run
+
+    def scenario_task_list(self):
+        return lambda index: self.get(index, '/api/tasks/')
+
+    def scenario_project_list(self):
+        return lambda index: self.get(index, '/api/projects/')
+
+    def scenario_change_status(self):
+        """
+        Aller-retour todo <-> in_progress sur des tâches distinctes de chaque
+        utilisateur ; les statuts d'origine sont rétablis après la mesure. Chaque
+        thread a ses propres tâches : deux requêtes simultanées ne changent jamais
+        le statut d'une même tâche (sinon 409).
+        """
+        workers = max(self.options['concurrency'], 1)
+        candidates = []
+        per_user = max(self.options['requests'] // len(self.users), 1) * workers + self.options['warmup']
+        for user_index, user in enumerate(self.users):
+            tasks = Task.objects.visible_to(user).filter(status__in=STATUS_TOGGLE).exclude(
+                pk__in=[task_id for _, task_id in candidates]
+            ).order_by('pk').values_list('pk', flat=True)[:per_user]
+            candidates.extend((user_index, task_id) for task_id in tasks)
+        if len(candidates) < workers:
+            raise CommandError(
+                f"Pas assez de tâches à faire ou en cours pour {workers} thread(s) dans le scénario change_status"
+            )
+        initial = dict(Task.objects.filter(pk__in=[task_id for _, task_id in candidates]).values_list('pk', 'status'))
+        current = dict(initial)
+        self.cleanup = lambda: self.restore_statuses(initial)
+        # Tâches réparties entre les threads ; le fil principal (échauffement) se
+        # termine avant que les threads de mesure ne commencent
+        groups = [candidates[slot::workers] for slot in range(workers)]
+        slots = itertools.count()
+        local = threading.local()
+
+        def run(index):
+            if not hasattr(local, 'tasks'):
+                local.tasks, local.calls = groups[next(slots) % workers], 0
+            user_index, task_id = local.tasks[local.calls % len(local.tasks)]
+            local.calls += 1
+            status = current[task_id] = STATUS_TOGGLE[current[task_id]]
+            token = self.tokens[user_index]
+            return self.call(self.factory.post(
+                f'/api/tasks/{task_id}/change_status/', json.dumps({'status': status}),
+                content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {token}',
+            ))
+        return run
+
+    def scenario_bulk_status(self):
+        """
+        POST /api/tasks/bulk/ de `--bulk-size` changements de statut aller-retour
+        todo <-> in_progress (notifications de l'équipe comprises). Chaque thread a
+        son utilisateur et ses tâches ; les statuts d'origine sont rétablis après
+        la mesure.
+        """
+        workers = max(self.options['concurrency'], 1)
+        groups = []
+        taken = set()
+        for slot in range(workers):
+            user_index = slot % len(self.users)
+            tasks = list(Task.objects.visible_to(self.users[user_index]).filter(status__in=STATUS_TOGGLE).exclude(
+                pk__in=taken
+            ).order_by('pk').values_list('pk', flat=True)[:self.options['bulk_size']])
+            if not tasks:
+                raise CommandError(
+                    f"Pas assez de tâches à faire ou en cours pour {workers} thread(s) dans le scénario bulk_status"
+                )
+            taken.update(tasks)
+            groups.append((user_index, tasks))
+        initial = dict(Task.objects.filter(pk__in=taken).values_list('pk', 'status'))
+        current = dict(initial)
+        self.cleanup = lambda: self.restore_statuses(initial)
+        slots = itertools.count()
+        local = threading.local()
+
+        def run(index):
+            if not hasattr(local, 'group'):
+                local.group = groups[next(slots) % workers]
+            user_index, tasks = local.group
+            changes = []
+            for task_id in tasks:
+                status = current[task_id] = STATUS_TOGGLE[current[task_id]]
+                changes.append({'id': task_id, 'status': status})
+            return self.call(self.factory.post(
+                '/api/tasks/bulk/', json.dumps({'status': changes}), content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {self.tokens[user_index]}',
+            ))
+        return run
+
+    def restore_statuses(self, initial):
+        for task in Task.objects.filter(pk__in=initial):
+            if task.status != initial[task.pk]:
+                status_machine.transition(task, initial[task.pk])
+
+    def scenario_kanban(self):
+        """Rendu du tableau kanban de l'utilisateur (contexte et gabarit, sans route HTTP)."""
+        def run(index):
+            user = self.users[index % len(self.users)]
+            render_to_string('tasks/_kanban_board.html', kanban_context(user))
+            return 200
+        return run
+
+    def run_scenario(self, run):
+        try:
+            for index in range(self.options['warmup']):
+                run(index)
+            registry.reset()
+            durations = []
+            statuses = {}
+            lock = threading.Lock()
+            offset = self.options['warmup']
+
+            def timed(index):
+                started = time.perf_counter()
+                status = run(offset + index)
+                duration = time.perf_counter() - started
+                with lock:
+                    durations.append(duration)
+                    statuses[status] = statuses.get(status, 0) + 1
+
+            started = time.perf_counter()
+            if self.options['concurrency'] > 1:
+                with ThreadPoolExecutor(max_workers=self.options['concurrency']) as executor:
+                    list(executor.map(timed, range(self.options['requests'])))
+            else:
+                for index in range(self.options['requests']):
+                    timed(index)
+            summary = summarize(durations, time.perf_counter() - started)
+        finally:
+            if self.cleanup is not None:
+                self.cleanup()
+        summary['errors'] = sum(count for status, count in statuses.items() if status >= 400)
+        summary['statuses'] = {str(status): count for status, count in sorted(statuses.items())}
+        # Requêtes SQL par appel, relevées par RequestMetricsMiddleware
+        queries, calls = registry.totals('lon_request_queries')
+        summary['queries_per_request'] = round(queries / calls, 1) if calls else None
+        return summary
+
+    def report(self, name, summary):
+        if not summary['requests']:
+            self.stdout.write(f"{name:>14} : aucune requête mesurée")
+            return
+        queries = summary['queries_per_request']
+        rps = '-' if summary['rps'] is None else summary['rps']
+        self.stdout.write(
+            f"{name:>14} : {rps:>8} req/s, p50 {summary['p50_ms']} ms, "
+            f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms, "
+            f"{'-' if queries is None else queries} requêtes SQL par appel, {summary['errors']} erreur(s)"
+        )
+
+    def compare(self, result, previous):
+        self.stdout.write(self.style.MIGRATE_HEADING(f"Comparaison avec {previous.get('commit') or 'le résultat précédent'}"))
+        for name, summary in result['scenarios'].items():
+            before = previous.get('scenarios', {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key, label in (('rps', 'débit'), ('p50_ms', 'p50'), ('p95_ms', 'p95'), ('p99_ms', 'p99')):
+                if before.get(key) and summary.get(key) is not None:
+                    changes.append(f"{label} {(summary[key] - before[key]) / before[key] * 100:+.1f} %")
+            self.stdout.write(f"{name:>14} : {', '.join(changes) or '-'}")
@@ -0,0 +1,188 @@
+import asyncio
+import importlib
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Notification, User
+from clients.models import Client
+from lon.benchmarking import seed_tasks
+from projects.models import Project
+from tasks.models import Task
+
+URLCONF_MODULES = ('projects.urls', 'accounts.urls', 'lon.urls')
+ASYNC_ROUTES = ('tasks', 'projects', 'notifications')
+
+
+def reload_urlconf():
+    """Recharge les URLconf : les routes asynchrones dépendent de API_ASYNC_READ_ROUTES."""
+    clear_url_caches()
+    for name in URLCONF_MODULES:
+        importlib.reload(importlib.import_module(name))
+
+
+def summarize(durations, elapsed):
+    durations = sorted(durations)
+    return {
+        'rps': round(len(durations) / elapsed),
+        'median_ms': round(statistics.median(durations) * 1000, 1),
+        'p99_ms': round(durations[int(len(durations) * 0.99) - 1] * 1000, 1),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare les lectures de l'API (tâches, projets, notifications) servies par les "
+        "viewsets synchrones (WSGI, ASGI) et par les vues asynchrones (ASGI) sous concurrence"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200, help="Clients simultanés")
+        parser.add_argument('--requests', type=int, default=10, help="Requêtes par client")
+        parser.add_argument('--projects', type=int, default=100)
+        parser.add_argument('--tasks', type=int, default=10000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--cache', action='store_true', help="Garde le cache des réponses actif")
+
+    def handle(self, *args, **options):
+        data = seed_tasks(
+            projects=options['projects'], tasks=options['tasks'], users=options['users'], seed=1014
+        )
+        try:
+            self.run(data, options)
+        finally:
+            projects = [project.pk for project in data['projects']]
+            Task.objects.filter(project_id__in=projects).delete()
+            Project.objects.filter(pk__in=projects).delete()
+            Client.objects.filter(name='bench1014 client').delete()
+            User.objects.filter(pk__in=[user.pk for user in data['users']]).delete()
+
+    def run(self, data, options):
+        Notification.objects.bulk_create([
+            Notification(user=user, message=f'Notification {index}')
+            for user in data['users'] for index in range(20)
+        ])
+        users = data['users']
+        tokens = {user.pk: str(AccessToken.for_user(user)) for user in users}
+        # Un projet de l'équipe de chaque utilisateur, pour la route de détail
+        detail_project = {}
+        for project_id, user_id in Project.team_members.through.objects.filter(
+            user_id__in=tokens
+        ).values_list('project_id', 'user_id'):
+            detail_project.setdefault(user_id, project_id)
+        paths = [
+            '/api/tasks/?limit=50',
+            '/api/tasks/?limit=50&ordering=-delay',
+            '/api/projects/?limit=20&fields=id,name,status,progress',
+            '/api/projects/{project_id}/',
+            '/accounts/api/notifications/',
+        ]
+        # Chaque client fait la même suite de requêtes, avec son propre utilisateur
+        plan = []
+        for client in range(options['clients']):
+            user = users[client % len(users)]
+            plan.extend(
+                (tokens[user.pk], paths[(client + index) % len(paths)].format(project_id=detail_project[user.pk]))
+                for index in range(options['requests'])
+            )
+        self.stdout.write(
+            f"{options['clients']} clients simultanés, {len(plan)} requêtes, "
+            f"cache {'actif' if options['cache'] else 'désactivé'}"
+        )
+
+        modes = [
+            ('WSGI, viewsets synchrones', (), self.run_wsgi),
+            ('ASGI, viewsets synchrones', (), self.run_asgi),
+            ('ASGI, vues asynchrones', ASYNC_ROUTES, self.run_asgi),
+        ]
+        for label, routes, runner in modes:
+            with override_settings(API_ASYNC_READ_ROUTES=routes, API_CACHE_ENABLED=options['cache']):
+                reload_urlconf()
+                result, statuses = runner(plan, options['clients'])
+            reload_urlconf()
+            self.stdout.write(
+                f"{label:>26} : {result['rps']} req/s, médiane {result['median_ms']} ms, "
+                f"p99 {result['p99_ms']} ms (statuts {sorted(statuses)})"
+            )
+
+    def run_wsgi(self, plan, clients):
+        """Serveur WSGI à threads : un thread par client simultané."""
+        application = get_wsgi_application()
+        factory = RequestFactory()
+        statuses = set()
+
+        def call(item):
+            token, path = item
+            environ = factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token}').environ
+            started = time.perf_counter()
+            response = application(environ, lambda status, headers: statuses.add(int(status[:3])))
+            b''.join(response)
+            response.close()
+            return time.perf_counter() - started
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            durations = list(executor.map(call, plan))
+        return summarize(durations, time.perf_counter() - start), statuses
+
+    def run_asgi(self, plan, clients):
+        """Serveur ASGI : une coroutine par client simultané dans une seule boucle."""
+        return asyncio.run(self._run_asgi(plan, clients))
+
+    async def _run_asgi(self, plan, clients):
+        application = get_asgi_application()
+        statuses = set()
+        queue = asyncio.Queue()
+        for item in plan:
+            queue.put_nowait(item)
+        durations = []
+
+        async def call(token, path):
+            route, _, query = path.partition('?')
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'GET',
+                'scheme': 'http',
+                'path': route,
+                'raw_path': route.encode(),
+                'query_string': query.encode(),
+                'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+                'client': ('127.0.0.1', 0),
+                'server': ('localhost', 80),
+            }
+
+            sent = []
+
+            async def receive():
+                if not sent:
+                    sent.append(True)
+                    return {'type': 'http.request', 'body': b'', 'more_body': False}
+                # Pas de déconnexion : attente jusqu'à l'annulation par Django
+                await asyncio.Event().wait()
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    statuses.add(message['status'])
+
+            await application(scope, receive, send)
+
+        async def client():
+            while not queue.empty():
+                token, path = queue.get_nowait()
+                started = time.perf_counter()
+                await call(token, path)
+                durations.append(time.perf_counter() - started)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return summarize(durations, time.perf_counter() - start), statuses
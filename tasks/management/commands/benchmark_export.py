@@ -0,0 +1,51 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from lon.benchmarking import seed_tasks
+from tasks.models import Task
+from tasks.views import TaskViewSet
+
+
+class Command(BaseCommand):
+    help = "Mesure le pic mémoire et le débit de l'export en flux des tâches (CSV et NDJSON)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=500)
+        parser.add_argument('--tasks', type=int, default=1000000)
+        parser.add_argument('--users', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = seed_tasks(projects=options['projects'], tasks=options['tasks'], users=options['users'])
+            # Utilisateur membre de toutes les équipes : il voit toutes les tâches
+            user = data['users'][0]
+            for project in data['projects']:
+                project.team_members.add(user)
+            visible = Task.objects.visible_to(user).count()
+            self.stdout.write(f"{visible} tâches visibles pour {user.username}")
+
+            view = TaskViewSet.as_view({'get': 'export'}, **TaskViewSet.export.kwargs)
+            factory = APIRequestFactory()
+            for export_format in ('csv', 'ndjson'):
+                request = factory.get('/api/tasks/export/', {'format': export_format})
+                force_authenticate(request, user=user)
+                tracemalloc.start()
+                start = time.perf_counter()
+                response = view(request)
+                size = rows = 0
+                for chunk in response.streaming_content:
+                    size += len(chunk)
+                    rows += chunk.count(b'\n')
+                elapsed = time.perf_counter() - start
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                self.stdout.write(
+                    f"{export_format:>6} : {rows} lignes, {size / 1024 / 1024:.0f} Mo en {elapsed:.1f} s "
+                    f"({rows / elapsed:.0f} lignes/s), pic mémoire Python {peak / 1024 / 1024:.1f} Mo"
+                )
+
+            transaction.set_rollback(True)
@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from lon.benchmarking import measure, seed_tasks
+from lon.compact import CompactJSONRenderer, compile_serializer, orjson
+from tasks.models import Task
+from tasks.serializers import TaskSerializer
+from tasks.views import COMPACT_COMPUTED, TaskViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare la sérialisation d'une page de tâches par TaskSerializer et par le "
+        "serializer compilé (lignes/s), le rendu json et orjson, et la liste complète"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=100)
+        parser.add_argument('--tasks', type=int, default=20000)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--page-size', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = seed_tasks(
+                projects=options['projects'], tasks=options['tasks'], users=options['users'], seed=1023
+            )
+            self.run(data['users'][0], options)
+            transaction.set_rollback(True)
+
+    def rate(self, label, func, rows, repeat):
+        result = measure(func, repeat=repeat)
+        per_second = round(rows / result['median_ms'] * 1000) if result['median_ms'] else 0
+        self.stdout.write(
+            f"{label:<28} médiane {result['median_ms']:>8} ms  {per_second:>9} lignes/s  "
+            f"{result['queries']} requête(s)"
+        )
+        return result
+
+    def run(self, user, options):
+        size, repeat = options['page_size'], options['repeat']
+        queryset = Task.objects.visible_to(user).select_related(
+            'project', 'assigned_to', 'created_by'
+        ).with_timing().order_by('-created_at', '-pk')
+        instances = list(queryset[:size])
+        plan = compile_serializer(TaskSerializer(), COMPACT_COMPUTED)
+        rows = list(queryset.values(*plan.columns)[:size])
+        self.stdout.write(f"{len(instances)} tâches par page\n")
+
+        self.stdout.write("Sérialisation (lignes déjà chargées)")
+        self.rate('TaskSerializer', lambda: TaskSerializer(instances, many=True).data, len(instances), repeat)
+        self.rate('compilé', lambda: plan.serialize([dict(row) for row in rows]), len(rows), repeat)
+
+        payload = plan.serialize([dict(row) for row in rows])
+        self.stdout.write("\nRendu JSON")
+        self.rate('json (JSONRenderer)', lambda: JSONRenderer().render(payload), len(rows), repeat)
+        if orjson is None:
+            self.stdout.write("orjson n'est pas installé : CompactJSONRenderer utilise le rendu de DRF")
+        else:
+            self.rate('orjson (CompactJSONRenderer)', lambda: CompactJSONRenderer().render(payload), len(rows), repeat)
+
+        self.stdout.write("\nListe /api/tasks/ (lecture, sérialisation et rendu)")
+        factory = APIRequestFactory()
+        view = TaskViewSet.as_view({'get': 'list'})
+
+        def call():
+            request = factory.get('/api/tasks/', {'page_size': size})
+            force_authenticate(request, user=user)
+            view(request).render()
+
+        with override_settings(API_CACHE_ENABLED=False):
+            self.rate('chemin DRF', call, len(rows), repeat)
+            with override_settings(API_COMPACT_LIST_ROUTES=('tasks',)):
+                self.rate('chemin compact', call, len(rows), repeat)
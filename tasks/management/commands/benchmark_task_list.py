@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from lon.benchmarking import measure, seed_tasks
+from tasks.models import Task
+from tasks.views import TaskViewSet
+
+
+class LegacyTaskViewSet(TaskViewSet):
+    """
+    Reproduit l'ancien `get_queryset` (jointures OR + DISTINCT, journalisation
+    qui évalue le queryset, pas de select_related) pour comparaison.
+    """
+    def get_queryset(self):
+        user = self.request.user
+        [p.name for p in user.projects.all()]
+        [p.name for p in user.managed_projects.all()]
+        queryset = Task.objects.filter(
+            models.Q(assigned_to=user) |
+            models.Q(project__team_members=user) |
+            models.Q(project__manager=user)
+        ).distinct()
+        list(queryset.values_list('title', flat=True))
+        queryset.count()
+        return queryset
+
+
+class Command(BaseCommand):
+    help = "Mesure le nombre de requêtes et la latence de la liste des tâches (avant/après)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--projects', type=int, default=500)
+        parser.add_argument('--tasks', type=int, default=50000)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            data = seed_tasks(
+                projects=options['projects'],
+                tasks=options['tasks'],
+                users=options['users'],
+            )
+            user = data['users'][0]
+            factory = APIRequestFactory()
+
+            def call(viewset_class):
+                view = viewset_class.as_view({'get': 'list'})
+
+                def run():
+                    request = factory.get('/api/tasks/')
+                    force_authenticate(request, user=user)
+                    response = view(request)
+                    response.render()
+                return run
+
+            visible = Task.objects.visible_to(user).count()
+            self.stdout.write(f"{visible} tâches visibles pour {user.username}")
+            for label, viewset_class in [('avant', LegacyTaskViewSet), ('après', TaskViewSet)]:
+                result = measure(call(viewset_class), repeat=options['repeat'])
+                self.stdout.write(
+                    f"{label:>6} : {result['queries']} requêtes, "
+                    f"médiane {result['median_ms']} ms, min {result['min_ms']} ms"
+                )
+
+            transaction.set_rollback(True)
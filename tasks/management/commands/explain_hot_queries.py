@@ -0,0 +1,103 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from lon.pagination import KeysetPagination
+from projects.models import Project
+from projects.views import ProjectViewSet
+from tasks.models import Task
+from tasks.views import TaskViewSet
+
+User = get_user_model()
+
+
+def viewset_queryset(viewset_class, user, action='list'):
+    """Construit le queryset tel que le viewset le produit pour `action`."""
+    view = viewset_class()
+    view.action = action
+    view.format_kwarg = None
+    view.request = Request(APIRequestFactory().get('/'))
+    view.request.user = user
+    return view.get_queryset()
+
+
+def first_page(queryset):
+    """Applique le tri et la limite utilisés par KeysetPagination."""
+    paginator = KeysetPagination()
+    keys = paginator.get_ordering_keys(queryset, None)
+    return queryset.order_by(*paginator.get_order_by(keys, nulls_first=False))[:paginator.page_size]
+
+
+def deep_page(queryset, depth=10):
+    """
+    Page `depth` de KeysetPagination : prédicat du curseur positionné sur la
+    dernière ligne de la page précédente (à défaut, sur la première ligne).
+    """
+    paginator = KeysetPagination()
+    keys = paginator.get_ordering_keys(queryset, None)
+    ordered = queryset.order_by(*paginator.get_order_by(keys, nulls_first=False))
+    names = [key.name for key in keys]
+    offset = paginator.page_size * (depth - 1) - 1
+    values = ordered.values_list(*names)[offset:offset + 1].first() or ordered.values_list(*names).first()
+    if values is None:
+        return ordered[:paginator.page_size]
+    predicate = paginator.build_predicate(keys, list(values), nulls_first=False)
+    return ordered.filter(predicate)[:paginator.page_size]
+
+
+class Command(BaseCommand):
+    help = "Affiche le plan d'exécution (EXPLAIN) des requêtes fréquentes des viewsets"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Nom d'utilisateur pour les requêtes de visibilité")
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f"Utilisateur inconnu : {username}")
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError("Aucun utilisateur en base")
+        return user
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        today = timezone.now().date()
+        project = Project.objects.order_by('pk').first()
+        project_id = project.pk if project else 0
+
+        hot_queries = [
+            ("TaskViewSet.list (première page)",
+             first_page(viewset_queryset(TaskViewSet, user))),
+            ("TaskViewSet.list (page profonde)",
+             deep_page(viewset_queryset(TaskViewSet, user))),
+            ("TaskViewSet.list ?status=",
+             first_page(viewset_queryset(TaskViewSet, user).filter(status='in_progress'))),
+            ("TaskViewSet.list ?overdue=true&ordering=-delay",
+             viewset_queryset(TaskViewSet, user).overdue().order_by('-timing_delay', 'end_date', '-pk')[:50]),
+            ("Tâches assignées par statut",
+             Task.objects.filter(assigned_to=user, status='todo').order_by()),
+            ("Tâches d'un projet par statut",
+             Task.objects.filter(project_id=project_id, status='review').order_by()),
+            ("Tâches en retard",
+             Task.objects.overdue(today).order_by()),
+            ("Project.is_delayed",
+             Task.objects.filter(project_id=project_id, end_date__lt=today).exclude(status='done').order_by()),
+            ("ProjectViewSet.list (première page)",
+             first_page(viewset_queryset(ProjectViewSet, user))),
+            ("ProjectViewSet.list (page profonde)",
+             deep_page(viewset_queryset(ProjectViewSet, user))),
+            ("ProjectViewSet.managed",
+             first_page(Project.objects.filter(manager=user).with_task_counters())),
+        ]
+
+        self.stdout.write(f"Base : {connection.vendor}, utilisateur : {user.username}\n")
+        for label, queryset in hot_queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
@@ -0,0 +1,61 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import User
+from projects.models import Project
+from tasks.imports import DEFAULT_BATCH_SIZE, FORMATS, ImportFormatError, TaskImporter, guess_format
+
+
+class Command(BaseCommand):
+    help = "Importe des tâches depuis un fichier CSV ou JSON (voir tasks/imports.py pour les colonnes)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Par défaut, déduit de l'extension du fichier")
+        parser.add_argument('--user', help="Nom de l'utilisateur enregistré comme créateur des tâches")
+        parser.add_argument('--project', type=int, help="Projet des lignes sans colonne project")
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--atomic', action='store_true', help="Tout ou rien : aucune tâche importée si une ligne est invalide")
+        parser.add_argument('--dry-run', action='store_true', help="Valide le fichier sans rien enregistrer")
+
+    def handle(self, *args, **options):
+        user = project = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"Utilisateur introuvable : {options['user']}")
+        if options['project']:
+            project = Project.objects.filter(pk=options['project']).first()
+            if project is None:
+                raise CommandError(f"Projet introuvable : {options['project']}")
+
+        importer = TaskImporter(
+            user=user,
+            project=project,
+            batch_size=options['batch_size'],
+            atomic=options['atomic'],
+            dry_run=options['dry_run'],
+        )
+        start = time.perf_counter()
+        try:
+            with open(options['path'], 'rb') as stream:
+                result = importer.run(stream, options['format'] or guess_format(options['path']))
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+        elapsed = time.perf_counter() - start
+
+        for error in result.errors:
+            details = '; '.join(
+                f"{field} : {' '.join(messages)}" for field, messages in error['errors'].items()
+            ) if isinstance(error['errors'], dict) else ' '.join(error['errors'])
+            self.stderr.write(f"Ligne {error['line']} : {details}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... et {result.error_count - len(result.errors)} autre(s) erreur(s)")
+
+        verb = "valide(s) (simulation)" if options['dry_run'] else "importée(s)"
+        summary = f"{result.created} tâche(s) {verb}, {result.error_count} ligne(s) en erreur, en {elapsed:.1f} s"
+        if result.error_count:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
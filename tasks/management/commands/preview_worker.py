@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from tasks.previews import work
+
+
+class Command(BaseCommand):
+    help = "Génère en continu les aperçus des documents en file d'attente (voir tasks/previews.py)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, help="Processus de rendu (DOCUMENT_PREVIEW_PROCESSES par défaut)")
+        parser.add_argument('--batch-size', type=int, help="Aperçus pris en charge à la fois")
+        parser.add_argument('--poll-interval', type=float, default=2.0, help="Attente en secondes quand la file est vide")
+        parser.add_argument('--once', action='store_true', help="S'arrête quand la file est vide")
+
+    def handle(self, *args, **options):
+        try:
+            work(
+                processes=options['processes'],
+                batch_size=options['batch_size'],
+                poll_interval=options['poll_interval'],
+                once=options['once'],
+            )
+        except KeyboardInterrupt:
+            self.stdout.write("Arrêt du worker")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from tasks.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Supprime les envois de documents sans nouveau morceau depuis DOCUMENT_UPLOAD_EXPIRY_HOURS"
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_uploads()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} envoi(s) abandonné(s) supprimé(s)"))
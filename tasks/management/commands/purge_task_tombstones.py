@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from tasks.changes import tombstone_retention
+from tasks.models import TaskFeedReset, TaskTombstone
+
+
+class Command(BaseCommand):
+    help = (
+        "Supprime les traces de tâches supprimées et de rechargement plus anciennes "
+        "que TASK_TOMBSTONE_RETENTION_DAYS"
+    )
+
+    def handle(self, *args, **options):
+        limit = timezone.now() - tombstone_retention()
+        deleted, _ = TaskTombstone.objects.filter(deleted_at__lt=limit).delete()
+        # Un jeton plus ancien est déjà expiré : ces traces ne servent plus
+        resets, _ = TaskFeedReset.objects.filter(created_at__lt=limit).delete()
+        self.stdout.write(self.style.SUCCESS(f"{deleted} trace(s) supprimée(s), {resets} rechargement(s)"))
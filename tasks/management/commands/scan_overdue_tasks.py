@@ -0,0 +1,40 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.overdue import run_forever, run_scan
+
+
+class Command(BaseCommand):
+    help = "Détecte les tâches passées en retard depuis la dernière analyse et notifie les équipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help="Analyse en continu toutes les OVERDUE_SCAN_INTERVAL secondes")
+        parser.add_argument('--interval', type=int, help="Intervalle en secondes (avec --loop)")
+        parser.add_argument('--since', help="Rattrapage : analyse les dates de fin à partir de cette date (AAAA-MM-JJ)")
+
+    def report(self, count):
+        if count is None:
+            self.stdout.write(self.style.WARNING("Analyse déjà en cours sur un autre processus"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{count} tâche(s) passée(s) en retard"))
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            try:
+                run_forever(interval=options['interval'], log=self.report)
+            except KeyboardInterrupt:
+                self.stdout.write("Arrêt de l'analyse")
+            return
+
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError(f"Date invalide : {options['since']}")
+        start = time.perf_counter()
+        count = run_scan(since=since)
+        self.report(count)
+        self.stdout.write(f"en {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,54 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import User
+from lon.benchmarking import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Crée un jeu de données synthétique reproductible pour les benchmarks "
+        "(utilisateurs, clients, projets, tâches, documents, notifications)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42, help="Graine : mêmes données pour une même graine")
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--clients', type=int, default=20)
+        parser.add_argument('--projects', type=int, default=500)
+        parser.add_argument('--members', type=int, default=10, help="Membres par projet")
+        parser.add_argument('--tasks', type=int, default=50000)
+        parser.add_argument('--documents', type=int, default=5000)
+        parser.add_argument('--notifications', type=int, default=50, help="Notifications par utilisateur")
+        parser.add_argument(
+            '--password', default='benchmark',
+            help="Mot de passe des utilisateurs créés (obtention de jetons par benchmark_api)",
+        )
+
+    def handle(self, *args, **options):
+        prefix = f"bench{options['seed']}_user"
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f"Des données existent déjà pour la graine {options['seed']} : "
+                "utiliser une autre graine ou une base vide"
+            )
+        started = time.perf_counter()
+        with transaction.atomic():
+            data = seed_dataset(
+                users=options['users'],
+                clients=options['clients'],
+                projects=options['projects'],
+                members_per_project=options['members'],
+                tasks=options['tasks'],
+                documents=options['documents'],
+                notifications_per_user=options['notifications'],
+                seed=options['seed'],
+                password=options['password'],
+            )
+        counts = ', '.join(f'{count} {name}' for name, count in data['counts'].items())
+        self.stdout.write(self.style.SUCCESS(
+            f"Graine {options['seed']} : {counts} en {time.perf_counter() - started:.1f} s"
+        ))
+        self.stdout.write(f"Utilisateurs : {prefix}0 à {prefix}{options['users'] - 1}")
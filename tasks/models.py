@@ -1,13 +1,79 @@
 from django.db import models
+from django.db.models import BooleanField, Case, DurationField, Exists, ExpressionWrapper, F, OuterRef, Q, Value, When
+from django.db.models.lookups import IsNull
 from django.conf import settings
 from projects.models import Project
+from .fields import RankedChoiceField
 from django.utils import timezone
 import os
+import uuid
 from django.core.exceptions import ValidationError
 from datetime import timedelta
 from datetime import datetime, time
 
 
+def visibility_filter(user, project_field='project_id', assignee_field='assigned_to_id'):
+    """
+    Condition de visibilité d'une tâche pour l'utilisateur : tâche qui lui est assignée,
+    ou appartenant à un projet dont il est membre ou chef de projet.
+    Les appartenances sont testées par des sous-requêtes EXISTS corrélées, ce qui
+    évite la jointure sur l'équipe et le DISTINCT qu'elle imposait.
+    """
+    membership = Project.team_members.through.objects.filter(
+        project_id=OuterRef(project_field),
+        user_id=user.pk
+    )
+    managed = Project.objects.filter(
+        pk=OuterRef(project_field),
+        manager_id=user.pk
+    )
+    return Q(**{assignee_field: user.pk}) | Exists(membership) | Exists(managed)
+
+
+def planned_duration(start_date, end_date):
+    """Durée prévue en jours, bornes incluses (None si une des dates manque)."""
+    if start_date and end_date:
+        return (end_date - start_date).days + 1
+    return None
+
+
+class TaskQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        """Filtre les tâches visibles par l'utilisateur (voir `visibility_filter`)."""
+        return self.filter(visibility_filter(user))
+
+    def with_timing(self, today=None):
+        """
+        Annote le retard calculé par la base, pour filtrer et trier sans charger les
+        tâches en Python :
+        - timing_overdue : date de fin dépassée et tâche non terminée ;
+        - timing_delay : retard (durée en jours entiers, nulle si la tâche n'est pas en retard).
+        Les propriétés is_overdue et delay_days utilisent ces valeurs lorsqu'elles sont présentes.
+        """
+        today = today or timezone.now().date()
+        overdue = Q(end_date__lt=today) & ~Q(status='done')
+        return self.annotate(
+            timing_overdue=Case(
+                When(overdue, then=Value(True)),
+                default=Value(False),
+                output_field=BooleanField()
+            ),
+            timing_delay=Case(
+                When(overdue, then=ExpressionWrapper(
+                    Value(today, output_field=models.DateField()) - F('end_date'),
+                    output_field=DurationField()
+                )),
+                default=Value(timedelta(0)),
+                output_field=DurationField()
+            ),
+        )
+
+    def overdue(self, today=None):
+        """Tâches en retard (couvert par l'index partiel task_open_end_date_idx)."""
+        today = today or timezone.now().date()
+        return self.filter(end_date__lt=today).exclude(status='done')
+
+
 class Task(models.Model):
     """
     Modèle représentant une tâche dans un projet.
@@ -37,11 +103,13 @@ class Task(models.Model):
     description = models.TextField(blank=True, verbose_name="Description")
 
     # Clé étrangère vers le projet associé à la tâche
+    # Pas d'index simple : l'index composite (project, status) le couvre
     project = models.ForeignKey(
         Project,
         on_delete=models.CASCADE,
         related_name='tasks',
-        verbose_name="Projet"
+        verbose_name="Projet",
+        db_index=False
     )
 
     # Clé étrangère vers l'utilisateur qui a créé la tâche
@@ -55,26 +123,28 @@ class Task(models.Model):
     )
 
     # Clé étrangère vers l'utilisateur assigné à la tâche (optionnel)
+    # Pas d'index simple : l'index composite (assigned_to, status) le couvre
     assigned_to = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.SET_NULL,
         null=True,
         blank=True,
         related_name='assigned_tasks',
-        verbose_name="Assigné à"
+        verbose_name="Assigné à",
+        db_index=False
     )
 
-    # Champ pour le statut de la tâche (parmi les choix définis)
-    status = models.CharField(
-        max_length=20,
+    # Champ pour le statut de la tâche (parmi les choix définis),
+    # stocké sous forme de rang entier dans l'ordre de STATUS_CHOICES
+    status = RankedChoiceField(
         choices=STATUS_CHOICES,
         default='todo',
         verbose_name="Statut"
     )
 
-    # Champ pour la priorité de la tâche (parmi les choix définis)
-    priority = models.CharField(
-        max_length=20,
+    # Champ pour la priorité de la tâche (parmi les choix définis),
+    # stockée sous forme de rang entier : le tri '-priority' donne urgente > haute > moyenne > basse
+    priority = RankedChoiceField(
         choices=PRIORITY_CHOICES,
         default='medium',
         verbose_name="Priorité"
@@ -100,6 +170,8 @@ class Task(models.Model):
     # Champ pour la date de dernière mise à jour de la tâche (automatique)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
     @property
     def elapsed_time(self):
         """
@@ -113,15 +185,15 @@ class Task(models.Model):
         """
         Retourne la durée prévue en jours (entre la date de début et la date de fin).
         """
-        if self.start_date and self.end_date:
-            return (self.end_date - self.start_date).days + 1
-        return None
+        return planned_duration(self.start_date, self.end_date)
 
     @property
     def is_overdue(self):
         """
         Vérifie si la tâche est en retard (date de fin dépassée et statut non terminé).
         """
+        if 'timing_overdue' in self.__dict__:
+            return self.timing_overdue
         if self.end_date and self.status != 'done':
             return timezone.now().date() > self.end_date
         return False
@@ -141,6 +213,8 @@ class Task(models.Model):
         """
         Retourne le nombre de jours de retard (si la tâche est en retard).
         """
+        if 'timing_delay' in self.__dict__:
+            return self.timing_delay.days
         if self.is_overdue:
             return (timezone.now().date() - self.end_date).days
         return 0
@@ -236,20 +310,11 @@ class Task(models.Model):
         et que les transitions de statut sont valides.
         """
         super().clean()
-        if self.start_date and self.end_date:
-            if self.start_date > self.end_date:
-                raise ValidationError({
-                    'start_date': "La date de début ne peut pas être postérieure à la date de fin.",
-                    'end_date': "La date de fin ne peut pas être antérieure à la date de début."
-                })
-
-        if self.pk:  # Si la tâche existe déjà
-            old_task = Task.objects.get(pk=self.pk)
-            if old_task.status != self.status:  # Si le statut a changé
-                if self.status not in VALID_STATUS_TRANSITIONS.get(old_task.status, []):
-                    raise ValidationError({
-                        'status': f"Impossible de passer directement de '{old_task.get_status_display()}' à '{self.get_status_display()}'"
-                    })
+        validate_date_range(self.start_date, self.end_date)
+
+        # Statut d'origine lu depuis l'état chargé (from_db) : aucune requête
+        from .status import status_machine
+        status_machine.validate(self)
 
     class Meta:
         """
@@ -258,6 +323,28 @@ class Task(models.Model):
         verbose_name = "Tâche"
         verbose_name_plural = "Tâches"
         ordering = ['-priority', 'end_date', '-created_at']
+        indexes = [
+            # Couvre l'ordre par défaut et la pagination par curseur : end_date est
+            # triée sur (end_date IS NULL, end_date), comme dans KeysetPagination
+            models.Index(
+                F('priority').desc(), IsNull(F('end_date'), True), F('end_date'),
+                F('created_at').desc(), F('id').desc(),
+                name='task_ordering_idx'
+            ),
+            # Statistiques par projet, tableau kanban, filtre ?status= dans un projet
+            models.Index(fields=['project', 'status'], name='task_project_status_idx'),
+            # "Mes tâches" et filtre par statut sur les tâches assignées
+            models.Index(fields=['assigned_to', 'status'], name='task_assignee_status_idx'),
+            # Tâches en retard (end_date < aujourd'hui, non terminées) : index partiel,
+            # les tâches terminées (la majorité à terme) n'y figurent pas
+            models.Index(
+                fields=['end_date'],
+                condition=~Q(status='done'),
+                name='task_open_end_date_idx'
+            ),
+            # Flux de modifications (/api/tasks/changes/) : parcours par plage sur updated_at
+            models.Index(fields=['updated_at', 'id'], name='task_updated_idx'),
+        ]
 
     def __str__(self):
         """
@@ -265,14 +352,222 @@ class Task(models.Model):
         """
         return f"{self.title} - {self.project.name}"
 
+    # Champs dont la valeur chargée depuis la base est conservée sur l'instance,
+    # pour connaître l'état précédent lors de l'enregistrement sans relire la ligne
+    TRACKED_FIELDS = ('status', 'project_id', 'end_date', 'assigned_to_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance.tracked_state()
+        return instance
+
+    def tracked_state(self):
+        """
+        Retourne les valeurs actuelles des champs suivis (hors champs différés).
+        """
+        return {name: self.__dict__[name] for name in self.TRACKED_FIELDS if name in self.__dict__}
+
+    def loaded_state(self):
+        """
+        Retourne l'état tel que chargé depuis la base (ou au dernier enregistrement),
+        ou None s'il n'est pas entièrement connu.
+        """
+        state = getattr(self, '_loaded_values', None)
+        if state is None or len(state) != len(self.TRACKED_FIELDS):
+            return None
+        return state
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Les receivers post_save ont vu l'ancien état : on mémorise le nouveau
+        self._loaded_values = self.tracked_state()
+
+
+def validate_date_range(start_date, end_date):
+    """
+    Valide que la date de début n'est pas postérieure à la date de fin.
+    """
+    if start_date and end_date and start_date > end_date:
+        raise ValidationError({
+            'start_date': "La date de début ne peut pas être postérieure à la date de fin.",
+            'end_date': "La date de fin ne peut pas être antérieure à la date de début."
+        })
+
+
+def max_document_size():
+    """Taille maximale d'un document, en octets (TASK_DOCUMENT_MAX_SIZE, 10 Mo par défaut)."""
+    return getattr(settings, 'TASK_DOCUMENT_MAX_SIZE', 10 * 1024 * 1024)
+
 
 def validate_file_size(value):
     """
-    Valide que la taille du fichier ne dépasse pas 10MB.
+    Valide que la taille du fichier ne dépasse pas la taille maximale d'un document.
+    Les envois par morceaux (tasks/uploads.py) vérifient la taille annoncée dès la
+    création de l'envoi, puis à chaque morceau reçu.
     """
     filesize = value.size
-    if filesize > 10 * 1024 * 1024:  # 10MB
-        raise ValidationError("La taille maximale du fichier est de 10MB")
+    limit = max_document_size()
+    if filesize > limit:
+        raise ValidationError(f"La taille maximale du fichier est de {limit // (1024 * 1024)}MB")
+
+
+class TaskTombstone(models.Model):
+    """
+    Trace d'une tâche supprimée ou devenue invisible pour une partie de ses
+    lecteurs (déplacée, réassignée, membre retiré de l'équipe), pour le flux
+    de modifications : les clients qui synchronisent les tâches apprennent
+    ainsi qu'ils doivent la retirer.
+    Le projet et l'assigné d'avant sont conservés pour filtrer la visibilité ;
+    une trace dont `user_id` est renseigné ne concerne que cet utilisateur
+    (membre retiré, équipe d'un projet supprimé).
+    """
+    task_id = models.BigIntegerField(verbose_name="Tâche")
+    project_id = models.BigIntegerField(verbose_name="Projet")
+    assigned_to_id = models.BigIntegerField(null=True, blank=True, verbose_name="Assigné à")
+    user_id = models.BigIntegerField(null=True, blank=True, verbose_name="Utilisateur")
+    deleted_at = models.DateTimeField(default=timezone.now, verbose_name="Supprimée le")
+
+    class Meta:
+        verbose_name = "Tâche supprimée"
+        verbose_name_plural = "Tâches supprimées"
+        indexes = [
+            models.Index(fields=['deleted_at', 'id'], name='task_tombstone_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"Tâche {self.task_id} supprimée le {self.deleted_at}"
+
+
+class TaskFeedReset(models.Model):
+    """
+    Tâches d'un projet devenues visibles d'un coup pour un utilisateur (ajout à
+    l'équipe, nouveau chef de projet) : leur `updated_at` ne change pas, le flux
+    de modifications ne peut donc pas les renvoyer. Un jeton antérieur à cette
+    trace donne un rechargement complet (410).
+    """
+    user_id = models.BigIntegerField(verbose_name="Utilisateur")
+    project_id = models.BigIntegerField(verbose_name="Projet")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Créée le")
+
+    class Meta:
+        verbose_name = "Rechargement du flux de tâches"
+        verbose_name_plural = "Rechargements du flux de tâches"
+        indexes = [
+            models.Index(fields=['user_id', 'created_at'], name='task_feed_reset_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"Rechargement pour l'utilisateur {self.user_id} le {self.created_at}"
+
+
+class TaskOverdueEvent(models.Model):
+    """
+    Passage d'une tâche en retard, enregistré par l'analyse périodique (voir
+    tasks/overdue.py). Une tâche dont la date de fin est repoussée puis de
+    nouveau dépassée a un nouvel événement.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='overdue_events', verbose_name="Tâche")
+    end_date = models.DateField(verbose_name="Date de fin dépassée")
+    detected_at = models.DateTimeField(auto_now_add=True, verbose_name="Détecté le")
+
+    class Meta:
+        verbose_name = "Retard de tâche"
+        verbose_name_plural = "Retards de tâches"
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'end_date'], name='task_overdue_event_unique'),
+        ]
+
+    def __str__(self):
+        return f"Tâche {self.task_id} en retard depuis le {self.end_date}"
+
+
+class OverdueScan(models.Model):
+    """
+    État de l'analyse périodique des retards : `watermark` est la première date
+    de fin pas encore analysée, le curseur la position atteinte dans l'analyse en
+    cours (reprise après interruption) et le bail (`locked_by`, `locked_until`)
+    réserve l'analyse à un seul processus à la fois, tous hôtes confondus.
+    """
+    name = models.CharField(max_length=50, unique=True, verbose_name="Nom")
+    watermark = models.DateField(null=True, blank=True, verbose_name="Analysé jusqu'au")
+    target = models.DateField(null=True, blank=True, verbose_name="Analyse en cours jusqu'au")
+    cursor_end_date = models.DateField(null=True, blank=True)
+    cursor_task_id = models.BigIntegerField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True, verbose_name="Réservé par")
+    locked_until = models.DateTimeField(null=True, blank=True, verbose_name="Réservé jusqu'au")
+    last_run_at = models.DateTimeField(null=True, blank=True, verbose_name="Dernière analyse")
+    last_run_count = models.PositiveIntegerField(default=0, verbose_name="Retards détectés")
+
+    class Meta:
+        verbose_name = "Analyse des retards"
+        verbose_name_plural = "Analyses des retards"
+
+    def __str__(self):
+        return f"{self.name} (jusqu'au {self.watermark})"
+
+
+def blob_upload_to(instance, filename):
+    # Adressage par contenu : blobs/ab/cd/<sha256>
+    return f'blobs/{instance.sha256[:2]}/{instance.sha256[2:4]}/{instance.sha256}'
+
+
+class DocumentBlob(models.Model):
+    """
+    Contenu d'un document, stocké une seule fois par empreinte SHA-256 et partagé
+    par tous les documents identiques (toutes tâches confondues). `ref_count` compte
+    les documents qui le référencent : le fichier est supprimé avec le dernier.
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name="Empreinte SHA-256")
+    size = models.BigIntegerField(verbose_name="Taille")
+    file = models.FileField(upload_to=blob_upload_to, max_length=255, verbose_name="Fichier")
+    ref_count = models.PositiveIntegerField(default=0, verbose_name="Références")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Contenu de document"
+        verbose_name_plural = "Contenus de documents"
+
+    def __str__(self):
+        return self.sha256
+
+
+class DocumentUpload(models.Model):
+    """
+    Envoi par morceaux d'un document, reprenable : les morceaux reçus sont ajoutés
+    à un fichier partiel, `received` donne la position à laquelle reprendre.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='document_uploads', verbose_name="Tâche")
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_uploads',
+        verbose_name="Envoyé par"
+    )
+    title = models.CharField(max_length=255, verbose_name="Titre")
+    filename = models.CharField(max_length=255, verbose_name="Nom du fichier")
+    size = models.BigIntegerField(verbose_name="Taille annoncée")
+    received = models.BigIntegerField(default=0, verbose_name="Octets reçus")
+    # Empreinte annoncée par le client (facultative), vérifiée à la fin de l'envoi
+    sha256 = models.CharField(max_length=64, blank=True, verbose_name="Empreinte SHA-256")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Envoi de document"
+        verbose_name_plural = "Envois de documents"
+        indexes = [
+            # Purge des envois abandonnés
+            models.Index(fields=['updated_at'], name='document_upload_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size})"
+
+    @property
+    def complete(self):
+        return self.received >= self.size
 
 
 class TaskDocument(models.Model):
@@ -300,6 +595,18 @@ class TaskDocument(models.Model):
         verbose_name="Titre"
     )
 
+    # Contenu partagé (envoi par morceaux) : `file` désigne alors le fichier du blob
+    # et `original_name` le nom du fichier envoyé
+    blob = models.ForeignKey(
+        DocumentBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='documents',
+        verbose_name="Contenu"
+    )
+    original_name = models.CharField(max_length=255, blank=True, verbose_name="Nom d'origine")
+
     # Clé étrangère vers l'utilisateur qui a téléchargé le document
     uploaded_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -333,25 +640,68 @@ class TaskDocument(models.Model):
         """
         Retourne le nom du fichier (sans le chemin).
         """
-        return os.path.basename(self.file.name)
+        return self.original_name or os.path.basename(self.file.name)
 
     def extension(self):
         """
         Retourne l'extension du fichier.
         """
-        name, extension = os.path.splitext(self.file.name)
+        name, extension = os.path.splitext(self.filename())
         return extension[1:] if extension else ""
 
     def delete(self, *args, **kwargs):
         """
         Supprime le fichier physique avant de supprimer l'objet de la base de données.
+        Un contenu partagé (blob) est libéré par le signal post_delete : son fichier
+        n'est supprimé qu'avec sa dernière référence.
         """
-        if self.file:
+        if self.file and self.blob_id is None:
             if os.path.isfile(self.file.path):
                 os.remove(self.file.path)
         super().delete(*args, **kwargs)
 
 
+class DocumentPreview(models.Model):
+    """
+    Aperçu d'un document, généré en arrière-plan par le worker (voir
+    tasks/previews.py). La ligne sert aussi de tâche dans la file d'attente :
+    `available_at` donne le moment de la prochaine tentative.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Prêt'),
+        ('failed', 'Échec'),
+        ('unsupported', 'Non pris en charge'),
+    ]
+
+    document = models.OneToOneField(
+        TaskDocument,
+        on_delete=models.CASCADE,
+        related_name='preview',
+        verbose_name="Document"
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name="Statut")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Tentatives")
+    available_at = models.DateTimeField(default=timezone.now, verbose_name="Disponible à partir de")
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name="Pris en charge le")
+    # Nom de l'aperçu dans le cache (partagé par les documents de même contenu)
+    cache_key = models.CharField(max_length=100, blank=True, verbose_name="Clé du cache")
+    error = models.TextField(blank=True, verbose_name="Erreur")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = "Aperçu de document"
+        verbose_name_plural = "Aperçus de documents"
+        indexes = [
+            # Prochaines tâches à traiter
+            models.Index(fields=['status', 'available_at'], name='document_preview_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Aperçu de {self.document_id} ({self.status})"
+
+
 # Dictionnaire des transitions de statut valides
 VALID_STATUS_TRANSITIONS = {
     'todo': ['in_progress'],
@@ -0,0 +1,80 @@
+"""
+Notifications des événements de tâches (assignation, changement de statut,
+retard), envoyées à l'équipe du projet et à son chef de projet, sauf à
+l'utilisateur à l'origine de la modification.
+
+Les destinataires de tous les projets concernés sont chargés en une requête et
+les notifications de tous les événements sont créées en une insertion groupée
+(voir accounts/notifications.py) : notifier un projet de 500 membres ne coûte
+pas 500 requêtes.
+"""
+from accounts.models import User
+from accounts.notifications import notify_many
+from projects.models import Project
+from .models import Task
+
+STATUS_LABELS = dict(Task.STATUS_CHOICES)
+
+
+def project_audiences(project_ids):
+    """Retourne {projet: ensemble des membres de l'équipe et du chef de projet}."""
+    audiences = {}
+    rows = Project.objects.filter(pk__in=set(project_ids)).values_list('pk', 'manager_id', 'team_members')
+    for project_id, manager_id, member_id in rows:
+        audience = audiences.setdefault(project_id, set())
+        audience.update({manager_id, member_id} - {None})
+    return audiences
+
+
+def task_events(task, previous):
+    """
+    Événements (type, message) d'une tâche enregistrée, d'après son état précédent
+    (None pour une création).
+    """
+    events = []
+    assigned_to_id = task.assigned_to_id
+    if assigned_to_id is not None and (previous is None or previous['assigned_to_id'] != assigned_to_id):
+        events.append(('task_assigned', assigned_to_id))
+    if previous is not None and previous['status'] != task.status:
+        events.append((
+            'task_status',
+            f"Tâche « {task.title} » : {STATUS_LABELS.get(previous['status'])} → {STATUS_LABELS.get(task.status)}",
+        ))
+    return events
+
+
+def notify_task_changes(changes, actor_id=None):
+    """
+    Notifie les équipes des tâches `changes` ([(tâche, état précédent ou None)]),
+    sauf `actor_id`, auteur des modifications. Retourne les notifications créées.
+    """
+    changes = [(task, events) for task, previous in changes if (events := task_events(task, previous))]
+    if not changes:
+        return []
+    assignee_ids = {value for _, events in changes for kind, value in events if kind == 'task_assigned'}
+    names = {
+        user.pk: user.get_full_name() or user.username
+        for user in User.objects.filter(pk__in=assignee_ids).only('username', 'first_name', 'last_name')
+    }
+    audiences = project_audiences(task.project_id for task, _ in changes)
+    items = []
+    for task, events in changes:
+        for kind, value in events:
+            if kind == 'task_assigned':
+                message = f"Tâche « {task.title} » assignée à {names.get(value, value)}"
+            else:
+                message = value
+            recipients = audiences.get(task.project_id, set()) - {actor_id}
+            items.extend((user_id, message, kind, task) for user_id in sorted(recipients))
+    return notify_many(items)
+
+
+def notify_overdue(tasks):
+    """Notifie les équipes des tâches en retard ; retourne les notifications créées."""
+    tasks = list(tasks)
+    audiences = project_audiences(task.project_id for task in tasks)
+    items = []
+    for task in tasks:
+        message = f"Tâche « {task.title} » en retard (échéance le {task.end_date:%d/%m/%Y})"
+        items.extend((user_id, message, 'task_overdue', task) for user_id in sorted(audiences.get(task.project_id, ())))
+    return notify_many(items)
@@ -0,0 +1,163 @@
+"""
+Analyse périodique des tâches passées en retard (commande scan_overdue_tasks).
+
+Une tâche passe en retard le lendemain de sa date de fin si elle n'est pas
+terminée. Plutôt que de relire toutes les tâches, chaque analyse ne parcourt
+que les dates de fin comprises entre le dernier jour analysé (`watermark`) et
+hier : un parcours par plage de l'index partiel `task_open_end_date_idx`, par
+lots de OVERDUE_SCAN_CHUNK_SIZE tâches ordonnés par (end_date, id).
+
+Chaque lot est traité dans une transaction : événements TaskOverdueEvent,
+notifications de l'équipe (en une insertion groupée) et avancement du curseur.
+Une analyse interrompue reprend donc au lot suivant, sans notifier deux fois.
+
+Un bail en base (mise à jour conditionnelle de la ligne OverdueScan, valable
+OVERDUE_SCAN_LEASE_SECONDS et prolongé à chaque lot) empêche deux processus,
+sur un même hôte ou non, d'analyser en même temps ; le bail d'un processus
+arrêté expire de lui-même.
+
+Limite : une tâche dont la date de fin est corrigée à une date déjà analysée
+n'est pas détectée par l'analyse (elle reste signalée à l'affichage).
+"""
+import os
+import socket
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from lon.cache import invalidate_projects
+from .models import OverdueScan, Task, TaskOverdueEvent
+from .notifications import notify_overdue
+
+SCAN_NAME = 'tasks'
+
+
+class LeaseLost(Exception):
+    """Le bail a expiré et a été repris par un autre processus."""
+
+
+def chunk_size():
+    return getattr(settings, 'OVERDUE_SCAN_CHUNK_SIZE', 2000)
+
+
+def lease_duration():
+    return timedelta(seconds=getattr(settings, 'OVERDUE_SCAN_LEASE_SECONDS', 300))
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def acquire_lease(owner, now=None):
+    """Réserve l'analyse ; retourne la ligne OverdueScan, ou None si elle est déjà réservée."""
+    now = now or timezone.now()
+    scan, _ = OverdueScan.objects.get_or_create(name=SCAN_NAME)
+    acquired = OverdueScan.objects.filter(pk=scan.pk).filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now) | Q(locked_by=owner)
+    ).update(locked_by=owner, locked_until=now + lease_duration())
+    if not acquired:
+        return None
+    scan.refresh_from_db()
+    return scan
+
+
+def renew_lease(scan, owner):
+    renewed = OverdueScan.objects.filter(pk=scan.pk, locked_by=owner).update(
+        locked_until=timezone.now() + lease_duration()
+    )
+    if not renewed:
+        raise LeaseLost
+
+
+def release_lease(scan, owner):
+    OverdueScan.objects.filter(pk=scan.pk, locked_by=owner).update(locked_by='', locked_until=None)
+
+
+def overdue_chunk(start, target, cursor, size):
+    """Tâches non terminées dont la date de fin est dans [start, target), après `cursor`."""
+    queryset = Task.objects.filter(end_date__gte=start, end_date__lt=target).exclude(status='done')
+    if cursor is not None:
+        end_date, task_id = cursor
+        queryset = queryset.filter(Q(end_date__gt=end_date) | Q(end_date=end_date, pk__gt=task_id))
+    return list(
+        queryset.order_by('end_date', 'pk').only('pk', 'title', 'project_id', 'end_date')[:size]
+    )
+
+
+def record_overdue(tasks):
+    """Enregistre les passages en retard encore inconnus et notifie les équipes ; retourne leur nombre."""
+    known = set(
+        TaskOverdueEvent.objects.filter(task_id__in=[task.pk for task in tasks]).values_list('task_id', 'end_date')
+    )
+    new = [task for task in tasks if (task.pk, task.end_date) not in known]
+    if not new:
+        return 0
+    TaskOverdueEvent.objects.bulk_create(
+        [TaskOverdueEvent(task_id=task.pk, end_date=task.end_date) for task in new], ignore_conflicts=True
+    )
+    notify_overdue(new)
+    project_ids = {task.project_id for task in new}
+    # Les réponses en cache affichent encore ces tâches comme dans les temps
+    transaction.on_commit(lambda: invalidate_projects(project_ids))
+    return len(new)
+
+
+def run_scan(owner=None, today=None, since=None):
+    """
+    Analyse les dates de fin dépassées depuis la dernière analyse ; retourne le
+    nombre de tâches passées en retard, ou None si un autre processus analyse déjà.
+
+    À la première analyse, seule la veille est analysée, sauf si `since` donne
+    une date de départ (rattrapage).
+    """
+    owner = owner or worker_name()
+    today = today or timezone.now().date()
+    scan = acquire_lease(owner)
+    if scan is None:
+        return None
+    try:
+        if scan.target is None:
+            # Nouvelle analyse (sinon : reprise de l'analyse interrompue)
+            scan.target = today
+            OverdueScan.objects.filter(pk=scan.pk).update(target=today)
+        start = since or scan.watermark or scan.target - timedelta(days=1)
+        cursor = (scan.cursor_end_date, scan.cursor_task_id) if scan.cursor_task_id else None
+        size = chunk_size()
+        count = 0
+        while True:
+            with transaction.atomic():
+                renew_lease(scan, owner)
+                tasks = overdue_chunk(start, scan.target, cursor, size)
+                if not tasks:
+                    break
+                count += record_overdue(tasks)
+                cursor = (tasks[-1].end_date, tasks[-1].pk)
+                OverdueScan.objects.filter(pk=scan.pk).update(cursor_end_date=cursor[0], cursor_task_id=cursor[1])
+            if len(tasks) < size:
+                break
+        OverdueScan.objects.filter(pk=scan.pk).update(
+            watermark=scan.target, target=None, cursor_end_date=None, cursor_task_id=None,
+            last_run_at=timezone.now(), last_run_count=count,
+        )
+        return count
+    finally:
+        release_lease(scan, owner)
+
+
+def run_forever(interval=None, log=None):
+    """Planificateur : une analyse toutes les OVERDUE_SCAN_INTERVAL secondes."""
+    interval = interval or getattr(settings, 'OVERDUE_SCAN_INTERVAL', 3600)
+    while True:
+        close_old_connections()
+        started = time.monotonic()
+        try:
+            count = run_scan()
+        except LeaseLost:
+            count = None
+        if log is not None:
+            log(count)
+        time.sleep(max(interval - (time.monotonic() - started), 0))
@@ -0,0 +1,69 @@
+"""
+Contextes des pages HTML des tâches.
+
+Le tableau kanban est construit par la base : une requête par colonne
+(`WHERE status = ... ORDER BY ... LIMIT n`, servie par les index (projet,
+statut) et (assigné, statut)) ne charge que les cartes affichées, et le nombre
+total de tâches par colonne est obtenu par une agrégation conditionnelle.
+Un ROW_NUMBER() OVER (PARTITION BY status) en une seule requête a été mesuré
+nettement plus lent : la fenêtre doit numéroter toutes les tâches avant de
+filtrer. Le nombre de lignes lues en Python est ainsi borné par la limite par
+colonne, et non par le nombre de tâches.
+"""
+from django.db.models import Count, Q
+
+from .models import Task
+
+# Nombre maximal de cartes affichées par colonne du kanban
+KANBAN_COLUMN_LIMIT = 50
+
+
+def kanban_queryset(user, project=None):
+    """Tâches du kanban : visibles par l'utilisateur, éventuellement limitées à un projet."""
+    queryset = Task.objects.visible_to(user)
+    if project is not None:
+        queryset = queryset.filter(project=project)
+    return queryset
+
+
+def column_counts(queryset):
+    """Nombre de tâches par statut, en une requête."""
+    return queryset.order_by().aggregate(**{
+        code: Count('pk', filter=Q(status=code)) for code, _ in Task.STATUS_CHOICES
+    })
+
+
+def column_tasks(queryset, limit=KANBAN_COLUMN_LIMIT):
+    """
+    Les `limit` premières tâches de chaque colonne, dans l'ordre par défaut des
+    tâches, une requête par colonne. Retourne {statut: [tâches]}.
+    """
+    queryset = queryset.select_related('project', 'assigned_to').with_timing()
+    return {
+        code: list(queryset.filter(status=code)[:limit])
+        for code, _ in Task.STATUS_CHOICES
+    }
+
+
+def kanban_context(user, project=None, limit=KANBAN_COLUMN_LIMIT):
+    """
+    Contexte de templates/tasks/task_kanban.html : une entrée par colonne avec ses
+    tâches affichées, le nombre total de tâches et le nombre de tâches masquées.
+    """
+    queryset = kanban_queryset(user, project)
+    counts = column_counts(queryset)
+    tasks = column_tasks(queryset, limit)
+    columns = []
+    for code, label in Task.STATUS_CHOICES:
+        columns.append({
+            'status': code,
+            'label': label,
+            'tasks': tasks[code],
+            'count': counts[code],
+            'hidden': counts[code] - len(tasks[code]),
+        })
+    return {
+        'project': project,
+        'columns': columns,
+        'can_create': user.managed_projects.exists(),
+    }
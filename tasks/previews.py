@@ -0,0 +1,262 @@
+"""
+Aperçus des documents de tâches, générés en arrière-plan.
+
+À l'ajout d'un document, une ligne DocumentPreview est créée après la validation
+de la transaction : la requête d'envoi n'attend rien d'autre. La table sert de
+file d'attente, sans courtier externe ; le worker (commande preview_worker) :
+
+1. prend en charge des lignes en attente par une mise à jour conditionnelle
+   (status='pending' → 'running'), sûre avec plusieurs workers ;
+2. fait le rendu dans un pool de DOCUMENT_PREVIEW_PROCESSES processus
+   (tasks/thumbnails.py), qui recycle ses processus régulièrement ;
+3. enregistre le résultat. Une erreur est retentée plus tard (délai doublé à
+   chaque tentative) jusqu'à DOCUMENT_PREVIEW_MAX_ATTEMPTS ; un type de fichier
+   sans aperçu possible n'est pas retenté. Une ligne restée 'running' au-delà de
+   DOCUMENT_PREVIEW_LOCK_TIMEOUT (worker arrêté en cours de route) est remise
+   en attente.
+
+Les aperçus sont rangés dans un cache sur disque, par contenu : les documents
+identiques (même DocumentBlob) partagent le même aperçu. Au-delà de
+DOCUMENT_PREVIEW_CACHE_MAX_SIZE, les aperçus les moins récemment servis sont
+supprimés ; un aperçu supprimé est regénéré à la demande suivante.
+"""
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DocumentPreview
+from .thumbnails import Unsupported, render, supported_extension
+
+logger = logging.getLogger(__name__)
+
+# Rendus effectués par un processus du pool avant d'être remplacé (fuites de mémoire
+# des bibliothèques de rendu)
+MAX_TASKS_PER_PROCESS = 100
+
+
+def preview_size():
+    return getattr(settings, 'DOCUMENT_PREVIEW_SIZE', 320)
+
+
+def max_attempts():
+    return getattr(settings, 'DOCUMENT_PREVIEW_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'DOCUMENT_PREVIEW_RETRY_DELAY', 30) * 2 ** (attempts - 1))
+
+
+def lock_timeout():
+    return timedelta(seconds=getattr(settings, 'DOCUMENT_PREVIEW_LOCK_TIMEOUT', 600))
+
+
+def cache_dir():
+    path = getattr(settings, 'DOCUMENT_PREVIEW_CACHE_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'previews')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_key(document):
+    """Les documents de même contenu partagent leur aperçu."""
+    base = document.blob.sha256 if document.blob_id else f'document-{document.pk}'
+    return f'{base}-{preview_size()}'
+
+
+def cache_path(key):
+    return os.path.join(cache_dir(), key[:2], f'{key}.jpg')
+
+
+def enqueue_preview(document):
+    """Met l'aperçu du document en file d'attente (ou le marque non pris en charge)."""
+    status = 'pending' if supported_extension(document.extension()) else 'unsupported'
+    preview, _ = DocumentPreview.objects.update_or_create(
+        document=document,
+        defaults={'status': status, 'attempts': 0, 'available_at': timezone.now(), 'error': ''},
+    )
+    return preview
+
+
+def claim_jobs(limit, now=None):
+    """Prend en charge jusqu'à `limit` aperçus en attente ; retourne les lignes obtenues."""
+    now = now or timezone.now()
+    DocumentPreview.objects.filter(status='running', locked_at__lt=now - lock_timeout()).update(
+        status='pending', locked_at=None
+    )
+    candidates = DocumentPreview.objects.filter(status='pending', available_at__lte=now).order_by(
+        'available_at'
+    ).values_list('pk', flat=True)[:limit]
+    claimed = [
+        pk for pk in candidates
+        if DocumentPreview.objects.filter(pk=pk, status='pending').update(
+            status='running', locked_at=now, attempts=F('attempts') + 1
+        )
+    ]
+    return list(DocumentPreview.objects.filter(pk__in=claimed).select_related('document__blob'))
+
+
+def mark_done(job, key):
+    DocumentPreview.objects.filter(pk=job.pk).update(
+        status='done', cache_key=key, locked_at=None, error='', updated_at=timezone.now()
+    )
+
+
+def mark_failed(job, error, retry=True, now=None):
+    """Échec du rendu : nouvelle tentative plus tard, ou abandon."""
+    now = now or timezone.now()
+    if not retry:
+        status, available_at = 'unsupported', now
+    elif job.attempts >= max_attempts():
+        status, available_at = 'failed', now
+    else:
+        status, available_at = 'pending', now + retry_delay(job.attempts)
+    DocumentPreview.objects.filter(pk=job.pk).update(
+        status=status, available_at=available_at, locked_at=None, error=str(error)[:1000], updated_at=now
+    )
+    return status
+
+
+def run_batch(executor=None, limit=10):
+    """
+    Traite un lot d'aperçus en attente ; retourne le nombre de lignes traitées.
+    Sans `executor`, le rendu est fait dans le processus courant.
+    """
+    jobs = claim_jobs(limit)
+    pending = []
+    for job in jobs:
+        document = job.document
+        key = cache_key(document)
+        target = cache_path(key)
+        if os.path.exists(target):
+            # Même contenu déjà rendu pour un autre document
+            os.utime(target)
+            mark_done(job, key)
+            continue
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        arguments = (document.file.path, document.extension(), target, preview_size())
+        if executor is None:
+            pending.append((job, key, _call(render, *arguments)))
+        else:
+            pending.append((job, key, executor.submit(render, *arguments)))
+
+    broken = False
+    for job, key, outcome in pending:
+        try:
+            outcome.result()
+        except Unsupported as exc:
+            mark_failed(job, exc, retry=False)
+        except BrokenProcessPool as exc:
+            broken = True
+            mark_failed(job, exc)
+        except Exception as exc:
+            logger.warning("Aperçu du document %s : %s", job.document_id, exc)
+            mark_failed(job, exc)
+        else:
+            mark_done(job, key)
+    if pending:
+        evict_cache()
+    if broken:
+        raise BrokenProcessPool("Un processus de rendu s'est arrêté brutalement.")
+    return len(jobs)
+
+
+class _Done:
+    """Résultat d'un rendu fait sur place, avec la même interface qu'un Future."""
+
+    def __init__(self, value=None, exception=None):
+        self.value, self.exception = value, exception
+
+    def result(self):
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+
+def _call(function, *args):
+    try:
+        return _Done(function(*args))
+    except Exception as exc:
+        return _Done(exception=exc)
+
+
+def evict_cache(max_size=None):
+    """
+    Supprime les aperçus les moins récemment servis jusqu'à repasser sous
+    DOCUMENT_PREVIEW_CACHE_MAX_SIZE octets ; retourne le nombre de fichiers supprimés.
+    """
+    if max_size is None:
+        max_size = getattr(settings, 'DOCUMENT_PREVIEW_CACHE_MAX_SIZE', 500 * 1024 * 1024)
+    entries, total = [], 0
+    for directory, _, filenames in os.walk(cache_dir()):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+    evicted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def preview_file(preview):
+    """
+    Chemin de l'aperçu prêt, marqué comme récemment servi ; None s'il n'est pas
+    (ou plus) disponible. Un aperçu supprimé du cache est remis en file d'attente.
+    """
+    if preview.status != 'done':
+        return None
+    path = cache_path(preview.cache_key)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        DocumentPreview.objects.filter(pk=preview.pk, status='done').update(
+            status='pending', attempts=0, available_at=timezone.now()
+        )
+        preview.status = 'pending'
+        return None
+    return path
+
+
+def work(processes=None, batch_size=None, poll_interval=2.0, once=False):
+    """Boucle du worker : traite les aperçus en attente jusqu'à l'interruption."""
+    processes = processes or getattr(settings, 'DOCUMENT_PREVIEW_PROCESSES', 2)
+    batch_size = batch_size or processes * 4
+
+    def new_executor():
+        return ProcessPoolExecutor(max_workers=processes, max_tasks_per_child=MAX_TASKS_PER_PROCESS)
+
+    executor = new_executor()
+    try:
+        while True:
+            close_old_connections()
+            try:
+                processed = run_batch(executor, limit=batch_size)
+            except BrokenProcessPool:
+                logger.error("Pool de rendu des aperçus interrompu, redémarrage")
+                executor.shutdown(wait=False, cancel_futures=True)
+                executor = new_executor()
+                processed = 1
+            if once and not processed:
+                return
+            if not processed:
+                time.sleep(poll_interval)
+    finally:
+        executor.shutdown(cancel_futures=True)
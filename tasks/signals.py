@@ -0,0 +1,339 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import Signal, receiver
+
+from lon.cache import invalidate_projects, project_audience
+from lon.events import get_broker, project_topic
+from projects import counters
+from projects.models import Project
+from accounts.models import Notification
+from accounts.notifications import invalidate_unread_of
+from .models import Task, TaskDocument, TaskFeedReset, TaskTombstone
+from .notifications import notify_task_changes
+from .previews import enqueue_preview
+from .uploads import release_blob
+
+# Envoyé après des écritures en masse (bulk_create, bulk_update, UPDATE direct),
+# qui ne déclenchent pas post_save. Arguments : `created` et `updated` (listes de
+# tâches), `previous` ({pk: état chargé avant modification} des tâches modifiées)
+# et `actor` (utilisateur à l'origine des écritures, facultatif).
+tasks_bulk_changed = Signal()
+
+
+@receiver(post_save, sender=Task)
+def update_project_counters_on_save(sender, instance, created, raw=False, **kwargs):
+    """Met à jour les compteurs du projet après création ou modification d'une tâche."""
+    if raw:
+        return
+    if created:
+        counters.task_saved(instance, None)
+        return
+    previous = instance.loaded_state()
+    if previous is None:
+        # État précédent inconnu (instance non chargée depuis la base) : recalcul
+        counters.recompute_counters([instance.project_id])
+    else:
+        counters.task_saved(instance, previous)
+
+
+@receiver(post_delete, sender=Task)
+def update_project_counters_on_delete(sender, instance, origin=None, **kwargs):
+    """Met à jour les compteurs du projet après suppression d'une tâche."""
+    if isinstance(origin, Project):
+        # Suppression en cascade du projet : ses compteurs disparaissent avec lui
+        return
+    counters.task_deleted(instance, instance.loaded_state())
+
+
+@receiver(post_delete, sender=Task)
+def record_task_tombstone(sender, instance, origin=None, **kwargs):
+    """Enregistre la suppression pour le flux de modifications."""
+    if isinstance(origin, Project):
+        # Suppression en cascade : traces créées en une requête par record_project_tombstones
+        return
+    previous = instance.loaded_state() or {}
+    TaskTombstone.objects.create(
+        task_id=instance.pk,
+        project_id=previous.get('project_id', instance.project_id),
+        assigned_to_id=previous.get('assigned_to_id', instance.assigned_to_id),
+    )
+
+
+@receiver(pre_delete, sender=Project)
+def record_project_tombstones(sender, instance, **kwargs):
+    """
+    Traces des tâches d'un projet supprimé, en une insertion groupée : une pour
+    l'assigné, une par membre ou chef de projet (l'équipe disparaît avec le projet).
+    """
+    audience = project_audience([instance.pk])
+    TaskTombstone.objects.bulk_create([
+        TaskTombstone(task_id=pk, project_id=instance.pk, assigned_to_id=assigned_to_id, user_id=user_id)
+        for pk, assigned_to_id in instance.tasks.order_by().values_list('pk', 'assigned_to_id')
+        for user_id in (None, *audience)
+    ], batch_size=1000)
+
+
+def moved_tombstones(tasks, previous):
+    """
+    Traces des tâches dont le projet ou l'assigné a changé, pour les lecteurs de
+    l'ancien projet et l'ancien assigné (ceux qui la voient encore les ignorent).
+    """
+    return [
+        TaskTombstone(task_id=task.pk, project_id=state['project_id'], assigned_to_id=state['assigned_to_id'])
+        for task in tasks
+        for state in [previous.get(task.pk)]
+        if state and (state['project_id'], state['assigned_to_id']) != (task.project_id, task.assigned_to_id)
+    ]
+
+
+@receiver(post_save, sender=Task)
+def record_moved_task_tombstone(sender, instance, created, raw=False, **kwargs):
+    if not created and not raw:
+        TaskTombstone.objects.bulk_create(moved_tombstones([instance], {instance.pk: instance.loaded_state()}))
+
+
+@receiver(m2m_changed, sender=Project.team_members.through)
+def record_removed_member_tombstones(sender, instance, action, reverse, pk_set, **kwargs):
+    """Traces des tâches d'un projet pour les membres retirés de son équipe."""
+    if action not in ('pre_remove', 'pre_clear'):
+        return
+    memberships = Project.team_members.through.objects.all()
+    if reverse:
+        # instance est un utilisateur, pk_set des projets
+        memberships = memberships.filter(user_id=instance.pk)
+        if action == 'pre_remove':
+            memberships = memberships.filter(project_id__in=pk_set)
+    else:
+        memberships = memberships.filter(project_id=instance.pk)
+        if action == 'pre_remove':
+            memberships = memberships.filter(user_id__in=pk_set)
+    members = {}
+    for project_id, user_id in memberships.values_list('project_id', 'user_id'):
+        members.setdefault(project_id, []).append(user_id)
+    if not members:
+        return
+    TaskTombstone.objects.bulk_create([
+        TaskTombstone(task_id=pk, project_id=project_id, assigned_to_id=assigned_to_id, user_id=user_id)
+        for pk, project_id, assigned_to_id in Task.objects.filter(
+            project_id__in=members
+        ).order_by().values_list('pk', 'project_id', 'assigned_to_id')
+        for user_id in members[project_id]
+    ], batch_size=1000)
+
+
+def record_feed_resets(memberships):
+    """
+    Traces de rechargement pour des couples (projet, utilisateur), créées à la
+    validation : horodatées après toute lecture qui ne voyait pas encore les tâches.
+    """
+    memberships = list(memberships)
+    if memberships:
+        transaction.on_commit(lambda: TaskFeedReset.objects.bulk_create([
+            TaskFeedReset(project_id=project_id, user_id=user_id) for project_id, user_id in memberships
+        ], batch_size=1000))
+
+
+@receiver(m2m_changed, sender=Project.team_members.through)
+def record_added_member_resets(sender, instance, action, reverse, pk_set, **kwargs):
+    """Les tâches existantes du projet deviennent visibles pour les nouveaux membres."""
+    if action != 'post_add' or not pk_set:
+        return
+    if reverse:
+        # instance est un utilisateur, pk_set des projets
+        record_feed_resets((project_id, instance.pk) for project_id in pk_set)
+    else:
+        record_feed_resets((instance.pk, user_id) for user_id in pk_set)
+
+
+@receiver(pre_save, sender=Project)
+def remember_previous_manager(sender, instance, raw=False, **kwargs):
+    if instance.pk is not None and not raw:
+        instance._previous_manager_id = Project.objects.filter(pk=instance.pk).values_list(
+            'manager_id', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Project)
+def record_replaced_manager_tombstones(sender, instance, created, raw=False, **kwargs):
+    """
+    Traces des tâches du projet pour l'ancien chef de projet, et rechargement
+    pour le nouveau s'il n'était pas déjà membre de l'équipe.
+    """
+    previous = getattr(instance, '_previous_manager_id', None)
+    if created or raw or previous is None or previous == instance.manager_id:
+        return
+    TaskTombstone.objects.bulk_create([
+        TaskTombstone(task_id=pk, project_id=instance.pk, assigned_to_id=assigned_to_id, user_id=previous)
+        for pk, assigned_to_id in instance.tasks.order_by().values_list('pk', 'assigned_to_id')
+    ], batch_size=1000)
+    if not instance.team_members.filter(pk=instance.manager_id).exists():
+        record_feed_resets([(instance.pk, instance.manager_id)])
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_task_caches(sender, instance, **kwargs):
+    """Invalide les réponses en cache des utilisateurs qui voient la tâche."""
+    previous = instance.loaded_state() or {}
+    invalidate_projects(
+        {instance.project_id, previous.get('project_id')},
+        extra_user_ids={instance.assigned_to_id, previous.get('assigned_to_id')}
+    )
+
+
+def _bulk_scope(created, updated, previous):
+    tasks = [*created, *updated]
+    project_ids = {task.project_id for task in tasks}
+    project_ids.update(state['project_id'] for state in previous.values() if state)
+    assignees = {task.assigned_to_id for task in tasks}
+    assignees.update(state['assigned_to_id'] for state in previous.values() if state)
+    return project_ids, assignees
+
+
+# En dessous de ce nombre de tâches modifiées, les compteurs sont mis à jour par
+# deltas (comme post_save) plutôt que recalculés pour les projets touchés
+INCREMENTAL_UPDATE_LIMIT = 10
+# Créations seules : incréments par projet tant que les tâches touchent au plus ce
+# nombre de projets (deux requêtes par projet, contre un recalcul de leurs tâches)
+INCREMENTAL_PROJECT_LIMIT = 50
+
+
+@receiver(tasks_bulk_changed, sender=Task)
+def update_project_counters_in_bulk(sender, created=(), updated=(), previous=None, **kwargs):
+    """
+    Met à jour les compteurs des projets touchés : par incréments pour des créations
+    seules (import), par deltas pour quelques tâches dont l'état précédent est connu
+    (transition de statut unitaire), sinon par un recalcul en deux requêtes groupées.
+    """
+    previous = previous or {}
+    if not updated and len({task.project_id for task in created}) <= INCREMENTAL_PROJECT_LIMIT:
+        counters.tasks_created(created)
+        return
+    if (
+        not created
+        and len(updated) <= INCREMENTAL_UPDATE_LIMIT
+        and all(previous.get(task.pk) for task in updated)
+    ):
+        for task in updated:
+            counters.task_saved(task, previous[task.pk])
+        return
+    project_ids, _ = _bulk_scope(created, updated, previous)
+    counters.recompute_counters(project_ids)
+
+
+@receiver(tasks_bulk_changed, sender=Task)
+def record_moved_tombstones_in_bulk(sender, updated=(), previous=None, **kwargs):
+    TaskTombstone.objects.bulk_create(moved_tombstones(updated, previous or {}), batch_size=1000)
+
+
+@receiver(tasks_bulk_changed, sender=Task)
+def invalidate_task_caches_in_bulk(sender, created=(), updated=(), previous=None, **kwargs):
+    project_ids, assignees = _bulk_scope(created, updated, previous or {})
+    invalidate_projects(project_ids, extra_user_ids=assignees)
+
+
+def task_event(task, deleted=False):
+    """Événement temps réel d'une tâche (voir lon/events.py)."""
+    if deleted:
+        return {'type': 'task', 'id': task.pk, 'project': task.project_id, 'deleted': True}
+    return {
+        'type': 'task',
+        'id': task.pk,
+        'project': task.project_id,
+        'title': task.title,
+        'status': task.status,
+        'priority': task.priority,
+        'assigned_to': task.assigned_to_id,
+        'end_date': task.end_date,
+        'updated_at': task.updated_at,
+        'deleted': False,
+    }
+
+
+def task_event_items(task, previous, deleted=False):
+    items = [(project_topic(task.project_id), task_event(task, deleted))]
+    if previous and previous['project_id'] != task.project_id:
+        # Tâche déplacée : elle disparaît du tableau de l'ancien projet
+        items.append((project_topic(previous['project_id']), task_event(task, deleted=True)))
+    return items
+
+
+@receiver(post_save, sender=Task)
+def publish_task_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        get_broker().publish_on_commit(task_event_items(instance, instance.loaded_state()))
+
+
+@receiver(post_delete, sender=Task)
+def publish_task_deleted(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Project):
+        # Le projet supprimé publie son propre événement
+        return
+    get_broker().publish_on_commit(task_event_items(instance, None, deleted=True))
+
+
+@receiver(tasks_bulk_changed, sender=Task)
+def publish_tasks_in_bulk(sender, created=(), updated=(), previous=None, **kwargs):
+    previous = previous or {}
+    items = []
+    for task in created:
+        items.extend(task_event_items(task, None))
+    for task in updated:
+        items.extend(task_event_items(task, previous.get(task.pk)))
+    get_broker().publish_on_commit(items)
+
+
+@receiver(post_save, sender=Task)
+def notify_task_saved(sender, instance, created, raw=False, **kwargs):
+    """
+    Assignation et changement de statut notifiés à l'équipe du projet, sauf à
+    l'auteur : `_changed_by_id` renseigné par la vue, ou le créateur de la tâche.
+    """
+    if raw:
+        return
+    previous = None if created else instance.loaded_state()
+    if created or previous is not None:
+        actor_id = getattr(instance, '_changed_by_id', None) or (instance.created_by_id if created else None)
+        notify_task_changes([(instance, previous)], actor_id)
+
+
+@receiver(tasks_bulk_changed, sender=Task)
+def notify_tasks_in_bulk(sender, created=(), updated=(), previous=None, actor=None, **kwargs):
+    # Les créations en masse (import) ne sont pas notifiées, tâche par tâche
+    previous = previous or {}
+    notify_task_changes(
+        [(task, previous[task.pk]) for task in updated if previous.get(task.pk)],
+        getattr(actor, 'pk', None),
+    )
+
+
+@receiver(pre_delete, sender=Task)
+def invalidate_unread_of_deleted_task(sender, instance, origin=None, **kwargs):
+    """
+    Notifications supprimées en cascade avec la tâche : compteurs de non lues de
+    leurs destinataires invalidés en une requête (pas de signal par notification,
+    qui empêcherait la suppression groupée).
+    """
+    if isinstance(origin, Project):
+        # Traité en une fois pour tout le projet
+        return
+    invalidate_unread_of(Notification.objects.filter(task=instance))
+
+
+@receiver(pre_delete, sender=Project)
+def invalidate_unread_of_deleted_project(sender, instance, **kwargs):
+    invalidate_unread_of(Notification.objects.filter(task__project=instance))
+
+
+@receiver(post_delete, sender=TaskDocument)
+def release_document_blob(sender, instance, **kwargs):
+    """Libère le contenu partagé du document (y compris lors des suppressions en cascade)."""
+    if instance.blob_id is not None:
+        release_blob(instance.blob_id)
+
+
+@receiver(post_save, sender=TaskDocument)
+def queue_document_preview(sender, instance, created, raw=False, **kwargs):
+    """L'aperçu est généré par le worker (voir tasks/previews.py), après la validation."""
+    if created and not raw:
+        transaction.on_commit(lambda: enqueue_preview(instance))
@@ -0,0 +1,101 @@
+"""
+Machine à états du statut des tâches.
+
+Le statut d'origine est celui chargé depuis la base (voir `Task.from_db`) :
+la validation d'une transition ne nécessite donc aucune requête. Les
+transitions appliquées directement en base utilisent un UPDATE conditionnel
+(`WHERE status = <ancien statut>`), ce qui rend les changements concurrents
+sûrs : si une autre requête a modifié le statut entre-temps, la transition
+échoue au lieu d'écraser l'autre modification.
+
+Utilisée par Task.clean (formulaires et admin), TaskViewSet (mise à jour et
+change_status) et les opérations en masse.
+"""
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+
+class StatusConflict(Exception):
+    """Le statut en base ne correspond plus au statut chargé (modification concurrente)."""
+
+    def __init__(self, task, expected):
+        self.task = task
+        self.expected = expected
+        super().__init__(f"Le statut de la tâche {task.pk} a été modifié entre-temps.")
+
+
+class TaskStatusMachine:
+    def __init__(self, transitions, choices):
+        self.transitions = transitions
+        self.labels = dict(choices)
+
+    def can_transition(self, old_status, new_status):
+        return old_status == new_status or new_status in self.transitions.get(old_status, [])
+
+    def error_message(self, old_status, new_status):
+        return (
+            f"Impossible de passer directement de '{self.labels.get(old_status, old_status)}' "
+            f"à '{self.labels.get(new_status, new_status)}'"
+        )
+
+    def check(self, old_status, new_status):
+        """Lève ValidationError si la transition est interdite."""
+        if old_status is not None and not self.can_transition(old_status, new_status):
+            raise ValidationError({'status': self.error_message(old_status, new_status)})
+
+    def original_status(self, task):
+        """
+        Statut de la tâche en base. Lu depuis l'état chargé ; une requête n'est faite
+        que pour une instance qui n'a pas été chargée depuis la base.
+        """
+        if task.pk is None or task._state.adding:
+            return None
+        state = getattr(task, '_loaded_values', None) or {}
+        if 'status' in state:
+            return state['status']
+        return type(task)._base_manager.filter(pk=task.pk).values_list('status', flat=True).first()
+
+    def validate(self, task, new_status=None):
+        """Valide le passage de la tâche de son statut d'origine à `new_status` (ou task.status)."""
+        self.check(self.original_status(task), task.status if new_status is None else new_status)
+
+    def transition(self, task, new_status, actor=None):
+        """
+        Applique la transition en base par un UPDATE conditionnel sur l'ancien statut.
+        Lève ValidationError si la transition est interdite, StatusConflict si le statut
+        a été modifié entre-temps par une autre requête. `actor` (auteur) n'est pas notifié.
+        """
+        from .signals import tasks_bulk_changed
+
+        old_status = self.original_status(task)
+        self.check(old_status, new_status)
+        if old_status == new_status:
+            return task
+
+        previous = task.loaded_state()
+        now = timezone.now()
+        updated = type(task)._base_manager.filter(pk=task.pk, status=old_status).update(
+            status=new_status, updated_at=now
+        )
+        if not updated:
+            raise StatusConflict(task, old_status)
+
+        task.status = new_status
+        task.updated_at = now
+        tasks_bulk_changed.send(
+            sender=type(task),
+            created=[],
+            updated=[task],
+            previous={task.pk: previous} if previous else {},
+            actor=actor,
+        )
+        task._loaded_values = task.tracked_state()
+        return task
+
+
+def _build_machine():
+    from .models import Task, VALID_STATUS_TRANSITIONS
+    return TaskStatusMachine(VALID_STATUS_TRANSITIONS, Task.STATUS_CHOICES)
+
+
+status_machine = _build_machine()
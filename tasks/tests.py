@@ -1,3 +1,1298 @@
-from django.test import TestCase
+import csv
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from accounts.models import Notification, User
+from clients.models import Client
+from lon.async_views import async_read_view
+from lon.metrics import QueryBudgetExceeded, fingerprint, registry
+from projects.counters import check_counters
+from projects.models import Project, ProjectTaskCounter
+from .fields import ranked_choice_conversion
+from .forms import TaskForm
+from .management.commands.benchmark_api import Command as BenchmarkApiCommand
+from .imports import ImportFormatError, TaskImporter, read_json
+from .models import (
+    DocumentBlob, DocumentPreview, DocumentUpload, OverdueScan, Task, TaskDocument, TaskOverdueEvent, TaskTombstone,
+)
+from .overdue import acquire_lease, run_scan
+from .pages import kanban_context
+from .previews import cache_key, cache_path, evict_cache, mark_failed, run_batch
+from .status import StatusConflict, status_machine
+from .uploads import partial_path
+from .views import TaskViewSet
+
+
+class TaskTestMixin:
+    def create_project(self, name, manager, members=()):
+        today = timezone.now().date()
+        project = Project.objects.create(
+            name=name,
+            client=self.client_company,
+            location='Abidjan',
+            start_date=today,
+            end_date=today + timedelta(days=30),
+            budget=1000,
+            manager=manager,
+        )
+        project.team_members.add(*members)
+        return project
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='membre', password='secret')
+        self.other = User.objects.create_user(username='autre', password='secret')
+        self.client_company = Client.objects.create(name='Client')
+        self.client.force_authenticate(self.user)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskVisibilityTests(TaskTestMixin, APITestCase):
+    def test_visible_to_member_manager_and_assignee(self):
+        member_project = self.create_project('Membre', self.other, members=[self.user, self.other])
+        managed_project = self.create_project('Géré', self.user)
+        foreign_project = self.create_project('Étranger', self.other, members=[self.other])
+
+        visible = {
+            Task.objects.create(title='membre', project=member_project).pk,
+            Task.objects.create(title='géré', project=managed_project).pk,
+            Task.objects.create(title='assigné', project=foreign_project, assigned_to=self.user).pk,
+        }
+        Task.objects.create(title='invisible', project=foreign_project)
+
+        self.assertEqual(set(Task.objects.visible_to(self.user).values_list('pk', flat=True)), visible)
+
+    def test_list_query_count_is_constant(self):
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        for index in range(20):
+            Task.objects.create(title=f'Tâche {index}', project=project, assigned_to=self.other)
+
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 20)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskPaginationTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        today = timezone.now().date()
+        priorities = [code for code, _ in Task.PRIORITY_CHOICES]
+        for index in range(23):
+            Task.objects.create(
+                title=f'Tâche {index}',
+                project=project,
+                priority=priorities[index % len(priorities)],
+                end_date=None if index % 5 == 0 else today + timedelta(days=index % 3),
+            )
+
+    def walk(self, url):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            url = response.data['next']
+        return pages
+
+    def test_cursor_pages_cover_every_task_once(self):
+        pages = self.walk('/api/tasks/?page_size=5&fields=id')
+        ids = [row['id'] for page in pages for row in page['results']]
+
+        self.assertEqual(len(pages), 5)
+        self.assertEqual(len(ids), 23)
+        self.assertEqual(len(set(ids)), 23)
+
+    def test_previous_link_returns_previous_page(self):
+        pages = self.walk('/api/tasks/?page_size=5&fields=id')
+        response = self.client.get(pages[2]['previous'])
+
+        self.assertEqual(response.data['results'], pages[1]['results'])
+
+    def test_deep_page_uses_single_query(self):
+        pages = self.walk('/api/tasks/?page_size=5&fields=id')
+        with self.assertNumQueries(1):
+            self.client.get(pages[3]['next'])
+
+    def test_tasks_without_end_date_come_last(self):
+        pages = self.walk('/api/tasks/?page_size=5&fields=id')
+        ids = [row['id'] for page in pages for row in page['results']]
+        tasks = Task.objects.in_bulk(ids)
+        rank = Task._meta.get_field('priority').rank
+        expected = sorted(ids, key=lambda pk: (
+            -rank(tasks[pk].priority), tasks[pk].end_date is None, tasks[pk].end_date or timezone.now().date(),
+            -tasks[pk].created_at.timestamp(), -pk,
+        ))
+
+        self.assertEqual(ids, expected)
+
+    @skipUnless(connection.vendor == 'sqlite', "Plans d'exécution propres à SQLite")
+    def test_pages_follow_ordering_index(self):
+        pages = self.walk('/api/tasks/?page_size=5&fields=id')
+        for url in ('/api/tasks/?page_size=5&fields=id', pages[3]['next'], pages[3]['previous']):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {queries.captured_queries[-1]['sql']}")
+                plan = ' | '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('task_ordering_idx', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_explain_hot_queries_covers_deep_pages(self):
+        stdout = io.StringIO()
+        call_command('explain_hot_queries', user='membre', stdout=stdout)
+
+        self.assertIn('TaskViewSet.list (page profonde)', stdout.getvalue())
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/tasks/?fields=id,title')
+
+        self.assertEqual(set(response.data['results'][0]), {'id', 'title'})
+
+
+class TaskRankedChoiceTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+
+    def test_priority_orders_by_rank(self):
+        for priority in ['high', 'low', 'urgent', 'medium']:
+            Task.objects.create(title=priority, project=self.project, priority=priority)
+
+        self.assertEqual(
+            list(Task.objects.values_list('priority', flat=True)),
+            ['urgent', 'high', 'medium', 'low']
+        )
+
+    def test_codes_are_stored_as_ranks(self):
+        task = Task.objects.create(title='Tâche', project=self.project, status='review', priority='urgent')
+
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT status, priority FROM tasks_task WHERE id = %s', [task.pk])
+            self.assertEqual(cursor.fetchone(), (2, 3))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.get_status_display()), ('review', 'En révision'))
+        self.assertEqual(Task.objects.filter(priority__gte='high').get(), task)
+
+    def test_migration_conversion_between_codes_and_ranks(self):
+        # Colonne de codes et colonne de rangs simulées par title et status
+        tasks = [Task.objects.create(title=code, project=self.project) for code in ('done', 'review', 'todo')]
+        forward, backward = ranked_choice_conversion('tasks.Task', 'title', 'status', Task.STATUS_CHOICES)
+        schema_editor = mock.Mock(connection=connection)
+
+        forward(apps, schema_editor)
+        self.assertEqual([Task.objects.get(pk=task.pk).status for task in tasks], ['done', 'review', 'todo'])
+
+        Task.objects.filter(pk=tasks[0].pk).update(status='in_progress')
+        backward(apps, schema_editor)
+        self.assertEqual(
+            [Task.objects.get(pk=task.pk).title for task in tasks], ['in_progress', 'review', 'todo']
+        )
+
+        Task.objects.create(title='inconnu', project=self.project)
+        with self.assertRaisesMessage(ValueError, 'inconnu'):
+            forward(apps, schema_editor)
+
+    def test_api_keeps_string_codes(self):
+        response = self.client.post('/api/tasks/', {
+            'title': 'Nouvelle', 'project': self.project.pk, 'status': 'todo', 'priority': 'high',
+        })
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['status'], response.data['priority']), ('todo', 'high'))
+
+        response = self.client.post('/api/tasks/', {
+            'title': 'Invalide', 'project': self.project.pk, 'priority': 'critical',
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class TaskBulkTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+
+    def test_bulk_status_changes_validate_transitions(self):
+        tasks = [Task.objects.create(title=f'Tâche {index}', project=self.project) for index in range(4)]
+        foreign = Task.objects.create(
+            title='Étrangère', project=self.create_project('Autre', self.other, members=[self.other])
+        )
+
+        response = self.client.post('/api/tasks/bulk/', {'status': [
+            {'id': tasks[0].pk, 'status': 'in_progress'},
+            {'id': tasks[1].pk, 'status': 'done'},
+            {'id': tasks[2].pk, 'status': 'unknown'},
+            {'id': foreign.pk, 'status': 'in_progress'},
+        ]}, format='json')
+
+        results = response.data['results']['status']
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results[0], {'index': 0, 'id': tasks[0].pk, 'status': 'in_progress'})
+        self.assertIn('errors', results[1])
+        self.assertIn('errors', results[2])
+        self.assertIn('errors', results[3])
+        self.assertEqual(
+            list(Task.objects.filter(project=self.project).order_by('pk').values_list('status', flat=True)),
+            ['in_progress', 'todo', 'todo', 'todo']
+        )
+        self.assertEqual(ProjectTaskCounter.objects.get(project=self.project).in_progress, 1)
+
+    def test_bulk_create_and_update(self):
+        task = Task.objects.create(title='Existante', project=self.project)
+
+        response = self.client.post('/api/tasks/bulk/', {
+            'create': [
+                {'title': 'Nouvelle', 'project': self.project.pk, 'priority': 'high'},
+                {'title': 'Dates', 'project': self.project.pk, 'start_date': '2025-02-01', 'end_date': '2025-01-01'},
+            ],
+            'update': [{'id': task.pk, 'title': 'Renommée', 'status': 'in_progress'}],
+        }, format='json')
+
+        results = response.data['results']
+        self.assertIn('id', results['create'][0])
+        self.assertIn('errors', results['create'][1])
+        created = Task.objects.get(pk=results['create'][0]['id'])
+        self.assertEqual((created.priority, created.created_by), ('high', self.user))
+        task.refresh_from_db()
+        self.assertEqual((task.title, task.status), ('Renommée', 'in_progress'))
+
+    def test_malformed_payloads_are_rejected(self):
+        task = Task.objects.create(title='Existante', project=self.project)
+        for payload in (
+            [{'id': task.pk}],
+            {'update': ['texte']},
+            {'update': [{'id': [task.pk], 'title': 'Liste'}]},
+            {'status': [{'id': 'abc', 'status': 'in_progress'}]},
+            {'status': [{'id': True, 'status': 'in_progress'}]},
+        ):
+            with self.subTest(payload=payload):
+                response = self.client.post('/api/tasks/bulk/', payload, format='json')
+                self.assertEqual(response.status_code, 400)
+
+        response = self.client.post(
+            '/api/tasks/bulk/', {'status': [{'id': str(task.pk), 'status': 'in_progress'}]}, format='json'
+        )
+        self.assertEqual(response.data['results']['status'], [{'index': 0, 'id': task.pk, 'status': 'in_progress'}])
+
+    def test_bulk_update_writes_only_changed_fields(self):
+        renamed = Task.objects.create(title='Titre', project=self.project, description='Texte')
+        reprioritized = Task.objects.create(title='Priorité', project=self.project)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/tasks/bulk/', {'update': [
+                {'id': renamed.pk, 'title': 'Renommée'},
+                {'id': reprioritized.pk, 'priority': 'high'},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "tasks_task"')]
+        # Un bulk_update par ensemble de champs modifiés, sans réécrire les autres colonnes
+        self.assertEqual(len(updates), 2)
+        self.assertTrue(all('"description"' not in sql for sql in updates))
+        self.assertEqual(sum('"title"' in sql for sql in updates), 1)
+
+    def test_bulk_status_changes_use_constant_queries(self):
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=self.project) for index in range(300)])
+        payload = {'status': [
+            {'id': pk, 'status': 'in_progress'}
+            for pk in Task.objects.values_list('pk', flat=True)
+        ]}
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post('/api/tasks/bulk/', payload, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertLess(len(context.captured_queries), 15)
+        self.assertEqual(Task.objects.filter(status='in_progress').count(), 300)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskStatusTransitionTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+        self.task = Task.objects.create(title='Tâche', project=self.project)
+
+    def test_clean_uses_loaded_status_without_query(self):
+        task = Task.objects.get(pk=self.task.pk)
+        task.status = 'in_progress'
+        with self.assertNumQueries(0):
+            task.clean()
+        task.status = 'done'
+        with self.assertNumQueries(0), self.assertRaises(ValidationError):
+            task.clean()
+
+    def test_form_rejects_invalid_transition(self):
+        data = {
+            'title': 'Tâche', 'project': self.project.pk, 'status': 'done',
+            'priority': 'medium', 'start_date': '', 'end_date': '',
+        }
+        form = TaskForm(data, instance=Task.objects.get(pk=self.task.pk))
+        self.assertFalse(form.is_valid())
+        self.assertIn('status', form.errors)
+
+        form = TaskForm({**data, 'status': 'in_progress'}, instance=Task.objects.get(pk=self.task.pk))
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_change_status_validates_transition(self):
+        url = f'/api/tasks/{self.task.pk}/change_status/'
+        self.assertEqual(self.client.post(url, {'status': 'done'}, format='json').status_code, 400)
+        response = self.client.post(url, {'status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.status, 'in_progress')
+        counter = ProjectTaskCounter.objects.get(project=self.project)
+        self.assertEqual((counter.todo, counter.in_progress), (0, 1))
+
+    def test_transition_detects_concurrent_change(self):
+        task = Task.objects.get(pk=self.task.pk)
+        Task.objects.filter(pk=task.pk).update(status='in_progress')
+
+        with self.assertRaises(StatusConflict):
+            status_machine.transition(task, 'in_progress')
+        self.assertEqual(Task.objects.get(pk=task.pk).status, 'in_progress')
+
+    def test_partial_update_validates_transition(self):
+        url = f'/api/tasks/{self.task.pk}/'
+        self.assertEqual(self.client.patch(url, {'status': 'review'}, format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'status': 'in_progress'}, format='json').status_code, 200)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskTimingTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+        today = timezone.now().date()
+        self.late = Task.objects.create(title='En retard', project=self.project, end_date=today - timedelta(days=5))
+        self.later = Task.objects.create(title='Très en retard', project=self.project, end_date=today - timedelta(days=9))
+        self.done = Task.objects.create(title='Terminée', project=self.project, end_date=today - timedelta(days=20))
+        Task.objects.filter(pk=self.done.pk).update(status='done')
+        self.future = Task.objects.create(title='À venir', project=self.project, end_date=today + timedelta(days=3))
+        self.undated = Task.objects.create(title='Sans date', project=self.project)
+
+    def test_annotations_match_properties(self):
+        for task in Task.objects.with_timing():
+            plain = Task.objects.get(pk=task.pk)
+            self.assertEqual((task.is_overdue, task.delay_days), (plain.is_overdue, plain.delay_days))
+        self.assertEqual(Task.objects.with_timing().get(pk=self.later.pk).delay_days, 9)
+
+    def test_overdue_filter(self):
+        response = self.client.get('/api/tasks/', {'overdue': 'true'})
+        self.assertEqual({row['id'] for row in response.data['results']}, {self.late.pk, self.later.pk})
+        response = self.client.get('/api/tasks/', {'overdue': 'false'})
+        self.assertEqual(
+            {row['id'] for row in response.data['results']},
+            {self.done.pk, self.future.pk, self.undated.pk}
+        )
+
+    def test_ordering_by_delay_pages_through_every_task(self):
+        seen = []
+        url, params = '/api/tasks/', {'ordering': '-delay', 'page_size': 2}
+        while url:
+            response = self.client.get(url, params)
+            seen.extend(row['id'] for row in response.data['results'])
+            url, params = response.data['next'], None
+        self.assertEqual(seen[:2], [self.later.pk, self.late.pk])
+        self.assertEqual(sorted(seen), sorted(Task.objects.values_list('pk', flat=True)))
+
+
+class TaskKanbanPageTests(TaskTestMixin, APITestCase):
+    def test_columns_are_limited_and_counted(self):
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        Task.objects.bulk_create(
+            [Task(title=f'À faire {index}', project=project, priority='low') for index in range(5)]
+            + [Task(title='Urgente', project=project, priority='urgent')]
+            + [Task(title='En cours', project=project, status='in_progress')]
+        )
+
+        context = kanban_context(self.user, project, limit=3)
+        columns = {column['status']: column for column in context['columns']}
+        self.assertEqual([task.title for task in columns['todo']['tasks']][0], 'Urgente')
+        self.assertEqual((len(columns['todo']['tasks']), columns['todo']['count'], columns['todo']['hidden']), (3, 6, 3))
+        self.assertEqual(columns['in_progress']['count'], 1)
+        self.assertEqual(columns['done']['tasks'], [])
+        self.assertIn('+ 3 autres', render_to_string('tasks/_kanban_board.html', context))
+
+    def test_kanban_cost_does_not_depend_on_task_count(self):
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=project) for index in range(5)])
+        with CaptureQueriesContext(connection) as small:
+            kanban_context(self.user, project, limit=3)
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=project) for index in range(50)])
+        with CaptureQueriesContext(connection) as large:
+            kanban_context(self.user, project, limit=3)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskChangeFeedTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+        self.task = Task.objects.create(title='Tâche', project=self.project)
+        self.token = self.client.get('/api/tasks/changes/').data['token']
+
+    def age_rows(self, seconds=3600):
+        past = timezone.now() - timedelta(seconds=seconds)
+        Task.objects.update(updated_at=past)
+        TaskTombstone.objects.update(deleted_at=past)
+
+    def test_changes_since_token(self):
+        self.age_rows()
+        created = Task.objects.create(title='Nouvelle', project=self.project)
+        deleted_id = self.task.pk
+        self.task.delete()
+        Task.objects.create(title='Invisible', project=self.create_project('Autre', self.other))
+
+        response = self.client.get('/api/tasks/changes/', {'since': self.token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['changed']], [created.pk])
+        self.assertEqual(response.data['deleted'], [deleted_id])
+        self.assertFalse(response.data['has_more'])
+
+    def test_late_commit_within_grace_window_is_returned(self):
+        # Ligne validée après la lecture mais horodatée avant le jeton
+        Task.objects.filter(pk=self.task.pk).update(updated_at=timezone.now() - timedelta(seconds=10))
+        response = self.client.get('/api/tasks/changes/', {'since': self.token})
+        self.assertEqual([row['id'] for row in response.data['changed']], [self.task.pk])
+
+    def test_pages_through_large_change_sets(self):
+        Task.objects.bulk_create([Task(title=f'Tâche {index}', project=self.project) for index in range(7)])
+        self.age_rows()
+        token = self.client.get('/api/tasks/changes/').data['token']
+        Task.objects.update(updated_at=timezone.now())
+
+        seen, has_more = [], True
+        while has_more:
+            response = self.client.get('/api/tasks/changes/', {'since': token, 'limit': 3})
+            seen.extend(row['id'] for row in response.data['changed'])
+            token, has_more = response.data['token'], response.data['has_more']
+        self.assertEqual(sorted(seen), sorted(Task.objects.values_list('pk', flat=True)))
+
+    def test_project_deletion_records_tombstones(self):
+        self.age_rows()
+        task_id = self.task.pk
+        self.project.delete()
+        response = self.client.get('/api/tasks/changes/', {'since': self.token})
+        self.assertEqual(response.data['deleted'], [task_id])
+
+    def changes(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get('/api/tasks/changes/', {'since': self.token}).data
+
+    def test_tasks_leaving_visibility_are_reported_as_deleted(self):
+        shared = self.create_project('Partagé', self.other, members=[self.user, self.other])
+        foreign = self.create_project('Étranger', self.other, members=[self.other])
+        moved = Task.objects.create(title='Déplacée', project=self.project)
+        reassigned = Task.objects.create(title='Réassignée', project=foreign, assigned_to=self.user)
+        kept = Task.objects.create(title='Toujours visible', project=self.project)
+        team_task = Task.objects.create(title="De l'équipe", project=shared)
+        self.age_rows()
+
+        moved.project = foreign
+        moved.save()
+        reassigned.assigned_to = self.other
+        reassigned.save()
+        kept.project = shared
+        kept.save()
+        shared.team_members.remove(self.user)
+
+        data = self.changes(self.user)
+        self.assertEqual(data['deleted'], sorted([moved.pk, reassigned.pk, kept.pk, team_task.pk]))
+        self.assertEqual(data['changed'], [])
+        # Les nouveaux lecteurs voient les tâches, sans trace de suppression
+        data = self.changes(self.other)
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual({row['id'] for row in data['changed']}, {moved.pk, reassigned.pk, kept.pk})
+
+    def test_deleted_project_tombstones_go_to_former_audience(self):
+        self.age_rows()
+        task_id = self.task.pk
+        self.project.delete()
+        self.assertEqual(self.changes(self.user)['deleted'], [task_id])
+        self.assertEqual(self.changes(self.other)['deleted'], [])
+
+    def test_added_member_must_reload(self):
+        shared = self.create_project('Partagé', self.other, members=[self.other])
+        Task.objects.create(title='Existante', project=shared)
+        self.age_rows()
+        token = self.changes(self.other)['token']
+        self.client.force_authenticate(self.user)
+        before = self.client.get('/api/tasks/changes/').data['token']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.projects.add(shared)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': before}).status_code, 410)
+        # Les autres membres ne sont pas concernés, un jeton postérieur non plus
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': token}).status_code, 200)
+        self.client.force_authenticate(self.user)
+        after = self.client.get('/api/tasks/changes/').data['token']
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': after}).status_code, 200)
+
+    def test_new_manager_must_reload(self):
+        foreign = self.create_project('Étranger', self.other, members=[self.other])
+        Task.objects.create(title='Existante', project=foreign)
+        self.age_rows()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            foreign.manager = self.user
+            foreign.save()
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': self.token}).status_code, 410)
+
+    def test_invalid_and_expired_tokens(self):
+        self.assertEqual(self.client.get('/api/tasks/changes/', {'since': 'invalide'}).status_code, 400)
+        with override_settings(TASK_TOMBSTONE_RETENTION_DAYS=0):
+            self.assertEqual(self.client.get('/api/tasks/changes/', {'since': self.token}).status_code, 410)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskAsyncReadTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+        hidden = self.create_project('Autre', self.other, members=[self.other])
+        for index in range(7):
+            Task.objects.create(title=f'Tâche {index}', project=self.project)
+        self.hidden_task = Task.objects.create(title='Cachée', project=hidden)
+        self.factory = RequestFactory()
+        self.token = str(AccessToken.for_user(self.user))
+
+    def call(self, action, path, token=None, **kwargs):
+        actions = {'get': action}
+        view = async_read_view(TaskViewSet, action, actions, 'tasks.list' if action == 'list' else None)
+        request = self.factory.get(path, HTTP_AUTHORIZATION=f'Bearer {token or self.token}')
+        return async_to_sync(view)(request, **kwargs)
+
+    def test_list_matches_sync_viewset(self):
+        expected = self.client.get('/api/tasks/?page_size=3').data
+        response = self.call('list', '/api/tasks/?page_size=3')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), json.loads(json.dumps(expected, cls=DjangoJSONEncoder)))
+
+    def test_retrieve_respects_visibility(self):
+        task = Task.objects.filter(project=self.project).first()
+        self.assertEqual(self.call('retrieve', '/api/tasks/', pk=task.pk).status_code, 200)
+        self.assertEqual(self.call('retrieve', '/api/tasks/', pk=self.hidden_task.pk).status_code, 404)
+
+    def test_requires_valid_token(self):
+        self.assertEqual(self.call('list', '/api/tasks/', token='invalide').status_code, 401)
+
+    @override_settings(API_CACHE_ENABLED=True)
+    def test_cached_list_answers_not_modified(self):
+        response = self.call('list', '/api/tasks/')
+        view = async_read_view(TaskViewSet, 'list', {'get': 'list'}, 'tasks.list')
+        request = self.factory.get(
+            '/api/tasks/', HTTP_AUTHORIZATION=f'Bearer {self.token}', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(async_to_sync(view)(request).status_code, 304)
+
+
+class TaskExportTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        today = timezone.now().date()
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        hidden = self.create_project('Autre', self.other, members=[self.other])
+        self.late = Task.objects.create(
+            title='En retard, "urgent"', project=project, assigned_to=self.user,
+            start_date=today - timedelta(days=9), end_date=today - timedelta(days=3),
+        )
+        Task.objects.create(title='Cachée', project=hidden)
+
+    def content(self, response):
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export_streams_visible_tasks(self):
+        response = self.client.get('/api/tasks/export/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        rows = list(csv.DictReader(io.StringIO(self.content(response))))
+        self.assertEqual([row['id'] for row in rows], [str(self.late.pk)])
+        self.assertEqual(rows[0]['title'], 'En retard, "urgent"')
+        self.assertEqual(rows[0]['duration_days'], '7')
+        self.assertEqual(rows[0]['delay_days'], '3')
+        self.assertEqual(rows[0]['assigned_to'], 'membre')
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/tasks/export/', {'format': 'ndjson'})
+
+        lines = self.content(response).splitlines()
+        self.assertEqual(len(lines), 1)
+        row = json.loads(lines[0])
+        self.assertEqual((row['id'], row['is_overdue'], row['delay_days']), (self.late.pk, True, 3))
+
+    def test_export_uses_one_query(self):
+        with self.assertNumQueries(1):
+            self.content(self.client.get('/api/tasks/export/', {'overdue': 'true'}))
+
+    def test_export_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/api/tasks/export/').status_code, 401)
+
+
+class TaskImportTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.project = self.create_project('Chantier', self.user, members=[self.user])
+        self.hidden = self.create_project('Autre', self.other, members=[self.other])
+
+    def upload(self, name, content, **data):
+        upload = SimpleUploadedFile(name, content.encode('utf-8'))
+        return self.client.post('/api/tasks/import/', {'file': upload, **data}, format='multipart')
+
+    def test_csv_import_reports_row_errors(self):
+        content = (
+            "title;project;assigned_to;status;start_date;end_date\n"
+            "Fondations;Chantier;autre;En cours;2026-01-05;10/01/2026\n"
+            ";Chantier;;;;\n"
+            "Dates;Chantier;;;2026-02-01;2026-01-01\n"
+            "Projet d'un autre;Autre;;;;\n"
+        )
+        response = self.upload('planning.csv', content)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual([error['line'] for error in response.data['errors']], [3, 4, 5])
+        self.assertIn('title', response.data['errors'][0]['errors'])
+        self.assertIn('start_date', response.data['errors'][1]['errors'])
+        self.assertIn('project', response.data['errors'][2]['errors'])
+        task = Task.objects.get(title='Fondations')
+        self.assertEqual((task.status, task.assigned_to, task.created_by), ('in_progress', self.other, self.user))
+        self.assertEqual(check_counters([self.project.pk]), [])
+
+    def test_json_import_with_default_project(self):
+        content = json.dumps([{'title': f'Tâche {index}', 'priority': 'urgent'} for index in range(5)])
+        response = self.upload('planning.json', content, project=self.project.pk)
+
+        self.assertEqual(response.data['created'], 5)
+        self.assertEqual(self.project.tasks.filter(priority='urgent').count(), 5)
+
+    def test_atomic_import_keeps_nothing_on_error(self):
+        content = "title,project\nValide,Chantier\n,Chantier\n"
+        response = self.upload('planning.csv', content, atomic='true')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Task.objects.exists())
+
+    def test_references_resolved_once_per_batch(self):
+        rows = ''.join(f"Tâche {index},{self.project.pk},membre\n" for index in range(30))
+        importer = TaskImporter(user=self.user, batch_size=10)
+        with CaptureQueriesContext(connection) as context:
+            result = importer.run(io.BytesIO(f"title,project,assigned_to\n{rows}".encode()), 'csv')
+        self.assertEqual(result.created, 30)
+        # Références résolues au premier lot, puis gardées en mémoire
+        lookups = [query for query in context.captured_queries if '"projects_project"."name"' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+
+    def test_numeric_references_resolve_ids_before_names(self):
+        # Projet dont le nom est l'identifiant d'un autre, et nom numérique sans homonyme
+        self.create_project(str(self.project.pk), self.user, members=[self.user])
+        numeric = self.create_project('99999', self.user, members=[self.user])
+        content = (
+            f"title,project,assigned_to\n"
+            f"Par identifiant,{self.project.pk},\n"
+            f"Par nom,99999,\n"
+            f"Chiffres arabes,{chr(0x0660 + self.project.pk % 10)},\n"
+            f"Exposant,{self.project.pk}²,²\n"
+        )
+        response = self.upload('planning.csv', content)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Task.objects.get(title='Par identifiant').project, self.project)
+        self.assertEqual(Task.objects.get(title='Par nom').project, numeric)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5])
+
+    def test_malformed_json_fails_without_reading_the_rest(self):
+        stream = io.BytesIO(('[{"title": "a"}, {"title": } ' + ' ' * 10 * 1024 * 1024 + ']').encode())
+        with self.assertRaisesMessage(ImportFormatError, "après l'élément 1"):
+            list(read_json(stream))
+        self.assertLess(stream.tell(), 1024 * 1024)
+
+    def test_streaming_json_reader_handles_split_objects(self):
+        content = '\n'.join(json.dumps({'title': 'x' * 50, 'index': index}) for index in range(3000))
+        rows = list(read_json(io.BytesIO(content.encode())))
+        self.assertEqual(len(rows), 3000)
+        self.assertEqual(rows[-1][1]['index'], 2999)
+
+
+class DocumentUploadTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, TASK_DOCUMENT_MAX_SIZE=1000)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        self.task = Task.objects.create(title='Plans', project=project)
+        self.other_task = Task.objects.create(title='Devis', project=project)
+
+    def start(self, task, content, **extra):
+        response = self.client.post('/api/document-uploads/', {
+            'task': task.pk, 'filename': 'plan.pdf', 'size': len(content), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def send(self, upload_id, offset, chunk):
+        return self.client.patch(
+            f'/api/document-uploads/{upload_id}/', data=chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def upload(self, task, content, chunk_size=100):
+        upload = self.start(task, content)
+        for offset in range(0, len(content), chunk_size):
+            response = self.send(upload['id'], offset, content[offset:offset + chunk_size])
+        return response
+
+    def test_resumable_chunked_upload(self):
+        content = os.urandom(250)
+        upload = self.start(self.task, content)
+        self.assertEqual(self.send(upload['id'], 0, content[:100]).data['offset'], 100)
+
+        # Morceau rejoué ou perdu : 409 avec la position de reprise
+        response = self.send(upload['id'], 0, content[:100])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 100))
+        self.assertEqual(self.client.get(f"/api/document-uploads/{upload['id']}/").data['offset'], 100)
+
+        self.send(upload['id'], 100, content[100:200])
+        response = self.send(upload['id'], 200, content[200:])
+        self.assertEqual(response.status_code, 201)
+        document = TaskDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(document.filename(), 'plan.pdf')
+        self.assertEqual(document.blob.sha256, hashlib.sha256(content).hexdigest())
+        with document.file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+        self.assertFalse(DocumentUpload.objects.exists())
+
+    def test_unconfirmed_bytes_are_dropped_and_missing_bytes_rejected(self):
+        content = os.urandom(250)
+        upload = self.start(self.task, content)
+        self.send(upload['id'], 0, content[:100])
+        path = partial_path(DocumentUpload.objects.get(pk=upload['id']))
+
+        # Requête interrompue après l'écriture, avant l'avancée de la position
+        with open(path, 'ab') as partial:
+            partial.write(b'x' * 40)
+        self.assertEqual(self.send(upload['id'], 100, content[100:200]).data['offset'], 200)
+        self.assertEqual(os.path.getsize(path), 200)
+
+        # Position confirmée mais octets absents du disque : jamais de bourrage
+        with open(path, 'r+b') as partial:
+            partial.truncate(150)
+        response = self.send(upload['id'], 200, content[200:])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 150))
+        self.assertEqual(os.path.getsize(path), 150)
+
+        response = self.send(upload['id'], 150, content[150:])
+        self.assertEqual(response.status_code, 201)
+        with TaskDocument.objects.get(pk=response.data['id']).file.open('rb') as stored:
+            self.assertEqual(stored.read(), content)
+
+    def test_identical_content_is_stored_once(self):
+        content = os.urandom(150)
+        first = TaskDocument.objects.get(pk=self.upload(self.task, content).data['id'])
+        second = TaskDocument.objects.get(pk=self.upload(self.other_task, content).data['id'])
+
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+        path = first.file.path
+
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other_task.delete()
+        self.assertFalse(DocumentBlob.objects.exists())
+        self.assertFalse(os.path.exists(path))
+
+    def test_known_hash_creates_document_without_upload(self):
+        content = os.urandom(120)
+        self.upload(self.task, content)
+        data = self.start(self.other_task, content, sha256=hashlib.sha256(content).hexdigest())
+
+        self.assertTrue(data['complete'])
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 2)
+
+    def test_known_hash_of_foreign_content_requires_upload(self):
+        content = os.urandom(120)
+        document = TaskDocument.objects.get(pk=self.upload(self.task, content).data['id'])
+        digest = hashlib.sha256(content).hexdigest()
+
+        # Autre utilisateur, autre projet : l'empreinte seule ne donne pas accès au contenu
+        self.client.force_authenticate(self.other)
+        foreign_task = Task.objects.create(title='Autre', project=self.create_project('Autre', self.other))
+        data = self.start(foreign_task, content, sha256=digest)
+        self.assertFalse(data['complete'])
+        self.assertEqual(DocumentBlob.objects.get().ref_count, 1)
+        self.assertFalse(TaskDocument.objects.filter(task=foreign_task).exists())
+        self.assertEqual(self.client.get(f'/api/documents/{document.pk}/download/').status_code, 404)
+
+        # Taille différente : pas de raccourci non plus, même pour le propriétaire
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/api/document-uploads/', {
+            'task': self.other_task.pk, 'filename': 'plan.pdf', 'size': 119, 'sha256': digest,
+        }, format='json')
+        self.assertFalse(response.data['complete'])
+
+    def test_size_limit_enforced_before_and_during_upload(self):
+        response = self.client.post('/api/document-uploads/', {
+            'task': self.task.pk, 'filename': 'gros.pdf', 'size': 5000,
+        }, format='json')
+        self.assertEqual(response.status_code, 413)
+
+        upload = self.start(self.task, b'x' * 100)
+        self.assertEqual(self.send(upload['id'], 0, b'x' * 150).status_code, 413)
+        self.assertEqual(DocumentUpload.objects.get().received, 0)
+
+
+class DocumentDownloadTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        self.content = os.urandom(1000)
+        self.document = TaskDocument.objects.create(
+            task=Task.objects.create(title='Plans', project=project),
+            title='Plan',
+            file=SimpleUploadedFile('plan.pdf', self.content),
+            uploaded_by=self.user,
+        )
+        self.url = f'/api/documents/{self.document.pk}/download/'
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_download_requires_visible_task(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_inline_only_for_safe_types(self):
+        response = self.client.get(self.url, {'inline': 1})
+        self.assertIn('inline', response['Content-Disposition'])
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertFalse(response.has_header('Content-Security-Policy'))
+
+        for name in ('page.html', 'dessin.svg', 'notes.txt'):
+            document = TaskDocument.objects.create(
+                task=self.document.task, title=name, uploaded_by=self.user,
+                file=SimpleUploadedFile(name, b'<script>alert(1)</script>'),
+            )
+            response = self.client.get(f'/api/documents/{document.pk}/download/', {'inline': 1})
+            self.assertIn('attachment', response['Content-Disposition'])
+            self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+            self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 100-199/1000')
+        self.assertEqual(self.body(response), self.content[100:200])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-50')
+        self.assertEqual(self.body(response), self.content[-50:])
+        response = self.client.get(self.url, HTTP_RANGE='bytes=900-')
+        self.assertEqual(self.body(response), self.content[900:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1000-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1000'))
+
+        # Version changée depuis le début du téléchargement : fichier entier
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"ancienne"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_conditional_requests(self):
+        response = self.client.get(self.url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+
+    def test_offload_to_front_server(self):
+        with override_settings(DOCUMENT_SERVE_BACKEND='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(response.content, b'')
+
+        with override_settings(DOCUMENT_SERVE_BACKEND='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Sendfile'], self.document.file.path)
+
+
+class DocumentPreviewTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name, DOCUMENT_PREVIEW_RETRY_DELAY=30)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.task = Task.objects.create(
+            title='Plans', project=self.create_project('Chantier', self.user, members=[self.user])
+        )
+
+    def add_document(self, name, content=b'contenu'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return TaskDocument.objects.create(
+                task=self.task, title=name, file=SimpleUploadedFile(name, content), uploaded_by=self.user
+            )
+
+    def test_upload_only_queues_the_preview(self):
+        document = self.add_document('plan.pdf')
+        self.assertEqual(document.preview.status, 'pending')
+        self.assertEqual(self.add_document('notes.txt').preview.status, 'unsupported')
+
+        url = f'/api/documents/{document.pk}/preview/'
+        self.assertEqual(self.client.get(url).status_code, 202)
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_cached_preview_is_reused_and_served(self):
+        document = self.add_document('plan.pdf')
+        # Aperçu déjà rendu pour un document de même contenu
+        path = cache_path(cache_key(document))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as preview:
+            preview.write(b'jpeg')
+
+        self.assertEqual(run_batch(), 1)
+        self.assertEqual(DocumentPreview.objects.get().status, 'done')
+        response = self.client.get(f'/api/documents/{document.pk}/preview/')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'image/jpeg'))
+        self.assertEqual(b''.join(response.streaming_content), b'jpeg')
+
+        # Supprimé du cache : regénéré à la demande suivante
+        os.remove(path)
+        self.assertEqual(self.client.get(f'/api/documents/{document.pk}/preview/').status_code, 202)
+        self.assertEqual(DocumentPreview.objects.get().status, 'pending')
+
+    def test_failures_are_retried_with_backoff(self):
+        self.add_document('plan.pdf')
+        preview = DocumentPreview.objects.get()
+        now = timezone.now()
+        for attempts, expected in ((1, 'pending'), (4, 'pending'), (5, 'failed')):
+            preview.attempts = attempts
+            self.assertEqual(mark_failed(preview, 'erreur', now=now), expected)
+        preview.refresh_from_db()
+        self.assertEqual(preview.error, 'erreur')
+
+        preview.attempts = 2
+        mark_failed(preview, 'erreur', now=now)
+        preview.refresh_from_db()
+        self.assertEqual(preview.available_at, now + timedelta(seconds=60))
+        # Pas encore disponible : le worker ne la prend pas
+        self.assertEqual(run_batch(), 0)
+
+    def test_unreadable_document_is_not_retried_forever(self):
+        self.add_document('photo.png', b'pas une image')
+        run_batch()
+        preview = DocumentPreview.objects.get()
+        self.assertIn(preview.status, ('pending', 'unsupported'))
+        self.assertEqual(preview.attempts, 1)
+
+    def test_cache_evicts_least_recently_served(self):
+        paths = []
+        for index in range(3):
+            path = cache_path(f'{index:02d}-aperçu')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as preview:
+                preview.write(b'x' * 100)
+            os.utime(path, (1000 + index, 1000 + index))
+            paths.append(path)
+
+        self.assertEqual(evict_cache(max_size=250), 1)
+        self.assertEqual([os.path.exists(path) for path in paths], [False, True, True])
+
+
+@override_settings(OVERDUE_SCAN_CHUNK_SIZE=2)
+class OverdueScanTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.today = timezone.now().date()
+        self.project = self.create_project('Chantier', self.user, members=[self.user, self.other])
+
+    def create_task(self, days, status='todo'):
+        return Task.objects.create(
+            title=f'Échéance {days}', project=self.project, status=status,
+            end_date=self.today + timedelta(days=days),
+        )
+
+    def test_only_tasks_crossing_their_end_date_since_last_run(self):
+        self.create_task(-10)
+        yesterday = [self.create_task(-1) for _ in range(3)]
+        self.create_task(-1, status='done')
+        self.create_task(0)
+
+        # Première analyse : la veille seulement
+        self.assertEqual(run_scan(owner='a', today=self.today), 3)
+        self.assertEqual(
+            set(TaskOverdueEvent.objects.values_list('task_id', flat=True)), {task.pk for task in yesterday}
+        )
+        self.assertEqual(OverdueScan.objects.get().watermark, self.today)
+        # Les deux membres de l'équipe notifiés pour chaque tâche
+        self.assertEqual(Notification.objects.filter(kind='task_overdue').count(), 6)
+
+        self.assertEqual(run_scan(owner='a', today=self.today), 0)
+        self.assertEqual(run_scan(owner='a', today=self.today + timedelta(days=1)), 1)
+        self.assertEqual(Notification.objects.filter(kind='task_overdue').count(), 8)
+
+    def test_lease_prevents_concurrent_scans(self):
+        self.create_task(-1)
+        self.assertIsNotNone(acquire_lease('hote-1'))
+        self.assertIsNone(run_scan(owner='hote-2', today=self.today))
+
+        # Bail expiré (processus arrêté) : repris par un autre hôte
+        OverdueScan.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(run_scan(owner='hote-2', today=self.today), 1)
+
+    def test_interrupted_scan_resumes_without_duplicates(self):
+        tasks = [self.create_task(-1) for _ in range(3)]
+        # Analyse interrompue après le premier lot
+        OverdueScan.objects.create(
+            name='tasks', watermark=self.today - timedelta(days=1), target=self.today,
+            cursor_end_date=tasks[1].end_date, cursor_task_id=tasks[1].pk,
+        )
+        TaskOverdueEvent.objects.bulk_create([TaskOverdueEvent(task=task, end_date=task.end_date) for task in tasks[:2]])
+
+        self.assertEqual(run_scan(owner='a', today=self.today), 1)
+        self.assertEqual(TaskOverdueEvent.objects.count(), 3)
+
+
+@override_settings(API_CACHE_ENABLED=False)
+class TaskCompactListTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        project = self.create_project('Chantier « été »', self.user, members=[self.user])
+        today = timezone.now().date()
+        for index in range(12):
+            Task.objects.create(
+                title=f'Tâche {index} ',
+                description='Détails' if index % 2 else '',
+                project=project,
+                status=['todo', 'in_progress', 'done'][index % 3],
+                assigned_to=self.other if index % 4 == 0 else None,
+                start_date=today - timedelta(days=10) if index % 3 else None,
+                end_date=None if index % 5 == 0 else today + timedelta(days=index % 3 - 1),
+            )
+
+    def get_both(self, url):
+        """Réponses (contenu, données) du chemin DRF puis du chemin compact."""
+        responses = []
+        for routes in ((), ('tasks',)):
+            with override_settings(API_COMPACT_LIST_ROUTES=routes):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                responses.append(response)
+        return responses
+
+    def test_compact_list_is_byte_identical(self):
+        for url in (
+            '/api/tasks/',
+            '/api/tasks/?fields=id,title,is_overdue,delay_days',
+            '/api/tasks/?ordering=-delay&page_size=5',
+        ):
+            with self.subTest(url=url):
+                default, compact = self.get_both(url)
+                self.assertEqual(compact.content, default.content)
+
+    def test_compact_cursor_pages_match(self):
+        url = '/api/tasks/?page_size=5'
+        with override_settings(API_COMPACT_LIST_ROUTES=('tasks',)):
+            while url:
+                default, compact = self.get_both(url)
+                self.assertEqual(compact.content, default.content)
+                url = compact.data['next']
+
+    def test_compact_list_reads_rows_in_one_query(self):
+        with override_settings(API_COMPACT_LIST_ROUTES=('tasks',)), self.assertNumQueries(1):
+            response = self.client.get('/api/tasks/')
+        self.assertEqual(len(response.data['results']), 12)
+
+
+@override_settings(API_CACHE_ENABLED=False, METRICS_TOKEN='jeton')
+class RequestMetricsTests(TaskTestMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        project = self.create_project('Chantier', self.user, members=[self.user])
+        for index in range(3):
+            Task.objects.create(title=f'Tâche {index}', project=project)
+
+    def test_list_is_measured_and_exposed(self):
+        self.client.get('/api/tasks/')
+        histogram = registry.histogram('lon_request_queries', 'task-list', 'GET')
+        self.assertEqual((histogram.count, histogram.sum), (1, 1))
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        self.client.force_authenticate(None)
+        response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer jeton')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('lon_request_queries_bucket{view="task-list",method="GET",le="1"} 1', body)
+        self.assertIn('lon_request_render_seconds_count{view="task-list",method="GET"} 1', body)
+        self.assertIn('lon_requests_total{view="task-list",method="GET",status="200"} 1', body)
+
+    def test_query_budget_fails_the_request(self):
+        with mock.patch.object(TaskViewSet, 'query_budgets', {'list': 0}):
+            with self.assertRaises(QueryBudgetExceeded), self.assertLogs('lon.metrics', 'WARNING'):
+                self.client.get('/api/tasks/')
+            with override_settings(QUERY_BUDGET_STRICT=False), self.assertLogs('lon.metrics', 'WARNING') as logs:
+                self.assertEqual(self.client.get('/api/tasks/').status_code, 200)
+        self.assertIn('Budget de requêtes dépassé', logs.output[0])
+        self.assertIn('1 × SELECT', logs.output[0])
+        self.assertIn('lon_query_budget_exceeded_total{view="task-list",method="GET"} 2', registry.render())
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_request_logs_sql_fingerprints(self):
+        with self.assertLogs('lon.metrics', 'WARNING') as logs:
+            self.client.get(f'/api/tasks/{Task.objects.first().pk}/')
+        self.assertIn('Requête lente', logs.output[0])
+        self.assertIn('"tasks_task"."id" = %s', logs.output[0])
+
+    def test_fingerprint_collapses_values(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s,  %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkSuiteTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.output = os.path.join(media.name, 'resultat.json')
+
+    def seed(self):
+        call_command(
+            'seed_benchmark_data', seed=7, users=4, clients=2, projects=3, members=2,
+            tasks=60, documents=10, notifications=3, stdout=io.StringIO(),
+        )
+
+    def test_seed_is_reproducible(self):
+        self.seed()
+        first = list(Task.objects.order_by('pk').values_list('title', 'status', 'priority', 'end_date'))
+        self.assertEqual(len(first), 60)
+        self.assertEqual(TaskDocument.objects.count(), 10)
+        self.assertEqual(Notification.objects.count(), 12)
+        self.assertEqual(Client.objects.filter(name__startswith='bench7').count(), 2)
+        self.assertTrue(User.objects.get(username='bench7_user0').check_password('benchmark'))
+
+        with self.assertRaises(CommandError):
+            self.seed()
+        # Autre base : les utilisateurs de la graine sont renommés, les tâches supprimées
+        users = list(User.objects.filter(username__startswith='bench7'))
+        for user in users:
+            user.username = f'ancien{user.pk}'
+        User.objects.bulk_update(users, ['username'])
+        Task.objects.all().delete()
+        self.seed()
+        self.assertEqual(
+            list(Task.objects.order_by('pk').values_list('title', 'status', 'priority', 'end_date')), first
+        )
+
+    def test_runner_reports_every_scenario(self):
+        self.seed()
+        statuses = dict(Task.objects.values_list('pk', 'status'))
+        call_command(
+            'benchmark_api', seed=7, users=2, requests=6, warmup=1, output=self.output, stdout=io.StringIO(),
+        )
+        with open(self.output) as file:
+            result = json.load(file)
+
+        self.assertEqual(
+            set(result['scenarios']), {'token', 'task_list', 'project_list', 'change_status', 'bulk_status', 'kanban'}
+        )
+        for name, summary in result['scenarios'].items():
+            self.assertEqual((name, summary['requests'], summary['errors']), (name, 6, 0))
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+        self.assertEqual(result['dataset']['tasks'], 60)
+        self.assertIsNotNone(result['scenarios']['task_list']['queries_per_request'])
+        # Statuts rétablis après le scénario change_status
+        self.assertEqual(dict(Task.objects.values_list('pk', 'status')), statuses)
+
+    def test_runner_fails_on_error_responses(self):
+        self.seed()
+        with self.assertRaisesMessage(CommandError, 'token'):
+            call_command(
+                'benchmark_api', seed=7, users=2, requests=2, warmup=0, scenarios=['token'],
+                password='mauvais', output=self.output, stdout=io.StringIO(),
+            )
+        self.assertFalse(os.path.exists(self.output))
+
+    def test_runner_accepts_zero_requests(self):
+        self.seed()
+        stdout = io.StringIO()
+        call_command(
+            'benchmark_api', seed=7, users=2, requests=0, warmup=0, scenarios=['task_list'],
+            output=self.output, stdout=stdout,
+        )
+        self.assertIn('aucune requête mesurée', stdout.getvalue())
+
+    def test_concurrent_status_changes_use_distinct_tasks(self):
+        self.seed()
+        command = BenchmarkApiCommand(stdout=io.StringIO())
+        command.users = list(User.objects.filter(username__startswith='bench7_user').order_by('pk')[:2])
+        command.tokens = ['jeton'] * len(command.users)
+        command.factory = RequestFactory()
+        command.options = {'requests': 8, 'warmup': 0, 'concurrency': 3}
+        run = command.scenario_change_status()
+        seen = {}
+
+        def record(request):
+            seen.setdefault(threading.current_thread().name, set()).add(request.path)
+            return 200
+
+        with mock.patch.object(command, 'call', side_effect=record):
+            threads = [threading.Thread(target=lambda: [run(index) for index in range(4)]) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        paths = list(seen.values())
+        self.assertEqual(len(paths), 3)
+        self.assertFalse(paths[0] & paths[1] or paths[0] & paths[2] or paths[1] & paths[2])
@@ -0,0 +1,74 @@
+"""
+Rendu des aperçus de documents, exécuté dans les processus du worker
+(voir tasks/previews.py). Ce module n'importe pas Django : les processus du
+pool n'ont pas à charger le projet.
+
+- Images : Pillow (dépendance facultative).
+- PDF : première page rendue par `pdftoppm` (poppler-utils), s'il est installé.
+
+Sans l'outil nécessaire, ou pour un autre type de fichier, le document est
+signalé comme non pris en charge (Unsupported) et n'est pas retenté.
+"""
+import os
+import shutil
+import subprocess
+
+IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'bmp', 'webp', 'tif', 'tiff'}
+PDF_EXTENSIONS = {'pdf'}
+
+
+class Unsupported(Exception):
+    """Type de document sans aperçu possible (pas de nouvelle tentative)."""
+
+
+def supported_extension(extension):
+    return extension.lower() in IMAGE_EXTENSIONS | PDF_EXTENSIONS
+
+
+def render_image(source, target, size):
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        raise Unsupported("Pillow n'est pas installé.")
+    with Image.open(source) as image:
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(target, 'JPEG', quality=80, optimize=True)
+
+
+def render_pdf(source, target, size, timeout=60):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        raise Unsupported("pdftoppm (poppler-utils) n'est pas installé.")
+    prefix, _ = os.path.splitext(target)
+    subprocess.run(
+        [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-jpeg', '-scale-to', str(size), source, prefix],
+        check=True, capture_output=True, timeout=timeout,
+    )
+    if prefix + '.jpg' != target:
+        os.replace(prefix + '.jpg', target)
+
+
+def render(source, extension, target, size):
+    """
+    Écrit dans `target` un aperçu JPEG d'au plus `size` pixels de côté. Le fichier
+    est d'abord écrit à côté puis renommé : un aperçu du cache est toujours complet.
+    """
+    extension = extension.lower()
+    if extension in IMAGE_EXTENSIONS:
+        renderer = render_image
+    elif extension in PDF_EXTENSIONS:
+        renderer = render_pdf
+    else:
+        raise Unsupported(f"Pas d'aperçu pour les fichiers .{extension}.")
+    partial = f'{target}.{os.getpid()}.tmp.jpg'
+    try:
+        renderer(source, partial, size)
+        os.replace(partial, target)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return os.path.getsize(target)
@@ -0,0 +1,334 @@
+"""
+Envoi par morceaux, reprenable et dédupliqué, des documents de tâches
+(/api/document-uploads/).
+
+1. POST : création de l'envoi (tâche, titre, nom du fichier, taille, empreinte
+   SHA-256 facultative). La taille annoncée est vérifiée tout de suite ; si
+   l'empreinte et la taille désignent un contenu que l'utilisateur peut déjà
+   lire (document d'une tâche qui lui est visible), le document est créé
+   immédiatement sans rien envoyer. Connaître l'empreinte d'un contenu ne
+   prouve pas qu'on le possède : tout autre contenu doit être envoyé, et n'est
+   dédupliqué qu'après avoir été reçu et haché par le serveur.
+2. PATCH avec l'en-tête `Upload-Offset` et le morceau brut dans le corps : le
+   morceau est écrit sur disque au fil de la lecture (jamais entièrement en
+   mémoire) et refusé dès qu'il dépasse la taille annoncée. Un décalage qui ne
+   correspond pas à la position courante donne un 409 : le client relit la
+   position (GET) et reprend à partir de là. Le morceau est écrit et synchronisé
+   (fsync) avant que la position ne soit avancée par un UPDATE conditionnel ;
+   des octets laissés au-delà de la position par une requête interrompue sont
+   retirés au morceau suivant.
+3. Au dernier morceau, l'empreinte (calculée au fil des morceaux) désigne le
+   contenu : un DocumentBlob existant est réutilisé (référence supplémentaire),
+   sinon le fichier partiel devient le blob, sans copie.
+
+L'empreinte en cours est gardée en mémoire par le processus qui reçoit les
+morceaux ; si un morceau arrive sur un autre processus (ou hors ordre), elle
+est recalculée à partir du fichier à la fin de l'envoi.
+"""
+import hashlib
+import os
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import IntegrityError, transaction
+from django.db.models import Exists, F, OuterRef
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import DocumentBlob, DocumentUpload, Task, TaskDocument, max_document_size
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou, les morceaux concurrents restent rares
+    fcntl = None
+
+READ_SIZE = 64 * 1024
+# Empreintes en cours gardées en mémoire (les plus anciennes sont oubliées)
+MAX_CACHED_HASHERS = 256
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class OffsetMismatch(UploadError):
+    """Le morceau ne commence pas à la position courante de l'envoi."""
+    status_code = 409
+
+    def __init__(self, offset):
+        super().__init__(f"Position attendue : {offset}.")
+        self.offset = offset
+
+
+class UploadTooLarge(UploadError):
+    status_code = 413
+
+
+def max_chunk_size():
+    return getattr(settings, 'DOCUMENT_UPLOAD_MAX_CHUNK_SIZE', 5 * 1024 * 1024)
+
+
+def upload_expiry():
+    return timedelta(hours=getattr(settings, 'DOCUMENT_UPLOAD_EXPIRY_HOURS', 24))
+
+
+def temp_dir():
+    path = getattr(settings, 'DOCUMENT_UPLOAD_TEMP_DIR', None) or os.path.join(settings.MEDIA_ROOT, 'uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def partial_path(upload):
+    return os.path.join(temp_dir(), f'{upload.pk}.part')
+
+
+_hashers = OrderedDict()
+
+
+def _cached_hasher(upload_id, offset):
+    """Empreinte en cours si elle couvre exactement les `offset` premiers octets."""
+    entry = _hashers.pop(upload_id, None)
+    if entry is None:
+        return hashlib.sha256() if offset == 0 else None
+    position, hasher = entry
+    return hasher if position == offset else None
+
+
+def _store_hasher(upload_id, offset, hasher):
+    _hashers[upload_id] = (offset, hasher)
+    while len(_hashers) > MAX_CACHED_HASHERS:
+        _hashers.popitem(last=False)
+
+
+def lock_file(file):
+    """Verrou exclusif non bloquant sur le fichier ; False s'il est déjà pris."""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def file_sha256(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as stream:
+        for block in iter(lambda: stream.read(READ_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+class PartialFile(File):
+    """Fichier déjà sur disque : FileSystemStorage le déplace au lieu de le copier."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def acquire_blob(sha256, size, path=None):
+    """
+    Ajoute une référence au contenu d'empreinte `sha256`. S'il n'existe pas encore,
+    il est créé à partir du fichier `path` (déplacé dans le stockage) ; sans `path`,
+    retourne None.
+    """
+    with transaction.atomic():
+        updated = DocumentBlob.objects.filter(sha256=sha256).update(ref_count=F('ref_count') + 1)
+        if updated:
+            return DocumentBlob.objects.get(sha256=sha256)
+    if path is None:
+        return None
+
+    blob = DocumentBlob(sha256=sha256, size=size, ref_count=1)
+    with open(path, 'rb') as stream:
+        blob.file.save(sha256, PartialFile(stream), save=False)
+    try:
+        with transaction.atomic():
+            blob.save()
+    except IntegrityError:
+        # Même contenu terminé en parallèle par un autre envoi : on s'y rattache
+        blob.file.storage.delete(blob.file.name)
+        return acquire_blob(sha256, size)
+    return blob
+
+
+def release_blob(blob_id):
+    """Retire une référence au contenu ; le dernier document supprime le fichier."""
+    with transaction.atomic():
+        released = DocumentBlob.objects.filter(pk=blob_id, ref_count__gt=1).update(
+            ref_count=F('ref_count') - 1
+        )
+        if released:
+            return
+        blob = DocumentBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        name, storage = blob.file.name, blob.file.storage
+        blob.delete()
+        transaction.on_commit(lambda: storage.delete(name))
+
+
+def readable_blob(user, sha256, size):
+    """
+    Contenu d'empreinte `sha256` et de taille `size` déjà référencé par un
+    document d'une tâche visible par l'utilisateur, ou None.
+    """
+    visible = TaskDocument.objects.filter(blob=OuterRef('pk'), task__in=Task.objects.visible_to(user))
+    return DocumentBlob.objects.filter(sha256=sha256, size=size).filter(Exists(visible)).first()
+
+
+def attach_document(task, user, title, filename, blob):
+    return TaskDocument.objects.create(
+        task=task,
+        title=title,
+        original_name=filename,
+        uploaded_by=user,
+        blob=blob,
+        file=blob.file.name,
+    )
+
+
+def start_upload(task, user, title, filename, size, sha256=''):
+    """
+    Crée l'envoi ; retourne (envoi, document). Le document n'est créé tout de suite
+    que si le contenu d'empreinte `sha256` est déjà lisible par l'utilisateur
+    (l'envoi est alors None).
+    """
+    limit = max_document_size()
+    if size > limit:
+        raise UploadTooLarge(f"La taille maximale du fichier est de {limit // (1024 * 1024)}MB")
+    if sha256 and readable_blob(user, sha256, size) is not None:
+        blob = acquire_blob(sha256, size)
+        if blob is not None:
+            return None, attach_document(task, user, title, filename, blob)
+    upload = DocumentUpload.objects.create(
+        task=task, uploaded_by=user, title=title, filename=filename, size=size, sha256=sha256
+    )
+    open(partial_path(upload), 'wb').close()
+    return upload, None
+
+
+def receive_chunk(upload, offset, stream, length=None):
+    """
+    Ajoute un morceau lu depuis `stream` à la position `offset`. Retourne le
+    document si l'envoi est terminé, sinon None.
+    """
+    if offset != upload.received:
+        raise OffsetMismatch(upload.received)
+    remaining = upload.size - offset
+    if length is not None and (length > remaining or length > max_chunk_size()):
+        raise UploadTooLarge("Morceau plus grand que la taille restante ou que la taille maximale d'un morceau.")
+
+    with open(partial_path(upload), 'r+b') as partial:
+        if not lock_file(partial):
+            # Un autre morceau est en cours d'écriture pour cet envoi
+            raise OffsetMismatch(upload.received)
+        size = os.fstat(partial.fileno()).st_size
+        if size < offset:
+            # Octets confirmés absents du disque : reprise à partir du fichier
+            DocumentUpload.objects.filter(pk=upload.pk).update(received=size)
+            raise OffsetMismatch(size)
+        # Octets non confirmés d'une requête interrompue (size > offset) : retirés,
+        # jamais de bourrage puisque offset <= size
+        partial.truncate(offset)
+        partial.seek(offset)
+        hasher = _cached_hasher(upload.pk, offset)
+        written = 0
+        try:
+            for block in iter(lambda: stream.read(READ_SIZE), b''):
+                written += len(block)
+                if written > remaining or written > max_chunk_size():
+                    # Limite appliquée en cours de lecture, avant la fin du corps
+                    raise UploadTooLarge("Le morceau dépasse la taille annoncée du fichier.")
+                partial.write(block)
+                if hasher is not None:
+                    hasher.update(block)
+            partial.flush()
+            os.fsync(partial.fileno())
+        except BaseException:
+            partial.truncate(offset)
+            raise
+
+        # Position avancée seulement une fois le morceau sur disque
+        advanced = DocumentUpload.objects.filter(pk=upload.pk, received=offset).update(
+            received=offset + written, updated_at=timezone.now()
+        )
+        if not advanced:
+            upload.refresh_from_db(fields=['received'])
+            raise OffsetMismatch(upload.received)
+
+    upload.received = offset + written
+    if hasher is not None:
+        _store_hasher(upload.pk, upload.received, hasher)
+    if upload.complete:
+        return complete_upload(upload)
+    return None
+
+
+def complete_upload(upload):
+    """Identifie le contenu reçu, le rattache à un blob et crée le document."""
+    path = partial_path(upload)
+    actual = os.path.getsize(path)
+    if actual != upload.size:
+        # Écriture interrompue : reprise à partir de ce qui est réellement sur disque
+        DocumentUpload.objects.filter(pk=upload.pk).update(received=actual)
+        raise OffsetMismatch(actual)
+    hasher = _cached_hasher(upload.pk, upload.size)
+    digest = hasher.hexdigest() if hasher is not None else file_sha256(path)
+    if upload.sha256 and upload.sha256 != digest:
+        abort_upload(upload)
+        raise UploadError("L'empreinte du fichier reçu ne correspond pas à l'empreinte annoncée.")
+
+    with transaction.atomic():
+        blob = acquire_blob(digest, upload.size, path)
+        document = attach_document(upload.task, upload.uploaded_by, upload.title, upload.filename, blob)
+        upload.delete()
+    if os.path.exists(path):
+        # Contenu déjà stocké : le fichier partiel n'a pas été déplacé
+        os.remove(path)
+    return document
+
+
+def abort_upload(upload):
+    _hashers.pop(upload.pk, None)
+    path = partial_path(upload)
+    upload.delete()
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def purge_expired_uploads(now=None):
+    """Supprime les envois sans nouveau morceau depuis DOCUMENT_UPLOAD_EXPIRY_HOURS."""
+    limit = (now or timezone.now()) - upload_expiry()
+    expired = list(DocumentUpload.objects.filter(updated_at__lt=limit))
+    for upload in expired:
+        abort_upload(upload)
+    return len(expired)
+
+
+def upload_data(upload):
+    return {
+        'id': str(upload.pk),
+        'task': upload.task_id,
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': max_chunk_size(),
+        'complete': False,
+    }
+
+
+def document_data(document):
+    return {
+        'id': document.pk,
+        'task': document.task_id,
+        'title': document.title,
+        'filename': document.filename(),
+        'size': document.blob.size if document.blob_id else document.file.size,
+        'sha256': document.blob.sha256 if document.blob_id else None,
+        'url': reverse('document-download', args=[document.pk]),
+        'preview_url': reverse('document-preview', args=[document.pk]),
+        'complete': True,
+    }
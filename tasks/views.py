@@ -1,48 +1,116 @@
+import io
 import logging
-from django.db import models
-from rest_framework import viewsets
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework import serializers, status, viewsets
+from rest_framework.exceptions import ValidationError as APIValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
-from .models import Task
+from lon.cache import cache_response
+from lon.export import EXPORT_RENDERERS, Computed, export_response
+from lon.mixins import CompactListMixin, SparseFieldsetMixin
+from lon.pagination import KeysetPagination
+from projects.models import Project
+from .bulk import BulkTaskOperation
+from .changes import DEFAULT_LIMIT, MAX_LIMIT, ExpiredToken, InvalidToken, TaskChangeFeed
+from .imports import ImportFormatError, TaskImporter, guess_format
+from .models import DocumentUpload, Task, planned_duration
 from .serializers import TaskSerializer
+from .status import StatusConflict, status_machine
+from .uploads import (
+    OffsetMismatch, UploadError, abort_upload, document_data, receive_chunk, start_upload, upload_data,
+)
 
 logger = logging.getLogger(__name__)
 
-class TaskViewSet(viewsets.ModelViewSet):
+# Tris disponibles par ?ordering= en plus de l'ordre par défaut (Meta.ordering),
+# sur les annotations de Task.objects.with_timing()
+TIMING_ORDERINGS = {
+    '-delay': ['-timing_delay', 'end_date', '-pk'],
+    'delay': ['timing_delay', '-end_date', 'pk'],
+}
+
+# Colonnes de /api/tasks/export/ : (nom, champ ou colonne calculée)
+EXPORT_COLUMNS = [
+    ('id', 'id'),
+    ('title', 'title'),
+    ('status', 'status'),
+    ('priority', 'priority'),
+    ('project_id', 'project_id'),
+    ('project', 'project__name'),
+    ('assigned_to', 'assigned_to__username'),
+    ('created_by', 'created_by__username'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('duration_days', Computed(planned_duration, 'start_date', 'end_date')),
+    ('is_overdue', 'timing_overdue'),
+    ('delay_days', Computed(lambda delay: delay.days, 'timing_delay')),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+# Propriétés de TaskSerializer lues dans les annotations de with_timing() (liste compacte)
+COMPACT_COMPUTED = {
+    'is_overdue': 'timing_overdue',
+    'delay_days': Computed(lambda delay: delay.days, 'timing_delay'),
+}
+
+BOOLEAN_PARAMS = {'true': True, '1': True, 'false': False, '0': False}
+
+
+class TaskViewSet(SparseFieldsetMixin, CompactListMixin, viewsets.ModelViewSet):
     serializer_class = TaskSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
+    compact_route = 'tasks'
+    compact_computed = COMPACT_COMPUTED
+    # Requêtes SQL par appel, authentification JWT comprise (voir lon/metrics.py)
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+    @property
+    def ordering(self):
+        """Ordre utilisé par KeysetPagination (None : ordre par défaut du modèle)."""
+        request = getattr(self, 'request', None)
+        if request is None:
+            return None
+        return TIMING_ORDERINGS.get(request.query_params.get('ordering'))
 
     def get_queryset(self):
-        try:
-            user = self.request.user
-            logger.info(f"User requesting tasks: {user.username}")
-            
-            # Log des projets de l'utilisateur
-            user_projects = user.projects.all()
-            managed_projects = user.managed_projects.all()
-            logger.info(f"User projects: {[p.name for p in user_projects]}")
-            logger.info(f"User managed projects: {[p.name for p in managed_projects]}")
-            
-            queryset = Task.objects.filter(
-                models.Q(assigned_to=user) |
-                models.Q(project__team_members=user) |
-                models.Q(project__manager=user)
-            ).distinct()
-            
-            # Log des tâches trouvées
-            tasks_found = list(queryset.values_list('title', flat=True))
-            logger.info(f"Found {queryset.count()} tasks: {tasks_found}")
-            
-            return queryset
-            
-        except Exception as e:
-            logger.error(f"Error in get_queryset: {str(e)}")
-            raise
+        user = self.request.user
+        # Journalisation sans évaluer le queryset : aucune requête supplémentaire
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("User %s requesting tasks (action=%s)", user.username, self.action)
+
+        queryset = Task.objects.visible_to(user).select_related(
+            'project', 'assigned_to', 'created_by'
+        ).with_timing()
+
+        overdue = BOOLEAN_PARAMS.get(self.request.query_params.get('overdue', '').lower())
+        if overdue is True:
+            queryset = queryset.overdue()
+        elif overdue is False:
+            queryset = queryset.filter(timing_overdue=False)
+        return queryset
+
+    @cache_response('tasks.list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def perform_update(self, serializer):
+        if 'status' in serializer.validated_data:
+            try:
+                status_machine.validate(serializer.instance, serializer.validated_data['status'])
+            except ValidationError as exc:
+                raise APIValidationError(exc.message_dict)
+        # Auteur de la modification, non notifié (voir tasks/signals.py)
+        serializer.instance._changed_by_id = self.request.user.pk
+        serializer.save()
+
     @action(detail=True, methods=['post'])
     def change_status(self, request, pk=None):
         task = self.get_object()
@@ -50,7 +118,156 @@ class TaskViewSet(viewsets.ModelViewSet):
         
         if new_status not in dict(Task.STATUS_CHOICES):
             return Response({'error': 'Invalid status'}, status=400)
-            
-        task.status = new_status
-        task.save()
-        return Response(TaskSerializer(task).data)
\ No newline at end of file
+
+        # UPDATE conditionnel sur le statut chargé : une modification concurrente
+        # donne un 409 au lieu d'être écrasée
+        try:
+            status_machine.transition(task, new_status, actor=request.user)
+        except ValidationError as exc:
+            return Response(exc.message_dict, status=status.HTTP_400_BAD_REQUEST)
+        except StatusConflict as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+        return Response(TaskSerializer(task).data)
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Tâches créées, modifiées et supprimées depuis `?since=<jeton>`. Sans jeton,
+        retourne seulement un jeton initial (à demander avant le chargement complet).
+        Le jeton renvoyé sert à la requête suivante ; `has_more` indique qu'il faut
+        relancer immédiatement. Un jeton expiré donne un 410 : recharger la liste.
+        """
+        feed = TaskChangeFeed(request.user, self.get_queryset())
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'changed': [], 'deleted': [], 'token': feed.initial_token(), 'has_more': False})
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', DEFAULT_LIMIT)), MAX_LIMIT))
+        except ValueError:
+            limit = DEFAULT_LIMIT
+        try:
+            result = feed.read(since, limit)
+        except InvalidToken as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except ExpiredToken as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_410_GONE)
+        result['changed'] = self.get_serializer(result['changed'], many=True).data
+        return Response(result)
+
+    @action(detail=False, methods=['get'], renderer_classes=EXPORT_RENDERERS)
+    def export(self, request):
+        """
+        Export en flux des tâches visibles (mêmes filtres que la liste) :
+        ?format=csv (par défaut) ou ?format=ndjson.
+        """
+        queryset = self.get_queryset().order_by('pk')
+        return export_response(request, queryset, EXPORT_COLUMNS, 'taches')
+
+    @action(detail=False, methods=['post'], url_path='import', parser_classes=[MultiPartParser])
+    def import_tasks(self, request):
+        """
+        Import d'un fichier CSV ou JSON (champ `file`, format déduit de l'extension
+        ou donné par le champ `format`) dans les projets de l'utilisateur. Champs
+        facultatifs : `project` (projet des lignes sans colonne project) et
+        `atomic` (tout ou rien). Voir tasks/imports.py.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ["Aucun fichier reçu."]}, status=status.HTTP_400_BAD_REQUEST)
+        project = None
+        if request.data.get('project'):
+            project = Project.objects.filter(pk=request.data['project']).filter(
+                Q(manager=request.user) | Q(team_members=request.user)
+            ).first()
+            if project is None:
+                return Response({'project': ["Projet introuvable."]}, status=status.HTTP_400_BAD_REQUEST)
+        importer = TaskImporter(
+            user=request.user,
+            project=project,
+            restrict_projects=True,
+            atomic=BOOLEAN_PARAMS.get(str(request.data.get('atomic', '')).lower(), False),
+        )
+        try:
+            result = importer.run(upload, request.data.get('format') or guess_format(upload.name))
+        except ImportFormatError as exc:
+            return Response({'file': [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        if importer.atomic and result.error_count:
+            return Response(result.as_dict(), status=status.HTTP_400_BAD_REQUEST)
+        return Response(result.as_dict(), status=status.HTTP_201_CREATED if result.created else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Créations, modifications et changements de statut en masse, en une transaction.
+        Corps : {"create": [...], "update": [{"id": ..., ...}], "status": [{"id": ..., "status": ...}]}
+        """
+        operation = BulkTaskOperation(request.user, self.get_serializer_class(), self.get_serializer_context())
+        return Response({'results': operation.run(request.data)})
+
+
+class DocumentUploadStartSerializer(serializers.Serializer):
+    task = serializers.IntegerField()
+    filename = serializers.CharField(max_length=255)
+    title = serializers.CharField(max_length=255, required=False, allow_blank=True)
+    size = serializers.IntegerField(min_value=1)
+    sha256 = serializers.RegexField(r'^[0-9a-f]{64}$', required=False, allow_blank=True)
+
+
+class DocumentUploadViewSet(viewsets.GenericViewSet):
+    """
+    Envoi par morceaux des documents de tâches (voir tasks/uploads.py) :
+    POST pour créer l'envoi, PATCH avec l'en-tête Upload-Offset pour chaque
+    morceau, GET pour connaître la position de reprise, DELETE pour abandonner.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return DocumentUpload.objects.filter(uploaded_by=self.request.user).select_related('task')
+
+    def error_response(self, exc):
+        data = {'error': str(exc)}
+        if isinstance(exc, OffsetMismatch):
+            data['offset'] = exc.offset
+        return Response(data, status=exc.status_code)
+
+    def create(self, request):
+        serializer = DocumentUploadStartSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        task = Task.objects.visible_to(request.user).filter(pk=data['task']).first()
+        if task is None:
+            return Response({'task': ["Tâche introuvable."]}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload, document = start_upload(
+                task, request.user, data.get('title') or data['filename'], data['filename'],
+                data['size'], data.get('sha256', '')
+            )
+        except UploadError as exc:
+            return self.error_response(exc)
+        if document is not None:
+            # Contenu déjà stocké : rien à envoyer
+            return Response(document_data(document), status=status.HTTP_201_CREATED)
+        return Response(upload_data(upload), status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(upload_data(self.get_object()))
+
+    def partial_update(self, request, pk=None):
+        upload = self.get_object()
+        try:
+            offset = int(request.headers.get('Upload-Offset', ''))
+        except ValueError:
+            return Response({'error': "En-tête Upload-Offset manquant ou invalide."}, status=status.HTTP_400_BAD_REQUEST)
+        length = request.headers.get('Content-Length')
+        try:
+            # Corps brut lu par blocs : ni parseur DRF ni chargement en mémoire
+            document = receive_chunk(upload, offset, request.stream or io.BytesIO(), int(length) if length else None)
+        except UploadError as exc:
+            return self.error_response(exc)
+        if document is not None:
+            return Response(document_data(document), status=status.HTTP_201_CREATED)
+        return Response(upload_data(upload))
+
+    def destroy(self, request, pk=None):
+        abort_upload(self.get_object())
+        return Response(status=status.HTTP_204_NO_CONTENT)